@@ -53,45 +53,18 @@
 # In[5]:
 
 
-## import all necessary packages and functions.
-import csv # read and write csv files
-from datetime import datetime # operations to parse dates
-from pprint import pprint # use to print data structures like dictionaries in
-                          # a nicer way than the base print function.
+## import all necessary packages and functions. The functions used in this
+## analysis live in the bikeshare package next to this file.
+from bikeshare import (REPORT_CACHE, AggregateStore, ReportRunner,
+                       avg_durationbytype, condense_cities, duration_histogram,
+                       duration_in_mins, duration_of_trips, load_trip_table,
+                       number_of_trips, print_first_point, time_of_trip,
+                       trip_histograms, type_of_user)
 
 
 # In[6]:
 
 
-def print_first_point(filename):
-    """
-    This function prints and returns the first data point (second row) from
-    a csv file that includes a header row.
-    """
-    # print city name for reference
-    city = filename.split('-')[0].split('/')[-1]
-    print('\nCity: {}'.format(city))
-    
-    with open(filename, 'r') as f_in:
-        ## TODO: Use the csv library to set up a DictReader object. ##
-        ## see https://docs.python.org/3/library/csv.html           ##
-        trip_reader = csv.DictReader(f_in)
-        
-        ## TODO: Use a function on the DictReader object to read the     ##
-        ## first trip from the data file and store it in a variable.     ##
-        ## see https://docs.python.org/3/library/csv.html#reader-objects ##
-        for row in trip_reader: 
-            first_trip = row
-            break
-
-        
-        ## TODO: Use the pprint library to print the first trip. ##
-        ## see https://docs.python.org/3/library/pprint.html     ##
-        pprint(first_trip)
-        
-    # output city name and first trip for later testing
-    return (city, first_trip)
-
 # list of files for each city
 data_files = ['NYC-CitiBike-2016.csv',
               'Chicago-Divvy-2016.csv',
@@ -125,31 +98,6 @@ for data_file in data_files:
 # In[7]:
 
 
-def duration_in_mins(datum, city):
-   
-    """
-    Takes as input a dictionary containing info about a single trip (datum) and
-    its origin city (city) and returns the trip duration in units of minutes.
-    
-    Remember that Washington is in terms of milliseconds while Chicago and NYC
-    are in terms of seconds. 
-    
-    HINT: The csv module reads in all of the data as strings, including numeric
-    values. You will need a function to convert the strings into an appropriate
-    numeric type when making your transformations.
-    see https://docs.python.org/3/library/functions.html
-    """
-    
-    # YOUR CODE HERE
-    if city == "Washington":
-        duration_string = datum["Duration (ms)"]
-        duration = float(duration_string)/60000
-    else: 
-        duration_string = datum["tripduration"]
-        duration = float(duration_string)/60
-    return duration
-
-
 # Some tests to check that your code works. There should be no output if all of
 # the assertions pass. The `example_trips` dictionary was obtained from when
 # you printed the first trip from each of the original data files.
@@ -165,121 +113,7 @@ for city in tests:
 # In[8]:
 
 
-
-    
-    # YOUR CODE HERE
-    #function to return the name of the weekday based on number: 
-def dayNameFromWeekday(weekday):
-    if weekday == 0:
-        return "Monday"
-    if weekday == 1:
-        return "Tuesday"
-    if weekday == 2:
-        return "Wednesday"
-    if weekday == 3:
-        return "Thursday"
-    if weekday == 4:
-        return "Friday"
-    if weekday == 5:
-        return "Saturday"
-    if weekday == 6:
-        return "Sunday"
-
-def MonthNameFromNumber(month):
-    if month == 1:
-        return "January"
-    if month == 2:
-        return "February"
-    if month == 3:
-        return "March"
-    if month == 4:
-        return "April"
-    if month == 5:
-        return "May"
-    if month == 6:
-        return "June"
-    if month == 7:
-        return "July"
-    if month == 8: 
-        return "August"
-    if month == 9: 
-        return "September"
-    if month == 10: 
-        return "October"
-    if month == 11: 
-        return "November"
-    if month == 12: 
-        return "December"
-    
-def time_of_trip(datum, city):
-    """
-    Takes as input a dictionary containing info about a single trip (datum) and
-    its origin city (city) and returns the month, hour, and day of the week in
-    which the trip was made.
-    
-    Remember that NYC includes seconds, while Washington and Chicago do not.
-    
-    HINT: You should use the datetime module to parse the original date
-    strings into a format that is useful for extracting the desired information.
-    see https://docs.python.org/3/library/datetime.html#strftime-and-strptime-behavior
-    """
-    
-    #month, hour, day of the week
-    if city == "NYC":
-        whentrip_string = (datum["starttime"])
-        #splitting out the month and hour into a list to be able to call this into formatted date
-        split_list = whentrip_string.split("/")
-        month = int(split_list[0])
-        day = int(split_list[1])
-        #splitting out the next part of the string-next piece is year
-        year_list = split_list[2].split(" ")
-        year = int(year_list[0])
-        #splitting out the next part of the string-next piece is hour
-        time_list = year_list[1].split(":")
-        hour = int(time_list[0])
-        
-        
-    elif city == "Chicago": 
-        whentrip_string = (datum["starttime"])
-        #splitting out the month and hour into a list to be able to call this into formatted date
-        split_list = whentrip_string.split("/")
-        month = int(split_list[0])
-        day = int(split_list[1])
-        #splitting out the next part of the string-next piece is year
-        year_list = split_list[2].split(" ")
-        year = int(year_list[0])
-        #splitting out the next part of the string-next piece is hour
-        time_list = year_list[1].split(":")
-        hour = int(time_list[0])
-    
-    elif city == "Washington":
-        whentrip_string = (datum["Start date"])
-        #splitting out the month and hour into a list to be able to call this into formatted date
-        split_list = whentrip_string.split("/")
-        month = int(split_list[0])
-        day = int(split_list[1])
-        #splitting out the next part of the string-next piece is year
-        year_list = split_list[2].split(" ")
-        year = int(year_list[0])
-        #splitting out the next part of the string-next piece is hour
-        time_list = year_list[1].split(":")
-        hour = int(time_list[0])
-    
-    # section to convert the year, month, day, and hour to a day of the week
-    dt = datetime(year, month, day, hour)
-    weekday = dt.weekday()
-    
-    #return (month, hour, day_of_week)must add helper functions to convert integers back to strings
-    #Reported_month = MonthNameFromNumber(month)
-    Reported_month = month
-    Reported_hour = hour
-    Reported_dayoftheweek = dayNameFromWeekday(weekday)
-   
-    return (Reported_month, Reported_hour, Reported_dayoftheweek)
-    
- 
-
- # Some tests to check that your code works. There should be no output if all of
+# Some tests to check that your code works. There should be no output if all of
 # the assertions pass. The `example_trips` dictionary was obtained from when
 # you printed the first trip from each of the original data files.
 tests = {'NYC': (1, 0, 'Friday'),
@@ -294,30 +128,6 @@ for city in tests:
 # In[9]:
 
 
-def type_of_user(datum, city):
-    """
-    Takes as input a dictionary containing info about a single trip (datum) and
-    its origin city (city) and returns the type of system user that made the
-    trip.
-    
-    Remember that Washington has different category names compared to Chicago
-    and NYC. 
-    """
-    
-    # YOUR CODE HERE
-    if city == "Washington":
-        user_data = (datum["Member Type"])
-        if user_data == "Registered": 
-            user_type = "Subscriber"
-        else: 
-            user_type = "Customer"
-        
-    else: 
-        user_type = (datum["usertype"])
-        
-    return user_type
-
-
 # Some tests to check that your code works. There should be no output if all of
 # the assertions pass. The `example_trips` dictionary was obtained from when
 # you printed the first trip from each of the original data files.
@@ -329,60 +139,8 @@ for city in tests:
     assert type_of_user(example_trips[city], city) == tests[city]
 
 
-
 # **Question 3b**: Now, use the helper functions you wrote above to create a condensed data file for each city consisting only of the data fields indicated above. In the `/examples/` folder, you will see an example datafile from the [Bay Area Bike Share](http://www.bayareabikeshare.com/open-data) before and after conversion. Make sure that your output is formatted to be consistent with the example file.
 
-# In[12]:
-
-
-def condense_data(in_file, out_file, city):
-    """
-    This function takes full data from the specified input file
-    and writes the condensed data to a specified output file. The city
-    argument determines how the input file will be parsed.
-    
-    HINT: See the cell below to see how the arguments are structured!
-    """
-    
-    with open(out_file, 'w') as f_out, open(in_file, 'r') as f_in:
-        # set up csv DictWriter object - writer requires column names for the
-        # first row as the "fieldnames" argument
-        out_colnames = ['duration', 'month', 'hour', 'day_of_week', 'user_type']        
-        trip_writer = csv.DictWriter(f_out, fieldnames = out_colnames)
-        trip_writer.writeheader()
-        
-        ## TODO: set up csv DictReader object ##
-        trip_reader = csv.DictReader(f_in)
-       
-            
-        
-        
-        # collect data from and process each row
-        for row in trip_reader:
-            # set up a dictionary to hold the values for the cleaned and trimmed
-            # data point
-            current_trip = row
-            ret = time_of_trip(current_trip,city)
-            new_point = {'duration': (duration_in_mins(current_trip,city)), 'month': ret[0],
-                        'hour': ret[1], 'day_of_week': ret[2], 'user_type': (type_of_user(current_trip,city))}
-            
-
-            ## TODO: use the helper functions to get the cleaned data from  ##
-            ## the original data dictionaries.                              ##
-            ## Note that the keys for the new_point dictionary should match ##
-            ## the column names set in the DictWriter object above.         ##
-            
-            trip_writer.writerow(new_point)
-            ## TODO: write the processed information to the output file.     ##
-            ## see https://docs.python.org/3/library/csv.html#writer-objects ##
-         
-        
-
-   
-            
-            
-
-
 # In[13]:
 
 
@@ -394,8 +152,8 @@ city_info = {'Washington': {'in_file': 'Washington-CapitalBikeshare-2016.csv',
              'NYC': {'in_file': 'NYC-CitiBike-2016.csv',
                      'out_file': 'NYC-2016-Summary.csv'}}
 
+condense_cities(city_info, binary_out=True)
 for city, filenames in city_info.items():
-    condense_data(filenames['in_file'], filenames['out_file'], city)
     print_first_point(filenames['out_file'])
 
 
@@ -415,36 +173,6 @@ for city, filenames in city_info.items():
 # 
 # **Answer**: New York City had the greatest number of trips. New York had the highest proportion of trips made by subscribers. Washington had the highest proportion of trips made by short term customers. 
 
-# In[16]:
-
-
-def number_of_trips(filename):
-    """
-    This function reads in a file with trip data and reports the number of
-    trips made by subscribers, customers, and total overall.
-    """
-    with open(filename, 'r') as f_in:
-        # set up csv reader object
-        reader = csv.DictReader(f_in)
-        
-        # initialize count variables
-        n_subscribers = 0
-        n_customers = 0
-        
-        # tally up ride types
-        for row in reader:
-            if row['user_type'] == 'Subscriber':
-                n_subscribers += 1
-            else:
-                n_customers += 1
-        
-        # compute total number of rides
-        n_total = n_subscribers + n_customers
-        
-        # return tallies as a tuple
-        return(n_subscribers, n_customers, n_total)
-
-
 # In[18]:
 
 
@@ -456,11 +184,19 @@ data_file1 = 'Washington-2016-Summary.csv'
 data_file2 = 'Chicago-2016-Summary.csv'
 data_file3 = 'NYC-2016-Summary.csv'
 
-print(number_of_trips(data_file1))
-print(number_of_trips(data_file2))
-print(number_of_trips(data_file3))
-
+# every statistic below is read through the report runner, which keeps the
+# results in a cache on disk until the file changes. The summaries come from
+# the aggregate store, which only folds in rows added since the last run.
+trip_store = AggregateStore.load('trip_aggregates.json')
+report = ReportRunner(REPORT_CACHE, aggregates=trip_store)
+city_report = report.report([data_file1, data_file2, data_file3],
+                            (number_of_trips, duration_of_trips, avg_durationbytype))
+report.save()
+trip_store.save()
 
+print(city_report[data_file1]['number_of_trips'])
+print(city_report[data_file2]['number_of_trips'])
+print(city_report[data_file3]['number_of_trips'])
 
 
 # > **Tip**: In order to add additional cells to a notebook, you can use the "Insert Cell Above" and "Insert Cell Below" options from the menu bar above. There is also an icon in the toolbar for adding new cells, with additional icons for moving the cells up and down the document. By default, new cells are of the code type; you can also specify the cell type (e.g. Code or Markdown) of selected cells from the Cell menu or the dropdown in the toolbar.
@@ -485,50 +221,16 @@ print(number_of_trips(data_file3))
 ## and 3.5% of trips are longer than 30 minutes.                        ##
 
 
-
 # In[20]:
 
 
-def duration_of_trips(filename):
-    """
-    This function reads in a file with trip data and reports the number of
-    trips made by subscribers, customers, and total overall.
-    """
-    with open(filename, 'r') as f_in:
-        # set up csv reader object
-        reader = csv.DictReader(f_in)
-        
-        # initialize count variables
-        n_trips_lessthan30 = 0
-        n_tripsgreaterthan30 = 0
-        duration_sum = 0
-        
-        # tally up total duration (to be used in average calculation) and tally up trips less than 30 min and 
-        #greater than 30 min
-        for row in reader:
-            converted_duration = float(row['duration'])
-            duration_sum = duration_sum + converted_duration
-            if converted_duration <=  30:
-                n_trips_lessthan30 += 1
-            else:
-                n_tripsgreaterthan30 += 1
-        
-        # compute average trip duration
-        total_trips = n_trips_lessthan30 + n_tripsgreaterthan30
-        average_duration = duration_sum / total_trips
-        
-        # return tallies and average as a tuple
-        return(n_trips_lessthan30, n_tripsgreaterthan30, average_duration)
-    
-
 data_file1 = 'Washington-2016-Summary.csv'
 data_file2 = 'Chicago-2016-Summary.csv'
 data_file3 = 'NYC-2016-Summary.csv'
 
-print(duration_of_trips(data_file1))
-print(duration_of_trips(data_file2))
-print(duration_of_trips(data_file3))
-    
+print(city_report[data_file1]['duration_of_trips'])
+print(city_report[data_file2]['duration_of_trips'])
+print(city_report[data_file3]['duration_of_trips'])
 
 
 # **Question 4c**: Dig deeper into the question of trip duration based on ridership. Choose one city. Within that city, which type of user takes longer rides on average: Subscribers or Customers?
@@ -547,62 +249,14 @@ print(duration_of_trips(data_file3))
 ## trip duration to be 54.6 minutes. Do the other cities have this     ##
 ## level of difference?                                                ##
 
-def avg_durationbytype(filename):
-    """
-    This function reads in a file with trip data and reports the average duration of
-    the trips made by subscribers and customers. 
-    """
-    with open(filename, 'r') as f_in:
-        # set up csv reader object
-        reader = csv.DictReader(f_in)
-        
-        # initialize count variables
-        n_subscribers = 0
-        n_customers = 0
-        count = 0
-        total_subscriberduration = 0
-        total_customerduration = 0
-        
-        # tally up ride types, sum of duration of trips to be used in the calculation 
-        #of average
-        for row in reader:
-            count += 1
-            #print ("str duration: ", row["duration"])
-            converted_duration = float(row['duration'])
-            #print ("converted_duration: ", converted_duration)
-
-            if row['user_type'] == 'Subscriber':
-                n_subscribers += 1
-                total_subscriberduration = total_subscriberduration + converted_duration
-                #print ("total_subscriberduration: ", total_subscriberduration)
-            else:
-                n_customers += 1
-                total_customerduration = total_customerduration + converted_duration
-                #print ("total_customerduration: ", total_customerduration)
-
-        # TODO check for divide-by-zero
-        # compute the average duration of rides
-        #for subscribers: 
-        avg_durationsubscribers = total_subscriberduration / n_subscribers
-        #print ("avg_durationsubscribers: {0}, {1}, {2}".format(avg_durationsubscribers, 
-        #total_subscriberduration, n_subscribers))
-        
-        avg_durationcustomers = total_customerduration / n_customers
-        #print ("avg_durationcustomers: ", total_customerduration)
-        
-        return (n_subscribers, avg_durationsubscribers, n_customers, avg_durationcustomers)
-    
 
 data_file1 = 'Washington-2016-Summary.csv'
 data_file2 = 'Chicago-2016-Summary.csv'
 data_file3 = 'NYC-2016-Summary.csv'
 
-print(avg_durationbytype(data_file1))
-print(avg_durationbytype(data_file2))
-print(avg_durationbytype(data_file3))
-
-    
-    
+print(city_report[data_file1]['avg_durationbytype'])
+print(city_report[data_file2]['avg_durationbytype'])
+print(city_report[data_file3]['avg_durationbytype'])
 
 
 # <a id='visualizations'></a>
@@ -650,28 +304,14 @@ plt.show()
 # http://ipython.readthedocs.io/en/stable/interactive/magics.html
 #%matplotlib inline 
 
-# function to create a list based on reading a dictionary "Washington"
-
-def duration_plotdata(filename):
-    with open(filename, 'r') as f_in:
-        # set up csv reader object
-        reader = csv.DictReader(f_in)
-        list = []
-        for row in reader: 
-            converted_duration = float(row['duration'])
-            list.append(converted_duration)
-        return list
-
-
-data_to_plot = duration_plotdata('Washington-2016-Summary.csv')
-plt.hist(data_to_plot)
+# the trip durations are binned straight from the trip table, so no list of
+# every trip is built; each bin is drawn as one weighted sample
+bin_edges, bin_counts = duration_histogram(load_trip_table(data_file1))
+plt.hist(bin_edges[:-1], bins=bin_edges, weights=bin_counts.sum(axis=0))
 plt.title('Distribution of Trip Durations for Washington')
 plt.xlabel('Duration (m)')
 plt.show()
 
-   
-            
-
 
 # If you followed the use of the `.hist()` and `.show()` functions exactly like in the example, you're probably looking at a plot that's completely unexpected. The plot consists of one extremely tall bar on the left, maybe a very short second bar, and a whole lot of empty space in the center and right. Take a look at the duration values on the x-axis. This suggests that there are some highly infrequent outliers in the data. Instead of reprocessing the data, you will use additional parameters with the `.hist()` function to limit the range of data that is plotted. Documentation for the function can be found [[here]](https://matplotlib.org/devdocs/api/_as_gen/matplotlib.pyplot.hist.html#matplotlib.pyplot.hist).
 # 
@@ -687,39 +327,24 @@ plt.show()
 ## Then create a list of only the customer data
 ## Create if then so that only items with a duration of less than 75 minutes are added to the list
 
-def plot_function(filename):
-    with open(filename, 'r') as f_in:
-        # set up csv reader object
-        reader = csv.DictReader(f_in)
-        subscriber_list = []
-        customer_list = []
-        for row in reader: 
-            converted_duration = float(row['duration'])
-            if converted_duration < 75: 
-            #create conditional statement about which list the duration should go into
-                if row['user_type'] == 'Subscriber':
-                    subscriber_list.append(converted_duration)
-            
-                else: 
-                    customer_list.append(converted_duration)
-            
-               
-            
-        return subscriber_list, customer_list
-    #subscriber list is [0] from the function returned list
-    #customer list is [1] from the function returned list
-        
-        
+#subscriber list is [0] from the function returned list
+#customer list is [1] from the function returned list
+
 
 #data_file1 = './data/Washington-2016-Summary.csv'
 #prints the first three from each lists (2 lists are returned from the function)
-#print (plot_function(data_file1))
+#print (duration_plotdata_by_type(data_file1))
 #prints the first list returned from the function
-#print (plot_function(data_file1)[1])
+#print (duration_plotdata_by_type(data_file1)[1])
+
+#five-minute bins up to 75 minutes, row 0 subscribers and row 1 customers
+washington_histograms = report.run(trip_histograms, data_file1)
+report.save()
+bin_edges = washington_histograms['duration_edges']
 
 #Plot for subscribers: 
-data_to_plot1 = (plot_function('Washington-2016-Summary.csv')[0])
-plt.hist(data_to_plot1, bins = 15)
+data_to_plot1 = washington_histograms['durations'][0]
+plt.hist(bin_edges[:-1], bins=bin_edges, weights=data_to_plot1)
 plt.title('Distribution of Trip Durations for Washington Subscribers')
 plt.xlabel('Duration (m)')
 plt.ylabel('Number of Riders')
@@ -732,8 +357,8 @@ plt.show()
 
 
 #Plot for customers: 
-data_to_plot1 = (plot_function('Washington-2016-Summary.csv')[1])
-plt.hist(data_to_plot1, bins = 15)
+data_to_plot1 = washington_histograms['durations'][1]
+plt.hist(bin_edges[:-1], bins=bin_edges, weights=data_to_plot1)
 plt.title('Distribution of Trip Durations for Washington Customers')
 plt.xlabel('Duration (m)')
 plt.ylabel('Number of Riders')
@@ -745,11 +370,6 @@ plt.grid(True)
 plt.show()
 
 
-
-   
-
-
-
 # <a id='eda_continued'></a>
 # ## Performing Your Own Analysis
 # 
@@ -778,59 +398,34 @@ plt.show()
 ## Then create a list of only the customer data
 ## Create if then so that only items with a duration of less than 75 minutes are added to the list
 
-def plot_function(filename):
-    with open(filename, 'r') as f_in:
-        # set up csv reader object
-        reader = csv.DictReader(f_in)
-        subscriber_list_month = []
-        customer_list_month = []
-        for row in reader: 
-            month_of_trip = int(row['month']) 
-            #create conditional statement about which list the month should go into(subscriber or customer)
-            if row['user_type'] == 'Subscriber':
-                subscriber_list_month.append(month_of_trip)
-            else: 
-                customer_list_month.append(month_of_trip)
-        return sorted(subscriber_list_month), sorted(customer_list_month)
-            
-
 
 #Plot for subscribers in Washington: 
-data_to_plot1 = (plot_function('Washington-2016-Summary.csv')[0])
+data_to_plot1 = washington_histograms['month'][0]
 plt.figure(figsize=(5,5))
 plt.title('Distribution of Trip Months for Washington Subscribers')
 plt.xlabel('Month (m)')
 plt.ylabel('Number of Riders')
 plt.axis([-1,12,0,8000]) 
 bin_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec' ]
-possible_months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
-fin = [ possible_months.index(i) for i in data_to_plot1]
-plt.hist(fin, bins=range(13), align="left")
+plt.hist(range(12), bins=range(13), weights=data_to_plot1, align="left")
 plt.xticks(range(12), bin_labels)
 plt.grid(True)
 plt.show()
 
 #Plot for customers in Washington: 
-data_to_plot2 = (plot_function('Washington-2016-Summary.csv')[1])
+data_to_plot2 = washington_histograms['month'][1]
 plt.figure(figsize=(5,5))
 plt.title('Distribution of Trip Months for Washington Customers')
 plt.xlabel('Month (m)')
 plt.ylabel('Number of Riders')
 plt.axis([-1,12,0,2500]) 
 bin_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec' ]
-possible_months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
-fin = [ possible_months.index(i) for i in data_to_plot2]
-plt.hist(fin, bins=range(13), align="left")
+plt.hist(range(12), bins=range(13), weights=data_to_plot2, align="left")
 plt.xticks(range(12), bin_labels)
 plt.grid(True)
 plt.show()
 
 
-
-
-            
-
-
 # # <a id='conclusions'></a>
 # ## Conclusions
 # 
@@ -0,0 +1,291 @@
+"""
+Benchmarks for the ingest and analysis hot paths of the bikeshare package.
+
+Synthetic raw trip files are generated in each city's schema, then every
+stage is timed on its own in a fresh child process so that peak RSS is
+reported per stage. Results are written as JSON and can be compared against
+a stored baseline:
+
+    python benchmark.py --rows 100000 --output bench.json
+    python benchmark.py --rows 100000 --baseline bench.json
+
+Everything runs offline; the only input is the generated data.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bikeshare
+
+# raw column layouts of the three city feeds
+CITY_HEADERS = {
+    'NYC': ['tripduration', 'starttime', 'stoptime', 'start station id',
+            'start station name', 'start station latitude',
+            'start station longitude', 'end station id', 'end station name',
+            'end station latitude', 'end station longitude', 'bikeid',
+            'usertype', 'birth year', 'gender'],
+    'Chicago': ['trip_id', 'starttime', 'stoptime', 'bikeid', 'tripduration',
+                'from_station_id', 'from_station_name', 'to_station_id',
+                'to_station_name', 'usertype', 'gender', 'birthyear'],
+    'Washington': ['Duration (ms)', 'Start date', 'End date',
+                   'Start station number', 'Start station',
+                   'End station number', 'End station', 'Bike number',
+                   'Member Type'],
+}
+
+STAGES = ('condense', 'condense_bulk', 'time_of_trip', 'duration_in_mins', 'type_of_user',
+          'aggregate_trips', 'summaries')
+
+# the per-row helper stages work on rows held in memory, so they are capped
+HELPER_ROWS = 1000000
+
+# seconds between checks that a stage's child process is still running
+CHILD_POLL_SECONDS = 1.0
+
+
+def _timestamp(rng, seconds):
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    stamp = '{}/{}/2016 {}:{:02d}'.format(month, day, rng.randint(0, 23),
+                                          rng.randint(0, 59))
+    if seconds:
+        stamp += ':{:02d}'.format(rng.randint(0, 59))
+    return stamp
+
+
+def generate_raw_file(filename, city, n_rows, seed=2016):
+    """
+    Writes n_rows synthetic trips in the raw schema of city.
+    """
+    rng = random.Random(seed)
+    header = CITY_HEADERS[city]
+    with open(filename, 'w', newline='') as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(header)
+        for i in range(n_rows):
+            duration = int(rng.lognormvariate(6.6, 0.8))
+            start = _timestamp(rng, city == 'NYC')
+            if city == 'Washington':
+                writer.writerow([duration * 1000, start, start, 31000 + i % 400,
+                                 'Station {}'.format(i % 400), 31000 + i % 397,
+                                 'Station, {}'.format(i % 397), 'W{:05d}'.format(i % 4000),
+                                 'Registered' if rng.random() < 0.78 else 'Casual'])
+            elif city == 'NYC':
+                writer.writerow([duration, start, start, i % 600, 'Station {}'.format(i % 600),
+                                 40.7, -73.9, i % 597, 'Station {}'.format(i % 597),
+                                 40.7, -73.9, 15000 + i % 9000,
+                                 'Subscriber' if rng.random() < 0.89 else 'Customer',
+                                 1980, 1])
+            else:
+                writer.writerow([i, start, start, i % 5000, duration, i % 580,
+                                 'Station {}'.format(i % 580), i % 577,
+                                 'Station {}'.format(i % 577),
+                                 'Subscriber' if rng.random() < 0.76 else 'Customer',
+                                 'Male', 1980])
+
+
+def _read_rows(filename, limit):
+    with open(filename, 'r') as f_in:
+        reader = csv.DictReader(f_in)
+        return [row for _, row in zip(range(limit), reader)]
+
+
+def _run_stage(stage, city, raw_file, summary_file, trace, results):
+    """
+    Runs one stage in the current (child) process and sends back its timing,
+    or the error it failed with.
+    """
+    try:
+        result = _time_stage(stage, city, raw_file, summary_file, trace)
+    except BaseException as e:
+        result = _failed(stage, city, '{}: {}'.format(type(e).__name__, e))
+    results.put(result)
+
+
+def _failed(stage, city, error):
+    return {'stage': stage, 'city': city, 'rows': None, 'seconds': None,
+            'rows_per_sec': None, 'peak_rss_kb': None, 'peak_alloc_bytes': None,
+            'error': error}
+
+
+def _time_stage(stage, city, raw_file, summary_file, trace):
+    rows = None
+    if stage in ('time_of_trip', 'duration_in_mins', 'type_of_user'):
+        rows = _read_rows(raw_file, HELPER_ROWS)
+    elif stage == 'summaries':
+        # build (or map) the trip table first, so the stage times the summaries
+        bikeshare.load_trip_table(summary_file)
+
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    if stage in ('condense', 'condense_bulk'):
+        bikeshare.condense_data(raw_file, summary_file, city,
+                                engine='bulk' if stage == 'condense_bulk' else 'rows')
+        with open(summary_file, 'r') as f_in:
+            n_rows = sum(1 for _ in f_in) - 1
+    elif rows is not None:
+        helper = getattr(bikeshare, stage)
+        for row in rows:
+            helper(row, city)
+        n_rows = len(rows)
+    elif stage == 'aggregate_trips':
+        result = bikeshare.aggregate_trips(summary_file, bikeshare.TRIP_STATISTICS)
+        n_rows = sum(result['user_counts'])
+    else:
+        # what the report cells do once the trip table is loaded
+        n_rows = bikeshare.number_of_trips(summary_file)[2]
+        bikeshare.duration_of_trips(summary_file)
+        bikeshare.avg_durationbytype(summary_file)
+    seconds = time.perf_counter() - started
+    peak_alloc = None
+    if trace:
+        peak_alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'stage': stage, 'city': city, 'rows': n_rows, 'seconds': seconds,
+            'rows_per_sec': n_rows / seconds if seconds else None,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'peak_alloc_bytes': peak_alloc, 'error': None}
+
+
+def run_benchmarks(n_rows, cities, stages, workdir, trace=False):
+    """
+    Generates the input files in workdir and times each stage for each city.
+    The condense stage has to run before the stages that read its output. A
+    stage that fails is reported with its error instead of a timing.
+    """
+    context = multiprocessing.get_context('fork')
+    results = []
+    for city in cities:
+        raw_file = os.path.join(workdir, '{}-raw.csv'.format(city))
+        summary_file = os.path.join(workdir, '{}-2016-Summary.csv'.format(city))
+        if not os.path.exists(raw_file):
+            generate_raw_file(raw_file, city, n_rows)
+        for stage in stages:
+            if not stage.startswith('condense') and not os.path.exists(summary_file):
+                result = _run_stage_in_child(context, 'condense', city, raw_file,
+                                             summary_file, False)
+                if result['error'] is not None:
+                    result = _failed(stage, city, 'condense: ' + result['error'])
+                    results.append(result)
+                    print('{:<18} {:<11} FAILED {}'.format(stage, city, result['error']))
+                    continue
+            result = _run_stage_in_child(context, stage, city, raw_file,
+                                         summary_file, trace)
+            results.append(result)
+            if result['error'] is not None:
+                print('{:<18} {:<11} FAILED {}'.format(stage, city, result['error']))
+                continue
+            print('{:<18} {:<11} {:>12,.0f} rows/s {:>9.3f}s {:>9,} KB'.format(
+                stage, city, result['rows_per_sec'] or 0, result['seconds'],
+                result['peak_rss_kb']))
+    return results
+
+
+def _run_stage_in_child(context, stage, city, raw_file, summary_file, trace):
+    """
+    Runs one stage in a child process and returns its result. A child that
+    dies without sending one (e.g. killed for running out of memory) is
+    reported as a failed stage rather than waited on forever.
+    """
+    results = context.Queue()
+    child = context.Process(target=_run_stage,
+                            args=(stage, city, raw_file, summary_file, trace, results))
+    child.start()
+    while True:
+        try:
+            result = results.get(timeout=CHILD_POLL_SECONDS)
+            break
+        except queue.Empty:
+            if child.is_alive():
+                continue
+        # the child has exited; its result may still be in flight
+        try:
+            result = results.get(timeout=CHILD_POLL_SECONDS)
+        except queue.Empty:
+            result = _failed(stage, city, 'child exited with code {}'.format(
+                child.exitcode))
+        break
+    child.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the (stage, city, baseline rows/sec, current rows/sec) of every
+    stage that got slower than the baseline by more than tolerance.
+    """
+    previous = {(r['stage'], r['city']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['stage'], result['city']))
+        if before is None or not before['rows_per_sec'] or not result['rows_per_sec']:
+            continue
+        if result['rows_per_sec'] < before['rows_per_sec'] * (1 - tolerance):
+            regressions.append((result['stage'], result['city'],
+                                before['rows_per_sec'], result['rows_per_sec']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=float, default=1e5,
+                        help='rows per synthetic city file (1e5 to 1e8)')
+    parser.add_argument('--cities', nargs='+', default=sorted(CITY_HEADERS),
+                        choices=sorted(CITY_HEADERS))
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES)
+    parser.add_argument('--workdir', help='where to keep the generated files '
+                        '(reused between runs; default: a temporary directory)')
+    parser.add_argument('--trace-allocations', action='store_true',
+                        help='also record peak traced allocations (slower)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='allowed slowdown against the baseline (default 0.10)')
+    args = parser.parse_args(argv)
+
+    n_rows = int(args.rows)
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        workdir = args.workdir
+        results = run_benchmarks(n_rows, args.cities, args.stages, workdir,
+                                 args.trace_allocations)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_benchmarks(n_rows, args.cities, args.stages, workdir,
+                                     args.trace_allocations)
+
+    report = {'meta': {'rows': n_rows, 'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'cpus': os.cpu_count(), 'time': time.time()},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f_out:
+            json.dump(report, f_out, indent=2)
+
+    failed = any(result['error'] is not None for result in results)
+    if args.baseline:
+        with open(args.baseline, 'r') as f_in:
+            baseline = json.load(f_in)
+        regressions = compare(results, baseline, args.tolerance)
+        for stage, city, before, after in regressions:
+            print('REGRESSION {} {}: {:,.0f} -> {:,.0f} rows/s'.format(
+                stage, city, before, after))
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Bike share trip analysis: condensing the city feeds and summarizing trips.
+
+Names are imported from their submodules on first use, so importing the
+package (or e.g. just condense_data and number_of_trips) does not load NumPy
+or matplotlib.
+"""
+import importlib
+
+# public name -> submodule that defines it
+_EXPORTS = {}
+for _module, _names in (
+        ('trips', ('DAY_NAMES', 'MONTH_NAMES', 'USER_TYPES', 'MonthNameFromNumber',
+                   'city_of', 'dayNameFromWeekday', 'duration_in_mins',
+                   'parse_start_time', 'parse_start_times', 'print_first_point',
+                   'time_of_trip', 'type_of_user')),
+        ('schemas', ('CITY_SCHEMAS', 'CitySchema', 'city_schema',
+                     'compile_batch_converter', 'compile_row_converter',
+                     'register_city')),
+        ('compressed', ('detect_codec', 'open_input')),
+        ('lines', ('file_stamp',)),
+        ('condense', ('CONDENSED_COLUMNS', 'CONDENSE_ENGINES', 'condense_cities',
+                      'condense_data', 'condense_incremental')),
+        ('stats', ('COUNT_STATISTICS', 'CUBE_STATISTICS', 'REPORT_STATISTICS',
+                   'TABLE_STATISTICS', 'TRIP_STATISTICS', 'aggregate_trips', 'avg_durationbytype',
+                   'duration_of_trips', 'duration_plotdata',
+                   'duration_plotdata_by_type', 'duration_quantiles',
+                   'month_plotdata_by_type', 'number_of_trips', 'trips_longer_than')),
+        ('sketch', ('QuantileSketch',)),
+        ('encoding', ('export_csv', 'read_fieldnames')),
+        ('cache', ('read_trip_cache', 'trip_cache_file', 'write_trip_cache')),
+        ('table', ('TripTable', 'aggregate_table', 'load_trip_table')),
+        ('histograms', ('category_histogram', 'duration_histogram',
+                        'trip_histograms')),
+        ('cube', ('TripCube', 'build_cube', 'cube_file', 'load_cube', 'read_cube',
+                  'write_cube')),
+        ('ingest', ('discover_shards', 'ingest', 'ingest_async', 'merge_shards')),
+        ('instrument', ('CondenseMetrics', 'run_profiled', 'write_metrics_json',
+                        'write_prometheus')),
+        ('approx', ('ApproximateScan', 'Estimate', 'approx_avg_durationbytype',
+                    'approx_number_of_trips')),
+        ('partition', ('condense_partitioned', 'drop_months', 'manifest_aggregates',
+                       'partition_files', 'partition_table', 'read_manifest')),
+        ('query', ('block_stats', 'query_trips')),
+        ('report', ('REPORT_CACHE', 'ReportRunner')),
+        ('sniff', ('FileSchema', 'sample_rows', 'sniff_schema')),
+        ('store', ('AggregateStore', 'TripPartial')),
+        ('zonemap', ('read_zone_map', 'scan_ranges', 'scan_rows', 'zone_map_file')),
+        ('cli', ('main',))):
+    for _name in _names:
+        _EXPORTS[_name] = _module
+del _module, _names, _name
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
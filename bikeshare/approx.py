@@ -0,0 +1,333 @@
+"""
+Approximate number_of_trips and avg_durationbytype from sampled blocks.
+
+    python -m bikeshare.approx NYC-2016-Summary.csv --error 0.01 --time 0.5
+
+An ApproximateScan reads whole blocks of a condensed file in random order and
+estimates the statistics from the blocks read so far, with confidence
+intervals. The blocks are those of the file's zone map, stratified by month
+(by the first month in each block), or without a zone map, line-aligned byte
+ranges in a single stratum. Every stratum's totals are ratio estimates
+against a size known for every block (its rows, or its bytes), so the memory
+used is a few numbers per block read, however large the file is. Reading
+stops at an error budget (the largest relative half-width of the intervals)
+or a time budget, and can be resumed to refine the estimates; once every
+block has been read they are exact.
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from statistics import NormalDist
+
+from .encoding import read_fieldnames, stored_value
+from .zonemap import read_zone_map
+
+# size of the sampled byte ranges of a file without a zone map
+APPROX_BLOCK_BYTES = 256 * 1024
+
+# largest relative half-width of the confidence intervals accepted by default
+APPROX_MAX_ERROR = 0.02
+
+# blocks read from each stratum before any budget is checked
+APPROX_MIN_BLOCKS = 2
+
+# an estimate and the bounds of its confidence interval
+Estimate = namedtuple('Estimate', ['value', 'low', 'high'])
+
+# what is kept of a block read: Subscriber and Customer trips and duration
+# sums, and the block's size (rows, or bytes without a zone map)
+_BlockTotals = namedtuple('_BlockTotals', ['subscribers', 'customers', 'subscriber_sum',
+                                           'customer_sum', 'size'])
+
+
+def _t_quantile(z, df):
+    """
+    Returns the Student t quantile with df degrees of freedom that matches
+    the standard normal quantile z (Cornish-Fisher expansion).
+    """
+    z3, z5, z7 = z ** 3, z ** 5, z ** 7
+    return (z + (z3 + z) / (4 * df) + (5 * z5 + 16 * z3 + 3 * z) / (96 * df ** 2) +
+            (3 * z7 + 19 * z5 + 17 * z3 - 15 * z) / (384 * df ** 3))
+
+
+def _stratum_total(samples, values, size_total, n_blocks):
+    """
+    Returns the ratio estimate of a stratum's total of values (one per
+    sampled block) against the block sizes, whose total over the stratum's
+    n_blocks blocks is size_total, and its variance.
+    """
+    n_sampled = len(samples)
+    sampled_size = sum(block.size for block in samples)
+    if not sampled_size:
+        return 0.0, 0.0
+    ratio = sum(values) / sampled_size
+    if n_sampled >= n_blocks or n_sampled < 2:
+        return ratio * size_total, 0.0
+    residuals = [value - ratio * block.size for value, block in zip(values, samples)]
+    spread = sum(residual * residual for residual in residuals) / (n_sampled - 1)
+    variance = n_blocks * n_blocks * (1 - n_sampled / n_blocks) * spread / n_sampled
+    return ratio * size_total, variance
+
+
+class ApproximateScan(object):
+    """
+    Progressive estimate of number_of_trips and avg_durationbytype over a
+    condensed file, from a stratified random sample of its blocks (see the
+    module docstring). refine() reads more blocks; number_of_trips() and
+    avg_durationbytype() return the current estimates as Estimate tuples at
+    the given confidence level.
+    """
+
+    def __init__(self, filename, confidence=0.95, seed=None,
+                 block_bytes=APPROX_BLOCK_BYTES):
+        if os.path.isdir(filename):
+            raise ValueError('a partitioned city directory is answered exactly from '
+                             'its manifest: {}'.format(filename))
+        self.filename = filename
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.blocks_read = 0
+        self.rows_read = 0
+        self.seconds = 0.0
+
+        names, dictionaries = read_fieldnames(filename)
+        if not names:
+            raise ValueError('empty file: {}'.format(filename))
+        self._duration = names.index('duration')
+        self._user_type = names.index('user_type')
+        self._subscriber = stored_value(dictionaries, 'user_type', 'Subscriber')
+
+        # stratum -> [(start, end, size or None), ...] of its blocks
+        self._strata = {}
+        size = os.path.getsize(filename)
+        blocks = read_zone_map(filename)
+        if blocks is not None:
+            self._aligned = True
+            for i, block in enumerate(blocks):
+                end = blocks[i + 1]['offset'] if i + 1 < len(blocks) else size
+                self._strata.setdefault(block['month'][0], []).append(
+                    (block['offset'], end, block['rows']))
+        else:
+            self._aligned = False
+            with open(filename, 'rb') as f_in:
+                data_start = len(f_in.readline())
+            self._strata[None] = [(start, min(start + block_bytes, size), None)
+                                  for start in range(data_start, size, block_bytes)]
+        self.blocks_total = sum(len(ranges) for ranges in self._strata.values())
+
+        rng = random.Random(seed)
+        self._pending = {}
+        self._size_totals = {}
+        for stratum, ranges in self._strata.items():
+            self._pending[stratum] = rng.sample(ranges, len(ranges))
+            self._size_totals[stratum] = sum(
+                block_size if block_size is not None else end - start
+                for start, end, block_size in ranges)
+        self._samples = {stratum: [] for stratum in self._strata}
+        self._minimum_blocks = sum(min(APPROX_MIN_BLOCKS, len(ranges))
+                                   for ranges in self._strata.values())
+
+    @property
+    def exact(self):
+        return self.blocks_read == self.blocks_total
+
+    def _read_block(self, f_in, start, end):
+        """
+        Returns the _BlockTotals of the lines in a block. A byte range that is
+        not line-aligned holds the lines that start in it.
+        """
+        if self._aligned or start == 0:
+            f_in.seek(start)
+        else:
+            f_in.seek(start - 1)
+            f_in.readline()
+        position = f_in.tell()
+        data = f_in.read(max(end - position, 0))
+        if data and not data.endswith(b'\n') and not self._aligned:
+            data += f_in.readline()
+        counts = [0, 0]
+        sums = [0.0, 0.0]
+        duration, user_type, subscriber = self._duration, self._user_type, self._subscriber
+        rows = 0
+        for row in csv.reader(data.decode('utf-8').splitlines()):
+            if not row:
+                continue
+            rows += 1
+            kind = 0 if row[user_type] == subscriber else 1
+            counts[kind] += 1
+            sums[kind] += float(row[duration])
+        self.rows_read += rows
+        return _BlockTotals(counts[0], counts[1], sums[0], sums[1],
+                            rows if self._aligned else len(data))
+
+    def _targets(self, n_blocks):
+        """
+        Returns the number of blocks each stratum should have been sampled
+        for n_blocks in all, allocated in proportion to the strata's sizes.
+        """
+        targets = {}
+        for stratum, ranges in self._strata.items():
+            share = math.ceil(n_blocks * len(ranges) / self.blocks_total)
+            targets[stratum] = min(len(ranges), max(share, APPROX_MIN_BLOCKS))
+        return targets
+
+    def refine(self, max_error=None, time_budget=None):
+        """
+        Reads blocks in rounds that double the number read so far, and yields
+        the scan after each round, until the largest relative error is at most
+        max_error, time_budget seconds have passed in this call, or every
+        block has been read. The first round always reads APPROX_MIN_BLOCKS
+        blocks of every stratum (or all of its blocks if it has fewer).
+        """
+        started = time.perf_counter()
+        seconds = self.seconds
+        with open(self.filename, 'rb') as f_in:
+            while not self.exact:
+                n_blocks = 2 * self.blocks_read
+                targets = self._targets(n_blocks)
+                while sum(targets.values()) == self.blocks_read:
+                    n_blocks *= 2
+                    targets = self._targets(n_blocks)
+                out_of_time = False
+                for stratum, target in targets.items():
+                    samples = self._samples[stratum]
+                    while len(samples) < target and not out_of_time:
+                        start, end, _ = self._pending[stratum].pop()
+                        samples.append(self._read_block(f_in, start, end))
+                        self.blocks_read += 1
+                        # the first round is read whole, for the intervals
+                        out_of_time = (time_budget is not None and
+                                       self.blocks_read >= self._minimum_blocks and
+                                       time.perf_counter() - started > time_budget)
+                self.seconds = seconds + time.perf_counter() - started
+                yield self
+                if out_of_time or (max_error is not None and
+                                   self.relative_error() <= max_error):
+                    break
+
+    def _total(self, value):
+        """
+        Returns the estimated total over the file of value(block totals),
+        and its variance.
+        """
+        total = variance = 0.0
+        for stratum, samples in self._samples.items():
+            estimate, stratum_variance = _stratum_total(
+                samples, [value(block) for block in samples],
+                self._size_totals[stratum], len(self._strata[stratum]))
+            total += estimate
+            variance += stratum_variance
+        return total, variance
+
+    def _estimate(self, value, variance):
+        # few blocks give a poor variance, so the interval is a t interval
+        df = max(self.blocks_read - len(self._strata), 1)
+        half_width = _t_quantile(self.z, df) * math.sqrt(variance)
+        return Estimate(value, value - half_width, value + half_width)
+
+    def _mean(self, count, duration_sum):
+        """
+        Returns the Estimate of a mean duration from the estimated totals of
+        a trip count and a duration sum, linearizing their ratio.
+        """
+        n_trips = self._total(count)[0]
+        if not n_trips:
+            return Estimate(float('nan'), float('nan'), float('nan'))
+        mean = self._total(duration_sum)[0] / n_trips
+        variance = self._total(lambda block: duration_sum(block) - mean * count(block))[1]
+        return self._estimate(mean, variance / (n_trips * n_trips))
+
+    def number_of_trips(self):
+        """
+        Returns the Estimates of the numbers of subscriber, customer and all
+        trips, like number_of_trips returns their counts.
+        """
+        subscribers = self._estimate(*self._total(lambda block: block.subscribers))
+        customers = self._estimate(*self._total(lambda block: block.customers))
+        total = self._estimate(*self._total(
+            lambda block: block.subscribers + block.customers))
+        return subscribers, customers, total
+
+    def avg_durationbytype(self):
+        """
+        Returns the Estimates of the numbers of subscriber and customer trips
+        and of their average durations, like avg_durationbytype.
+        """
+        subscribers, customers, _ = self.number_of_trips()
+        return (subscribers,
+                self._mean(lambda block: block.subscribers,
+                           lambda block: block.subscriber_sum),
+                customers,
+                self._mean(lambda block: block.customers,
+                           lambda block: block.customer_sum))
+
+    def relative_error(self):
+        """
+        Returns the largest half-width of the confidence intervals of the
+        estimates relative to the estimate (0 once the scan is exact).
+        """
+        error = 0.0
+        for estimate in self.avg_durationbytype():
+            half_width = (estimate.high - estimate.low) / 2
+            if half_width:
+                error = max(error, half_width / abs(estimate.value)
+                            if estimate.value else float('inf'))
+        return error
+
+
+def _run(filename, max_error, time_budget, confidence, seed):
+    scan = ApproximateScan(filename, confidence, seed)
+    for _ in scan.refine(max_error, time_budget):
+        pass
+    return scan
+
+
+def approx_number_of_trips(filename, max_error=APPROX_MAX_ERROR, time_budget=None,
+                           confidence=0.95, seed=None):
+    """
+    Returns Estimates of the numbers of subscriber, customer and all trips
+    from sampled blocks of a condensed file, read until the error budget
+    max_error or the time_budget (seconds) is reached (see ApproximateScan).
+    """
+    return _run(filename, max_error, time_budget, confidence, seed).number_of_trips()
+
+
+def approx_avg_durationbytype(filename, max_error=APPROX_MAX_ERROR, time_budget=None,
+                              confidence=0.95, seed=None):
+    """
+    Returns Estimates of avg_durationbytype's trip counts and average
+    durations from sampled blocks of a condensed file (see
+    approx_number_of_trips).
+    """
+    return _run(filename, max_error, time_budget, confidence, seed).avg_durationbytype()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='+', help='condensed trip files')
+    parser.add_argument('--error', type=float, default=APPROX_MAX_ERROR,
+                        help='largest relative half-width of the intervals')
+    parser.add_argument('--time', type=float, help='time budget in seconds')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, help='seed of the block sampling')
+    args = parser.parse_args(argv)
+
+    for filename in args.files:
+        scan = ApproximateScan(filename, args.confidence, args.seed)
+        for _ in scan.refine(args.error, args.time):
+            print('{}: {}/{} blocks, {:,} rows, error {:.2%}'.format(
+                filename, scan.blocks_read, scan.blocks_total, scan.rows_read,
+                scan.relative_error()))
+        for name, estimate in zip(('Subscriber trips', 'Subscriber average duration',
+                                   'Customer trips', 'Customer average duration'),
+                                  scan.avg_durationbytype()):
+            print('    {}: {:,.2f} [{:,.2f}, {:,.2f}]'.format(name, *estimate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
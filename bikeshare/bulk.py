@@ -0,0 +1,294 @@
+"""
+Vectorized bulk condense engine: raw csv blocks converted as NumPy arrays.
+
+Raw input is read in large blocks of whole lines, whose columns are cut
+straight out of the bytes: quoted fields are collapsed to a placeholder, the
+positions of the commas and newlines are found with one NumPy pass, and each
+wanted field becomes a row of a fixed-width byte matrix. Durations, start
+times and user types are then converted for the whole block at once. Any
+block the fast parsers cannot fully account for (quoted wanted fields, ragged
+rows, non-integer durations, other timestamp layouts) goes through the csv
+module, or the city's row converter, instead, so the condensed values are
+exactly those of condense_data.
+"""
+import csv
+import re
+import time
+
+import numpy as np
+
+from .schemas import FAST_TIMESTAMP_FORMATS, city_schema, compile_row_converter
+from .trips import DAY_NAMES
+
+# bytes of raw input converted per block
+BULK_BLOCK_BYTES = 8 * 1024 * 1024
+
+_COMMA, _NEWLINE, _SLASH, _SPACE, _COLON, _ZERO = b',\n/ :0'
+
+# quoted fields (station names with commas, ...) are cut out of a block as a
+# single placeholder byte before its columns are split
+_QUOTED_FIELD = re.compile(b'"[^"]*"')
+_PLACEHOLDER = b'\x01'
+
+_DAY_NAME_LOOKUP = np.array(DAY_NAMES, dtype=object)
+
+
+def _field_matrix(data, starts, ends):
+    """
+    Returns the fields data[start:end] as a zero-padded (n, width) uint8 matrix.
+    """
+    lengths = ends - starts
+    width = int(lengths.max()) if len(lengths) else 0
+    if width == 0:
+        return np.zeros((len(starts), 1), dtype=np.uint8)
+    offsets = np.arange(width)
+    index = np.minimum(starts[:, None] + offsets, len(data) - 1)
+    matrix = data[index]
+    matrix[offsets >= lengths[:, None]] = 0
+    return matrix
+
+
+def _bytes_matrix(values):
+    """
+    Returns a sequence of str fields as a zero-padded uint8 matrix.
+    """
+    try:
+        encoded = np.array(values, dtype=np.bytes_)
+    except UnicodeEncodeError:
+        encoded = np.array([value.encode('utf-8') for value in values])
+    if encoded.dtype.itemsize == 0:
+        return np.zeros((len(values), 1), dtype=np.uint8)
+    return encoded.view(np.uint8).reshape(len(values), encoded.dtype.itemsize)
+
+
+def _split_columns(data, n_columns, columns):
+    """
+    Cuts the given columns out of a block of unquoted csv lines (a uint8
+    array ending in a newline). Returns one field matrix per column, or None
+    if some line does not have exactly n_columns fields.
+    """
+    delimiters = np.flatnonzero((data == _COMMA) | (data == _NEWLINE))
+    if len(delimiters) % n_columns:
+        return None
+    delimiters = delimiters.reshape(-1, n_columns)
+    if (not (data[delimiters[:, -1]] == _NEWLINE).all() or
+            not (data[delimiters[:, :-1]] == _COMMA).all()):
+        return None
+    line_starts = np.empty(len(delimiters), dtype=np.intp)
+    line_starts[0] = 0
+    line_starts[1:] = delimiters[:-1, -1] + 1
+    matrices = []
+    for column in columns:
+        starts = line_starts if column == 0 else delimiters[:, column - 1] + 1
+        matrices.append(_field_matrix(data, starts, delimiters[:, column]))
+    return matrices
+
+
+def _parse_integers(matrix):
+    """
+    Returns the values of a matrix of unsigned decimal integer fields as
+    int64, or None if any field is empty, is not all digits or is too long.
+    """
+    digits = matrix.astype(np.int64) - _ZERO
+    present = matrix != 0
+    lengths = present.sum(axis=1)
+    if (not len(matrix) or lengths.min() == 0 or matrix.shape[1] > 15 or
+            ((digits < 0) | (digits > 9))[present].any() or
+            not (present == (np.arange(matrix.shape[1]) < lengths[:, None])).all()):
+        return None
+    # padding positions get exponent 0, their digits are zeroed anyway
+    exponents = np.maximum(lengths[:, None] - 1 - np.arange(matrix.shape[1]), 0)
+    return (np.where(present, digits, 0) * 10 ** exponents).sum(axis=1)
+
+
+def _number_before(matrix, rows, position, separator, max_digits):
+    """
+    Reads the 1..max_digits digit number that starts at position (per row)
+    and ends at separator. Returns the numbers and the positions after the
+    separators, or None if some row does not look like that.
+    """
+    value = np.zeros(len(rows), dtype=np.int64)
+    done = np.zeros(len(rows), dtype=bool)
+    width = matrix.shape[1]
+    for i in range(max_digits + 1):
+        at = np.minimum(position + i, width - 1)
+        char = matrix[rows, at]
+        ends = ~done & (char == separator) & (position + i < width)
+        if i == 0 and ends.any():
+            return None
+        position = np.where(ends, position + i + 1, position)
+        done |= ends
+        if done.all():
+            break
+        if i == max_digits:
+            return None
+        digit = char.astype(np.int64) - _ZERO
+        if (((digit < 0) | (digit > 9)) & ~done).any():
+            return None
+        value = np.where(done, value, value * 10 + digit)
+    if not done.all():
+        return None
+    return value, position
+
+
+def _parse_start_times(matrix):
+    """
+    Parses a matrix of "M/D/YYYY H:MM[:SS]" start times like
+    parse_start_times does, into month, hour and day-of-week code arrays.
+    Returns None unless every field has that layout and a valid date.
+    """
+    n_rows = len(matrix)
+    rows = np.arange(n_rows)
+    parsed = _number_before(matrix, rows, np.zeros(n_rows, dtype=np.intp), _SLASH, 2)
+    if parsed is None:
+        return None
+    month, position = parsed
+    parsed = _number_before(matrix, rows, position, _SLASH, 2)
+    if parsed is None:
+        return None
+    day, position = parsed
+    parsed = _number_before(matrix, rows, position, _SPACE, 4)
+    if parsed is None:
+        return None
+    year, position_after = parsed
+    if not (position_after - position == 5).all():
+        return None
+    parsed = _number_before(matrix, rows, position_after, _COLON, 2)
+    if parsed is None:
+        return None
+    hour = parsed[0]
+
+    if ((month < 1) | (month > 12) | (day < 1)).any():
+        return None
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + (day - 1)
+    if (dates.astype('datetime64[M]') != months).any():
+        # a day past the end of its month: leave the error to the row path
+        return None
+    # 1970-01-01 was a Thursday (day of week 3, counting from Monday)
+    days = (dates.astype(np.int64) + 3) % 7
+    return month, hour, days
+
+
+def _map_user_types(matrix, schema):
+    """
+    Maps a matrix of raw user type fields to condensed user types, the way
+    the schema's row converter does: each distinct value is mapped once.
+    """
+    values, inverse = np.unique(
+        np.ascontiguousarray(matrix).view('V{}'.format(matrix.shape[1])).ravel(),
+        return_inverse=True)
+    names = [bytes(value).rstrip(b'\x00').decode('utf-8') for value in values]
+    if schema.user_types is not None:
+        names = [schema.user_types.get(name, schema.default_user_type) for name in names]
+    return np.array(names, dtype=object)[inverse.ravel()]
+
+
+def _lines(block):
+    # blank lines are skipped, as condense_batches does; that includes the
+    # empty item after the newline the block ends in
+    return [line for line in block.decode('utf-8').split('\n') if line]
+
+
+def _convert_rows(block, convert):
+    rows = [convert(row) for row in csv.reader(_lines(block))]
+    return [list(column) for column in zip(*rows)] if rows else [[], [], [], [], []]
+
+
+def bulk_batches(f_in, header, city, limit=None, block_bytes=BULK_BLOCK_BYTES,
+                 metrics=None):
+    """
+    Yields the condensed columns of the raw csv lines read from the binary
+    stream f_in (positioned after the header, whose fields are given), as the
+    same five lists condense_batches yields, one block of about block_bytes
+    at a time. With limit, only that many bytes are read.
+
+    With metrics (a CondenseMetrics), the time spent reading each block
+    ('read') and converting each column is recorded.
+    """
+    schema = city_schema(city)
+    columns = [header.index(schema.duration_column), header.index(schema.start_column),
+               header.index(schema.user_type_column)]
+    convert = compile_row_converter(schema, header)
+    fast_timestamps = schema.timestamp_format in FAST_TIMESTAMP_FORMATS
+    clock = time.perf_counter
+    remaining = limit
+    carry = b''
+
+    while True:
+        started = clock()
+        size = block_bytes if remaining is None else min(block_bytes, remaining)
+        chunk = f_in.read(size) if size else b''
+        if remaining is not None:
+            remaining -= len(chunk)
+        block = carry + chunk
+        if chunk:
+            cut = block.rfind(b'\n') + 1
+            if not cut:
+                carry = block
+                continue
+            block, carry = block[:cut], block[cut:]
+        else:
+            carry = b''
+            if not block:
+                return
+        if b'\r' in block:
+            # as the text mode reader does with universal newlines
+            block = block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        if not block.endswith(b'\n'):
+            block += b'\n'
+        if metrics is not None:
+            metrics.record('read', clock() - started, 0)
+
+        batch = _convert_block(block, header, columns, convert, schema, fast_timestamps,
+                               metrics)
+        if batch[0]:
+            yield batch
+
+
+def _convert_block(block, header, columns, convert, schema, fast_timestamps, metrics):
+    """
+    Converts one block of whole raw lines (see bulk_batches).
+    """
+    clock = time.perf_counter
+    started = clock()
+    matrices = None
+    if fast_timestamps and b'\n\n' not in block and not block.startswith(b'\n'):
+        unquoted = _QUOTED_FIELD.sub(_PLACEHOLDER, block) if b'"' in block else block
+        if b'"' not in unquoted:
+            matrices = _split_columns(np.frombuffer(unquoted, dtype=np.uint8),
+                                      len(header), columns)
+        if (matrices is not None and unquoted is not block and
+                any((matrix == _PLACEHOLDER[0]).any() for matrix in matrices)):
+            # a wanted field was quoted
+            matrices = None
+    if matrices is None and fast_timestamps:
+        rows = list(csv.reader(_lines(block)))
+        if set(map(len, rows)) == {len(header)}:
+            fields = list(zip(*rows))
+            matrices = [_bytes_matrix(fields[column]) for column in columns]
+    if matrices is None:
+        return _convert_rows(block, convert)
+
+    split = clock()
+    durations = _parse_integers(matrices[0])
+    if durations is None:
+        return _convert_rows(block, convert)
+    converted = clock()
+    start_times = _parse_start_times(matrices[1])
+    if start_times is None:
+        return _convert_rows(block, convert)
+    parsed = clock()
+    user_types = _map_user_types(matrices[2], schema)
+    done = clock()
+    if metrics is not None:
+        n_rows = len(durations)
+        # cutting the columns out is the bulk engine's csv parsing
+        metrics.record('read', split - started, n_rows)
+        metrics.record('duration', converted - split, n_rows)
+        metrics.record('start_time', parsed - converted, n_rows)
+        metrics.record('user_type', done - parsed, n_rows)
+    months, hours, days = start_times
+    return ((durations.astype(np.float64) / schema.duration_divisor).tolist(),
+            months.tolist(), hours.tolist(), _DAY_NAME_LOOKUP[days].tolist(),
+            user_types.tolist())
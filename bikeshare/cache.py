@@ -0,0 +1,83 @@
+"""
+Binary, memory-mapped column cache of condensed trip files.
+"""
+import os
+import struct
+
+import numpy as np
+
+from .lines import file_stamp
+
+# Binary trip cache layout: a fixed 64 byte header followed by one contiguous,
+# fixed-width array per column, in TRIP_CACHE_COLUMNS order. The header holds
+# the schema version, the row count and the size and mtime of the csv the
+# cache was built from, so a stale cache can be detected without reading it.
+TRIP_CACHE_MAGIC = b'BSTRIPS\x00'
+TRIP_CACHE_VERSION = 1
+TRIP_CACHE_HEADER = struct.Struct('<8sIIqqq')
+TRIP_CACHE_HEADER_SIZE = 64
+TRIP_CACHE_COLUMNS = (('duration', np.float32), ('month', np.uint8),
+                      ('hour', np.uint8), ('day_of_week', np.uint8),
+                      ('user_type', np.uint8))
+
+
+def trip_cache_file(filename):
+    """
+    Returns the name of the binary cache that belongs to a condensed csv file.
+    """
+    return os.path.splitext(filename)[0] + '.trips'
+
+
+def write_trip_cache(filename, duration, month, hour, day_of_week, user_type):
+    """
+    Writes the columns of the condensed csv file filename to its binary trip
+    cache. Day of week and user type are codes into DAY_NAMES and USER_TYPES.
+    """
+    source_size, source_mtime = file_stamp(filename)
+    columns = [np.asarray(values, dtype=dtype) for values, (_, dtype) in
+               zip((duration, month, hour, day_of_week, user_type), TRIP_CACHE_COLUMNS)]
+    n_rows = len(columns[0])
+    header = TRIP_CACHE_HEADER.pack(TRIP_CACHE_MAGIC, TRIP_CACHE_VERSION,
+                                    len(columns), n_rows, source_size, source_mtime)
+    # write to a temporary name first so readers never map a half written file
+    tmp_file = trip_cache_file(filename) + '.tmp'
+    with open(tmp_file, 'wb') as f_out:
+        f_out.write(header.ljust(TRIP_CACHE_HEADER_SIZE, b'\x00'))
+        for column in columns:
+            column.tofile(f_out)
+    os.replace(tmp_file, trip_cache_file(filename))
+
+
+def read_trip_cache(filename):
+    """
+    Maps the binary cache of the condensed csv file filename into memory and
+    returns its columns as read-only numpy.memmap arrays, without copying.
+    Returns None if there is no cache or if it was built from a different
+    version of the csv file (size or mtime changed) or schema.
+    """
+    cache_file = trip_cache_file(filename)
+    try:
+        with open(cache_file, 'rb') as f_in:
+            header = f_in.read(TRIP_CACHE_HEADER.size)
+        stamp = file_stamp(filename)
+    except OSError:
+        return None
+    if len(header) < TRIP_CACHE_HEADER.size:
+        return None
+    magic, version, n_columns, n_rows, source_size, source_mtime = \
+        TRIP_CACHE_HEADER.unpack(header)
+    if (magic != TRIP_CACHE_MAGIC or version != TRIP_CACHE_VERSION or
+            n_columns != len(TRIP_CACHE_COLUMNS) or
+            (source_size, source_mtime) != stamp):
+        return None
+
+    columns = []
+    offset = TRIP_CACHE_HEADER_SIZE
+    for _, dtype in TRIP_CACHE_COLUMNS:
+        if n_rows == 0:
+            columns.append(np.empty(0, dtype=dtype))
+        else:
+            columns.append(np.memmap(cache_file, dtype=dtype, mode='r',
+                                     offset=offset, shape=(n_rows,)))
+        offset += n_rows * np.dtype(dtype).itemsize
+    return columns
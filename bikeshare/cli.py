@@ -0,0 +1,153 @@
+"""
+Command line entry point: condenses the city feeds and prints the full report.
+"""
+import argparse
+import os
+
+from .condense import CONDENSE_ENGINES, condense_cities, condense_data
+from .stats import (aggregate_trips, avg_durationbytype, duration_of_trips,
+                    number_of_trips)
+from .trips import print_first_point
+
+# raw feed and condensed summary of every city
+CITY_INFO = {'Washington': {'in_file': 'Washington-CapitalBikeshare-2016.csv',
+                            'out_file': 'Washington-2016-Summary.csv'},
+             'Chicago': {'in_file': 'Chicago-Divvy-2016.csv',
+                         'out_file': 'Chicago-2016-Summary.csv'},
+             'NYC': {'in_file': 'NYC-CitiBike-2016.csv',
+                     'out_file': 'NYC-2016-Summary.csv'}}
+
+
+def _condense_serially(city_info, metrics=None, engine='rows'):
+    """
+    Condenses the cities one after another in this process, so a profile of
+    the run covers the condensing itself. Returns {city: {'error': ...}}.
+    """
+    from .instrument import CondenseMetrics
+
+    report = {}
+    for city, filenames in city_info.items():
+        city_metrics = None
+        if metrics is not None:
+            city_metrics = metrics[city] = CondenseMetrics(city=city)
+        try:
+            condense_data(filenames['in_file'], filenames['out_file'], city,
+                          binary_out=True, metrics=city_metrics, engine=engine)
+            report[city] = {'error': None}
+        except (OSError, ValueError) as e:
+            report[city] = {'error': str(e)}
+            print('{}: failed: {}'.format(city, e))
+    return report
+
+
+def _report_partitioned(city_info, args):
+    """
+    The --partition-dir report: every summary comes from the partition
+    manifests, and the plots read the partitions they need.
+    """
+    from .partition import condense_partitioned
+
+    for city, filenames in city_info.items():
+        city_dir = os.path.join(args.partition_dir, city)
+        if not args.skip_condense:
+            print_first_point(filenames['in_file'])
+            condense_partitioned(filenames['in_file'], args.partition_dir, city,
+                                 binary_out=True)
+        print('\n{}'.format(city))
+        print('number_of_trips', number_of_trips(city_dir))
+        print('duration_of_trips', duration_of_trips(city_dir))
+        print('avg_durationbytype', avg_durationbytype(city_dir))
+
+    if args.plots:
+        _plot(os.path.join(args.partition_dir, args.plot_city), args.plot_city)
+    return 0
+
+
+def _plot(source, city):
+    """
+    Draws the plots of a city from a condensed file or partitioned directory.
+    """
+    from . import plots
+    from .histograms import duration_histogram, trip_histograms
+
+    if os.path.isdir(source):
+        from .partition import partition_table
+        table = partition_table(source)
+    else:
+        from .table import load_trip_table
+        table = load_trip_table(source)
+    edges, counts = duration_histogram(table)
+    plots.plot_durations(edges, counts.sum(axis=0), city)
+    histograms = trip_histograms(source)
+    edges, (subscribers, customers) = histograms['duration_edges'], histograms['durations']
+    plots.plot_durations_by_type(edges, subscribers, city, 'Subscriber', 18000)
+    plots.plot_durations_by_type(edges, customers, city, 'Customer', 2500)
+    subscribers, customers = histograms['month']
+    plots.plot_months(subscribers, city, 'Subscriber', 8000)
+    plots.plot_months(customers, city, 'Customer', 2500)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--data-dir', default='.',
+                        help='directory holding the raw and condensed files')
+    parser.add_argument('--workers', type=int, help='condensing processes')
+    parser.add_argument('--chunks', type=int,
+                        help='chunks each city file is split into (default: enough '
+                        'to keep every worker busy)')
+    parser.add_argument('--engine', default='rows', choices=CONDENSE_ENGINES,
+                        help='condense row by row or in NumPy blocks')
+    parser.add_argument('--skip-condense', action='store_true',
+                        help='report on the existing condensed files')
+    parser.add_argument('--plots', action='store_true',
+                        help='draw the plots for the plotted city')
+    parser.add_argument('--plot-city', default='Washington', choices=sorted(CITY_INFO))
+    parser.add_argument('--metrics', metavar='PREFIX',
+                        help='write per-stage condense metrics to PREFIX.json and '
+                        'PREFIX.prom (Prometheus text format)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='condense in this process under cProfile and dump '
+                        'the stats to FILE')
+    parser.add_argument('--partition-dir', metavar='DIR',
+                        help='condense into month partitions under DIR and report '
+                        'from their manifests')
+    args = parser.parse_args(argv)
+
+    city_info = {city: {kind: os.path.join(args.data_dir, name)
+                        for kind, name in filenames.items()}
+                 for city, filenames in CITY_INFO.items()}
+    if args.partition_dir:
+        return _report_partitioned(city_info, args)
+
+    if not args.skip_condense:
+        for filenames in city_info.values():
+            print_first_point(filenames['in_file'])
+        metrics = {} if args.metrics else None
+        if args.profile:
+            from .instrument import run_profiled
+            report = run_profiled(args.profile, _condense_serially, city_info, metrics,
+                                  args.engine)
+        else:
+            report = condense_cities(city_info, workers=args.workers,
+                                     chunks_per_city=args.chunks, binary_out=True,
+                                     metrics=metrics, engine=args.engine)
+        if metrics:
+            from .instrument import write_metrics_json, write_prometheus
+            write_metrics_json(list(metrics.values()), args.metrics + '.json')
+            write_prometheus(list(metrics.values()), args.metrics + '.prom')
+        if any(result['error'] for result in report.values()):
+            return 1
+        for filenames in city_info.values():
+            print_first_point(filenames['out_file'])
+
+    # one pass over each summary
+    for city, filenames in city_info.items():
+        aggregates = aggregate_trips(filenames['out_file'])
+        print('\n{}'.format(city))
+        print('number_of_trips', number_of_trips(filenames['out_file'], aggregates))
+        print('duration_of_trips', duration_of_trips(filenames['out_file'], aggregates))
+        print('avg_durationbytype', avg_durationbytype(filenames['out_file'], aggregates))
+
+    if args.plots:
+        _plot(city_info[args.plot_city]['out_file'], args.plot_city)
+    return 0
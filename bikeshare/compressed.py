@@ -0,0 +1,189 @@
+"""
+Transparent streaming decompression of raw trip feeds.
+
+A raw feed can be stored plain or compressed with gzip, xz, bz2 or zstd. The
+codec is recognized by the file's magic bytes (or, for an empty file, its
+name), and the file is decompressed as it is read, through large buffers.
+gzip files written as BGZF (independent blocks, e.g. by "bgzip") are
+decompressed on several threads.
+"""
+import io
+import os
+import struct
+import zlib
+from collections import deque
+
+# size of the read buffers between the file, the decompressor and the parser
+READ_BUFFER_BYTES = 1 << 20
+
+# leading bytes of each supported compressed format
+MAGIC_BYTES = ((b'\x1f\x8b', 'gzip'), (b'\xfd7zXZ\x00', 'xz'), (b'BZh', 'bz2'),
+               (b'\x28\xb5\x2f\xfd', 'zstd'))
+
+# file name suffix of each supported compressed format
+COMPRESSED_SUFFIXES = {'.gz': 'gzip', '.bgz': 'gzip', '.xz': 'xz', '.bz2': 'bz2',
+                       '.zst': 'zstd'}
+
+# BGZF blocks decompressed per task, and tasks in flight per worker thread
+BGZF_BLOCKS_PER_TASK = 64
+BGZF_TASKS_PER_WORKER = 2
+
+
+def detect_codec(filename):
+    """
+    Returns the codec of a file ('gzip', 'xz', 'bz2' or 'zstd'), or None if it
+    is not compressed. The magic bytes decide; an empty or truncated file
+    goes by its suffix.
+    """
+    with open(filename, 'rb') as f_in:
+        head = f_in.read(6)
+    for magic, codec in MAGIC_BYTES:
+        if head.startswith(magic):
+            return codec
+    if len(head) < 6:
+        return COMPRESSED_SUFFIXES.get(os.path.splitext(filename)[1].lower())
+    return None
+
+
+def strip_compression_suffix(filename):
+    """
+    Returns a file name without its compression suffix, e.g.
+    "NYC-CitiBike-2016.csv" for "NYC-CitiBike-2016.csv.gz".
+    """
+    stem, suffix = os.path.splitext(filename)
+    return stem if suffix.lower() in COMPRESSED_SUFFIXES else filename
+
+
+def _bgzf_block_size(header):
+    """
+    Returns the total size of the BGZF block that starts with header (its
+    first 18 bytes at least), or None if it is not a BGZF block.
+    """
+    if len(header) < 18 or header[:4] != b'\x1f\x8b\x08\x04':
+        return None
+    extra_length = struct.unpack('<H', header[10:12])[0]
+    extra = header[12:12 + extra_length]
+    position = 0
+    while position + 4 <= len(extra):
+        subfield, length = extra[position:position + 2], struct.unpack(
+            '<H', extra[position + 2:position + 4])[0]
+        if subfield == b'BC' and length == 2:
+            return struct.unpack('<H', extra[position + 4:position + 6])[0] + 1
+        position += 4 + length
+    return None
+
+
+def is_bgzf(filename):
+    """
+    Checks whether a gzip file is made of BGZF blocks.
+    """
+    with open(filename, 'rb') as f_in:
+        return _bgzf_block_size(f_in.read(64)) is not None
+
+
+def _inflate_blocks(blocks):
+    return b''.join(zlib.decompress(block, 31) for block in blocks)
+
+
+class BGZFReader(io.RawIOBase):
+    """
+    Binary reader of a BGZF file that decompresses groups of blocks on a pool
+    of threads (zlib releases the GIL) ahead of the consumer, in order.
+    """
+
+    def __init__(self, filename, workers=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = workers or os.cpu_count() or 1
+        self._file = open(filename, 'rb', buffering=READ_BUFFER_BYTES)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = deque()
+        self._max_pending = workers * BGZF_TASKS_PER_WORKER
+        self._chunk = memoryview(b'')
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _submit(self):
+        while not self._eof and len(self._pending) < self._max_pending:
+            blocks = []
+            while len(blocks) < BGZF_BLOCKS_PER_TASK:
+                header = self._file.read(18)
+                if not header:
+                    self._eof = True
+                    break
+                size = _bgzf_block_size(header + self._file.peek(64)[:64])
+                if size is None:
+                    raise ValueError('not a BGZF block at offset {}'.format(
+                        self._file.tell() - len(header)))
+                blocks.append(header + self._file.read(size - 18))
+            if blocks:
+                self._pending.append(self._executor.submit(_inflate_blocks, blocks))
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            self._submit()
+            if not self._pending:
+                return 0
+            self._chunk = memoryview(self._pending.popleft().result())
+        n = min(len(buffer), len(self._chunk))
+        buffer[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._file.close()
+        super().close()
+
+
+def _open_zstd(filename):
+    try:
+        from compression import zstd
+        return zstd.open(filename, 'rb')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('reading zstd-compressed files needs Python 3.14 or the '
+                          'zstandard package')
+    return zstandard.ZstdDecompressor().stream_reader(
+        open(filename, 'rb', buffering=READ_BUFFER_BYTES), closefd=True)
+
+
+def open_binary(filename, workers=None):
+    """
+    Opens a plain or compressed file for reading its decompressed bytes.
+    BGZF files are decompressed on workers threads (default: one per CPU;
+    workers=1 reads them like any gzip file).
+    """
+    codec = detect_codec(filename)
+    if codec is None:
+        return open(filename, 'rb', buffering=READ_BUFFER_BYTES)
+    if codec == 'gzip' and workers != 1 and is_bgzf(filename):
+        stream = BGZFReader(filename, workers)
+    elif codec == 'gzip':
+        import gzip
+        stream = gzip.open(filename, 'rb')
+    elif codec == 'xz':
+        import lzma
+        stream = lzma.open(filename, 'rb')
+    elif codec == 'bz2':
+        import bz2
+        stream = bz2.open(filename, 'rb')
+    else:
+        stream = _open_zstd(filename)
+    return io.BufferedReader(stream, buffer_size=READ_BUFFER_BYTES)
+
+
+def open_input(filename, workers=None):
+    """
+    Opens a plain or compressed raw feed as text, like open(filename, 'r')
+    does for a plain one, decompressing it as it is read (see open_binary).
+    """
+    return io.TextIOWrapper(open_binary(filename, workers))
@@ -0,0 +1,579 @@
+"""
+Condensing raw city trip files into the five-column summary format.
+"""
+import csv
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from array import array
+from itertools import islice
+
+from .compressed import detect_codec, open_binary, open_input
+from .encoding import (CategoryEncoder, encoded_fieldnames, merge_dictionaries,
+                       replace_header)
+from .lines import complete_end, last_line, line_hash, open_at, read_lines, split_lines
+from .schemas import city_schema, compile_batch_converter
+from .trips import DAY_NAMES, USER_TYPES
+from .zonemap import ZoneMapWriter
+
+
+# columns of the condensed data files, in output order
+CONDENSED_COLUMNS = ['duration', 'month', 'hour', 'day_of_week', 'user_type']
+
+# rows per batch and upper bound on the raw rows buffered between the read and
+# transform stages of the condense pipeline
+CONDENSE_BATCH_ROWS = 10000
+CONDENSE_BUFFER_BYTES = 64 * 1024 * 1024
+
+# condense engines: row by row with the csv module, or in NumPy blocks
+CONDENSE_ENGINES = ('rows', 'bulk')
+
+
+def read_batches(rows, batch_size=CONDENSE_BATCH_ROWS):
+    """
+    Read stage: groups an iterable of parsed csv rows into lists of at most
+    batch_size rows. Blank lines (empty rows) are skipped, as csv.DictReader
+    does.
+    """
+    rows = (row for row in rows if row)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _batch_bytes(batch, sample=100):
+    """
+    Estimates the memory held by a batch of parsed rows from a sample of them.
+    """
+    rows = batch[:sample]
+    row_bytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(field) for field in row)
+                    for row in rows) / len(rows)
+    return int(row_bytes * len(batch))
+
+
+class _ReaderFailed(object):
+    def __init__(self, error):
+        self.error = error
+
+
+def buffered(batches, max_buffer_bytes=CONDENSE_BUFFER_BYTES):
+    """
+    Runs a batch iterator on a background thread so reading and parsing the
+    input overlaps with the downstream stages. The number of batches waiting
+    in between is bounded by max_buffer_bytes (sized from the first batch, at
+    least one batch); when the buffer is full the reader blocks until a batch
+    has been consumed. If the consumer stops early (an error downstream, or
+    the generator is closed), the reader stops after its current batch.
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return
+    max_batches = max(1, max_buffer_bytes // max(_batch_bytes(first), 1))
+    handoff = queue.Queue(maxsize=max_batches)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # gives up once the consumer has stopped, so the reader never blocks
+        # on a full queue nobody reads any more
+        while not stopped.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+            put(done)
+        except BaseException as e:
+            put(_ReaderFailed(e))
+
+    reader = threading.Thread(target=produce, daemon=True)
+    reader.start()
+    try:
+        yield first
+        while True:
+            batch = handoff.get()
+            if batch is done:
+                break
+            if isinstance(batch, _ReaderFailed):
+                raise batch.error
+            yield batch
+    finally:
+        # let the reader exit if the consumer stops early, and wait for it so
+        # it is done with the input before the caller closes it
+        stopped.set()
+        reader.join()
+
+
+def condense_batches(rows, header, city, batch_size=CONDENSE_BATCH_ROWS,
+                     max_buffer_bytes=CONDENSE_BUFFER_BYTES, metrics=None):
+    """
+    Runs parsed raw csv rows through the read -> parse/transform stages and
+    yields the condensed columns of each batch as five lists: duration,
+    month, hour, day of week, and user type. The city's schema is compiled
+    against the header once, up front.
+
+    With metrics (a CondenseMetrics), the time spent reading and parsing on
+    the reader thread ('read'), waiting for it ('wait') and converting each
+    column is recorded.
+    """
+    transform = compile_batch_converter(city_schema(city), header, metrics)
+    batches = read_batches(rows, batch_size)
+    if metrics is None:
+        for batch in buffered(batches, max_buffer_bytes):
+            yield transform(batch)
+    else:
+        batches = buffered(metrics.timed('read', batches), max_buffer_bytes)
+        for batch in metrics.timed('wait', batches):
+            yield transform(batch)
+
+
+def _input_batches(f_in, city, engine, batch_size, max_buffer_bytes, metrics):
+    """
+    Returns the condensed column batches of an open raw file: a text stream
+    for the 'rows' engine, a binary one for 'bulk'.
+    """
+    if engine == 'bulk':
+        from .bulk import bulk_batches
+        header = f_in.readline()
+        if not header:
+            return []
+        fieldnames = next(csv.reader([header.decode('utf-8').rstrip('\r\n')]))
+        return bulk_batches(f_in, fieldnames, city, metrics=metrics)
+    trip_reader = csv.reader(f_in)
+    header = next(trip_reader, None)
+    if header is None:
+        return []
+    return condense_batches(trip_reader, header, city, batch_size, max_buffer_bytes,
+                            metrics)
+
+
+def condense_data(in_file, out_file, city, binary_out=False, zone_map=True,
+                  batch_size=CONDENSE_BATCH_ROWS, max_buffer_bytes=CONDENSE_BUFFER_BYTES,
+                  metrics=None, encoded=False, engine='rows'):
+    """
+    This function takes full data from the specified input file
+    and writes the condensed data to a specified output file. The city
+    argument determines how the input file will be parsed.
+
+    Rows are processed in batches of batch_size: a background thread reads and
+    parses the input while the main thread transforms each batch and writes it
+    with a single writerows call. At most max_buffer_bytes of parsed rows are
+    buffered between the two.
+
+    If binary_out is set, a binary trip cache (see write_trip_cache) is
+    written next to the output file as well. If zone_map is set, so is the
+    file's zone map (see ZoneMapWriter), which lets readers skip blocks of
+    rows by month, hour or duration.
+
+    With metrics (a CondenseMetrics), per-stage times, rows over time and
+    bytes read and written are recorded (see condense_batches).
+
+    If encoded is set, day of week and user type are written as integer
+    codes, with their dictionaries in the header (see the encoding module);
+    export_csv turns such a file back into the plain one.
+
+    The input file can be compressed (see open_input); it is decompressed as
+    it is read.
+
+    engine='bulk' converts the input in large blocks with NumPy instead of row
+    by row (see the bulk module); the output is the same.
+    """
+    if engine not in CONDENSE_ENGINES:
+        raise ValueError('unknown engine: {}'.format(engine))
+    zones = ZoneMapWriter() if zone_map else None
+    if encoded:
+        encoders = {'day_of_week': CategoryEncoder(DAY_NAMES),
+                    'user_type': CategoryEncoder(USER_TYPES)}
+        user_types_known = len(USER_TYPES)
+    if binary_out:
+        columns = (array('f'), array('B'), array('B'), array('B'), array('B'))
+        day_codes = {name: code for code, name in enumerate(DAY_NAMES)}
+
+    source = open_binary if engine == 'bulk' else open_input
+    with open(out_file, 'w') as f_out, source(in_file) as f_in:
+        trip_writer = csv.writer(f_out)
+        if encoded:
+            trip_writer.writerow(encoded_fieldnames(
+                CONDENSED_COLUMNS, {name: encoder.values
+                                    for name, encoder in encoders.items()}))
+        else:
+            trip_writer.writerow(CONDENSED_COLUMNS)
+
+        batches = _input_batches(f_in, city, engine, batch_size, max_buffer_bytes,
+                                 metrics)
+
+        for durations, months, hours, days, user_types in batches:
+            if metrics is not None:
+                started = time.perf_counter()
+            if encoded:
+                out_columns = (durations, months, hours,
+                               encoders['day_of_week'].encode(days),
+                               encoders['user_type'].encode(user_types))
+            else:
+                out_columns = (durations, months, hours, days, user_types)
+            if zones is None:
+                trip_writer.writerows(zip(*out_columns))
+            else:
+                zones.writerows(f_out, trip_writer, out_columns)
+            if metrics is not None:
+                metrics.record('write', time.perf_counter() - started, len(durations))
+                metrics.progress(len(durations))
+            if binary_out:
+                columns[0].extend(durations)
+                columns[1].extend(months)
+                columns[2].extend(hours)
+                columns[3].extend([day_codes[day] for day in days])
+                columns[4].extend([0 if user_type == 'Subscriber' else 1
+                                   for user_type in user_types])
+
+    if encoded and len(encoders['user_type'].values) > user_types_known:
+        # user types beyond USER_TYPES turned up: put them in the dictionary
+        grown = replace_header(out_file, encoded_fieldnames(
+            CONDENSED_COLUMNS, {name: encoder.values for name, encoder in encoders.items()}))
+        if zones is not None:
+            for block in zones.blocks:
+                block['offset'] += grown
+
+    # the cache and zone map record the size and mtime of the finished csv, so
+    # they can only be written once the csv has been closed
+    if metrics is not None:
+        metrics.finish(os.path.getsize(in_file), os.path.getsize(out_file))
+    if zones is not None:
+        zones.save(out_file)
+    if binary_out:
+        from .cache import write_trip_cache
+        write_trip_cache(out_file, *columns)
+
+
+def _range_batches(in_file, start, end, fieldnames, city, engine, metrics):
+    """
+    Yields the condensed column batches of the lines between two offsets.
+    """
+    if engine == 'bulk':
+        from .bulk import bulk_batches
+        with open_at(in_file, start) as f_in:
+            yield from bulk_batches(f_in, fieldnames, city,
+                                    None if end is None else end - start, metrics=metrics)
+    else:
+        trip_reader = csv.reader(read_lines(in_file, start, end))
+        yield from condense_batches(trip_reader, fieldnames, city, metrics=metrics)
+
+
+def condense_range(in_file, start, end, city, part_file, header,
+                   collect_metrics=False, engine='rows', zone_map=False, encoded=False):
+    """
+    Condenses the rows of in_file between byte offsets start and end (as
+    returned by split_lines; end is None for the whole of a compressed file)
+    into part_file, without a header row, with the given engine (see
+    condense_data). Returns the number of rows, the seconds it took, with
+    collect_metrics the chunk's CondenseMetrics as a dictionary, with
+    zone_map the part's zone map blocks (offsets within part_file), and with
+    encoded the {column: values} dictionaries of the codes written (each
+    None otherwise).
+    """
+    started = time.perf_counter()
+    metrics = None
+    if collect_metrics:
+        from .instrument import CondenseMetrics
+        metrics = CondenseMetrics(city=city)
+    zones = ZoneMapWriter() if zone_map else None
+    if encoded:
+        encoders = {'day_of_week': CategoryEncoder(DAY_NAMES),
+                    'user_type': CategoryEncoder(USER_TYPES)}
+    n_rows = 0
+    with open(part_file, 'w') as f_out:
+        trip_writer = csv.writer(f_out)
+        fieldnames = next(csv.reader([header]))
+        for batch in _range_batches(in_file, start, end, fieldnames, city, engine,
+                                    metrics):
+            if metrics is not None:
+                written = time.perf_counter()
+            if encoded:
+                batch = (batch[0], batch[1], batch[2],
+                         encoders['day_of_week'].encode(batch[3]),
+                         encoders['user_type'].encode(batch[4]))
+            if zones is None:
+                trip_writer.writerows(zip(*batch))
+            else:
+                zones.writerows(f_out, trip_writer, batch)
+            n_rows += len(batch[0])
+            if metrics is not None:
+                metrics.record('write', time.perf_counter() - written, len(batch[0]))
+                metrics.progress(len(batch[0]))
+    blocks = zones.blocks if zones is not None else None
+    dictionaries = None
+    if encoded:
+        dictionaries = {name: encoder.values for name, encoder in encoders.items()}
+    if metrics is None:
+        return n_rows, time.perf_counter() - started, None, blocks, dictionaries
+    bytes_read = os.path.getsize(in_file) if end is None else end - start
+    metrics.finish(bytes_read, os.path.getsize(part_file))
+    return (n_rows, time.perf_counter() - started, metrics.to_dict(), blocks,
+            dictionaries)
+
+
+def _recode_part(part_file, dictionaries, merged, blocks):
+    """
+    Rewrites the codes of an encoded part file from its own dictionaries to
+    the merged ones, and moves its zone map blocks (if any) to the new
+    offsets of their first rows.
+    """
+    recode = {}
+    for column, name in enumerate(CONDENSED_COLUMNS):
+        if name in dictionaries:
+            recode[column] = {str(code): str(merged[name].index(value))
+                              for code, value in enumerate(dictionaries[name])}
+    block_starts = {}
+    if blocks:
+        first_row = 0
+        for block in blocks:
+            block_starts[first_row] = block
+            first_row += block['rows']
+    tmp_file = part_file + '.tmp'
+    with open(part_file, 'r') as f_in, open(tmp_file, 'w') as f_out:
+        trip_writer = csv.writer(f_out)
+        for i, row in enumerate(csv.reader(f_in)):
+            if i in block_starts:
+                block_starts[i]['offset'] = f_out.tell()
+            for column, codes in recode.items():
+                row[column] = codes[row[column]]
+            trip_writer.writerow(row)
+    os.replace(tmp_file, part_file)
+
+
+def _join_parts(out_file, parts, results, zone_map, encoded):
+    """
+    Writes the header of a city's output file followed by its condensed part
+    files in order, and its zone map from theirs (see condense_range).
+    """
+    if encoded:
+        part_dictionaries = [result[4] for result in results]
+        merged = merge_dictionaries(part_dictionaries)
+        for part, result, dictionaries in zip(parts, results, part_dictionaries):
+            if any(merged[name][:len(values)] != values
+                   for name, values in dictionaries.items()):
+                _recode_part(part, dictionaries, merged, result[3])
+        header = encoded_fieldnames(CONDENSED_COLUMNS, merged)
+    else:
+        header = CONDENSED_COLUMNS
+    zones = ZoneMapWriter() if zone_map else None
+    with open(out_file, 'w') as f_out:
+        csv.writer(f_out).writerow(header)
+    with open(out_file, 'ab') as f_out:
+        for part, result in zip(parts, results):
+            if zones is not None:
+                zones.extend(result[3], f_out.tell())
+            with open(part, 'rb') as f_part:
+                shutil.copyfileobj(f_part, f_out, 1 << 20)
+    if zones is not None:
+        zones.save(out_file)
+
+
+def condense_cities(city_info, workers=None, chunks_per_city=None, binary_out=False,
+                    metrics=None, engine='rows', zone_map=True, encoded=False):
+    """
+    Condenses every city in city_info, a dictionary mapping each city to its
+    {'in_file': ..., 'out_file': ...} file names, on a process pool of the
+    given number of workers (default: one per CPU). Each city's input file
+    is split into chunks_per_city line-aligned byte ranges (by default
+    enough for the cities to keep every worker busy; a compressed file is a
+    single chunk) that are condensed in parallel and then joined in order,
+    so the output is identical to condense_data.
+
+    Returns a dictionary keyed by city with the number of rows, the wall time
+    ('seconds'), the summed worker time ('cpu_seconds') and the error message
+    if that city failed ('error', None on success). A failing city does not
+    stop the others.
+
+    If metrics is a dictionary, the CondenseMetrics of each city (merged over
+    its chunks, with stage times summed across workers) are stored in it.
+
+    engine, binary_out, zone_map and encoded are as for condense_data. The
+    zone map is joined from those of the chunks, so its blocks restart at
+    every chunk boundary.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    if metrics is not None:
+        from .instrument import CondenseMetrics
+    workers = workers or os.cpu_count() or 1
+    if chunks_per_city is None:
+        chunks_per_city = max(1, -(-workers // max(len(city_info), 1)))
+
+    report = {}
+    pending = {}
+    owners = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for city, filenames in city_info.items():
+            started = time.perf_counter()
+            report[city] = {'rows': 0, 'seconds': None, 'cpu_seconds': 0.0,
+                            'chunks': 0, 'error': None}
+            try:
+                header, ranges = split_lines(filenames['in_file'], chunks_per_city)
+            except (OSError, UnicodeDecodeError) as e:
+                report[city]['error'] = str(e)
+                print('{}: failed: {}'.format(city, e))
+                continue
+            parts = ['{}.part{}'.format(filenames['out_file'], i)
+                     for i in range(len(ranges))]
+            report[city]['chunks'] = len(ranges)
+            if metrics is not None:
+                metrics[city] = CondenseMetrics(city=city)
+            futures = [executor.submit(condense_range, filenames['in_file'], start,
+                                       end, city, part, header, metrics is not None,
+                                       engine, zone_map, encoded)
+                       for (start, end), part in zip(ranges, parts)]
+            pending[city] = (started, parts, futures)
+            for future in futures:
+                owners[future] = city
+
+        remaining = {city: len(futures) for city, (_, _, futures) in pending.items()}
+        for future in as_completed(owners):
+            city = owners[future]
+            try:
+                n_rows, seconds, chunk_metrics = future.result()[:3]
+                report[city]['rows'] += n_rows
+                report[city]['cpu_seconds'] += seconds
+                if chunk_metrics is not None:
+                    metrics[city].merge(CondenseMetrics.from_dict(chunk_metrics))
+            except Exception as e:
+                if report[city]['error'] is None:
+                    report[city]['error'] = '{}: {}'.format(type(e).__name__, e)
+            remaining[city] -= 1
+            if remaining[city]:
+                continue
+
+            # last chunk of this city is done: join the parts in order
+            started, parts, futures = pending[city]
+            out_file = city_info[city]['out_file']
+            if report[city]['error'] is None:
+                try:
+                    _join_parts(out_file, parts, [f.result() for f in futures],
+                                zone_map, encoded)
+                    if binary_out:
+                        from .cache import write_trip_cache
+                        from .table import TripTable
+                        table = TripTable.from_csv(out_file)
+                        write_trip_cache(out_file, table.duration, table.month,
+                                         table.hour, table.day_of_week, table.user_type)
+                except (OSError, ValueError) as e:
+                    report[city]['error'] = '{}: {}'.format(type(e).__name__, e)
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+            report[city]['seconds'] = time.perf_counter() - started
+            if metrics is not None:
+                metrics[city].seconds = report[city]['seconds']
+                if report[city]['error'] is None:
+                    # the parts hold no header, and recoding can resize them
+                    metrics[city].bytes_written = os.path.getsize(out_file)
+            if report[city]['error'] is None:
+                print('{}: {} rows in {:.2f}s ({} chunks)'.format(
+                    city, report[city]['rows'], report[city]['seconds'],
+                    report[city]['chunks']))
+            else:
+                print('{}: failed: {}'.format(city, report[city]['error']))
+    return report
+
+
+def checkpoint_file(out_file):
+    """
+    Returns the name of the checkpoint kept next to an incrementally
+    condensed output file.
+    """
+    return out_file + '.checkpoint'
+
+
+def _read_checkpoint(in_file, out_file, city):
+    """
+    Returns the checkpoint of out_file if it still describes in_file and
+    out_file exactly, otherwise None.
+    """
+    try:
+        with open(checkpoint_file(out_file), 'r') as f_in:
+            checkpoint = json.load(f_in)
+        in_size = os.path.getsize(in_file)
+        out_size = os.path.getsize(out_file)
+    except (OSError, ValueError):
+        return None
+    if (checkpoint.get('city') != city or checkpoint.get('out_size') != out_size or
+            checkpoint.get('offset', -1) > in_size):
+        return None
+
+    # the header and the last processed line must be unchanged, which catches
+    # a raw file that was rewritten rather than appended to
+    with open(in_file, 'rb') as f_in:
+        if line_hash(f_in.readline()) != checkpoint.get('header_hash'):
+            return None
+        f_in.seek(checkpoint['last_line_start'])
+        processed = f_in.read(checkpoint['offset'] - checkpoint['last_line_start'])
+    if line_hash(processed) != checkpoint.get('last_line_hash'):
+        return None
+    return checkpoint
+
+
+def condense_incremental(in_file, out_file, city):
+    """
+    Condenses only the rows appended to in_file since the previous run and
+    appends them to out_file. Progress is kept in a checkpoint next to the
+    output (see checkpoint_file) holding the byte offset reached in the input,
+    the number of rows written, and hashes of the header and of the last
+    processed line. Without a checkpoint, or when it no longer matches the
+    input or output files, the output is rebuilt from scratch.
+
+    Returns the number of rows written and whether a full rebuild was done.
+    Compressed inputs cannot be resumed by offset and are rejected.
+    """
+    if detect_codec(in_file) is not None:
+        raise ValueError('cannot condense a compressed file incrementally: {}'.format(in_file))
+    in_size = os.path.getsize(in_file)
+    checkpoint = _read_checkpoint(in_file, out_file, city)
+    rebuild = checkpoint is None
+    with open(in_file, 'rb') as f_in:
+        header_line = f_in.readline()
+        data_start = f_in.tell()
+    if rebuild:
+        checkpoint = {'city': city, 'header_hash': line_hash(header_line),
+                      'offset': data_start, 'last_line_start': 0, 'rows': 0,
+                      'last_line_hash': line_hash(header_line)}
+        with open(out_file, 'w') as f_out:
+            csv.writer(f_out).writerow(CONDENSED_COLUMNS)
+
+    start = checkpoint['offset']
+    end = complete_end(in_file, in_size)
+    n_rows = 0
+    if end > start:
+        header = next(csv.reader([header_line.decode('utf-8')]))
+        with open(out_file, 'a') as f_out:
+            trip_writer = csv.writer(f_out)
+            trip_reader = csv.reader(read_lines(in_file, start, end))
+            for batch in condense_batches(trip_reader, header, city):
+                trip_writer.writerows(zip(*batch))
+                n_rows += len(batch[0])
+
+        # remember where the last complete line started so the next run can
+        # check it is still there
+        checkpoint['last_line_start'], checkpoint['last_line_hash'] = \
+            last_line(in_file, start, end)
+        checkpoint['offset'] = end
+        checkpoint['rows'] += n_rows
+
+    checkpoint['out_size'] = os.path.getsize(out_file)
+    tmp_file = checkpoint_file(out_file) + '.tmp'
+    with open(tmp_file, 'w') as f_out:
+        json.dump(checkpoint, f_out)
+    os.replace(tmp_file, checkpoint_file(out_file))
+    return n_rows, rebuild
@@ -0,0 +1,256 @@
+"""
+Dense month x hour x day-of-week x user-type cube of trip counts and durations.
+
+    python -m bikeshare.cube Washington-2016-Summary.csv Chicago-2016-Summary.csv
+
+Every report statistic that does not look at single durations is a sum over
+the 12 x 24 x 7 x 2 cells of this cube. write_cube saves it next to a
+condensed file (or in a partitioned city directory) as a small compressed
+.npz file stamped with the size and mtime of its source, and the summary
+functions take their trip counts from a current one instead of reading the
+trips.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+from .lines import file_stamp
+from .trips import DAY_NAMES, USER_TYPES
+
+# the cube's dimensions, in axis order, and the values along each
+CUBE_DIMENSIONS = ('month', 'hour', 'day_of_week', 'user_type')
+CUBE_COORDINATES = {'month': tuple(range(1, 13)), 'hour': tuple(range(24)),
+                    'day_of_week': DAY_NAMES, 'user_type': USER_TYPES}
+
+# file name of the cube of a partitioned city directory
+CUBE_FILE = 'cube.npz'
+
+
+def cube_file(source):
+    """
+    Returns the name of the cube file that belongs to a condensed file or a
+    partitioned city directory.
+    """
+    if os.path.isdir(source):
+        return os.path.join(source, CUBE_FILE)
+    return os.path.splitext(source)[0] + '.cube.npz'
+
+
+class TripCube(object):
+    """
+    Trip counts and duration sums (in minutes) over the cells of some of the
+    CUBE_DIMENSIONS, as two NumPy arrays with one axis per dimension, and
+    the values (coordinates) along each axis.
+
+    roll_up, slice and dice return new, smaller cubes, so they can be
+    chained; the arrays are never modified in place.
+    """
+
+    def __init__(self, counts, duration_sums, dimensions=CUBE_DIMENSIONS,
+                 coordinates=None):
+        self.counts = counts
+        self.duration_sums = duration_sums
+        self.dimensions = tuple(dimensions)
+        coordinates = coordinates or CUBE_COORDINATES
+        self.coordinates = {dimension: tuple(coordinates[dimension])
+                            for dimension in self.dimensions}
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Builds the full cube of a TripTable with one pass of bincount.
+        Durations are float32 in the table, so the sums can differ from the
+        csv path in the last few significant digits (see aggregate_table).
+        """
+        shape = tuple(len(CUBE_COORDINATES[dimension]) for dimension in CUBE_DIMENSIONS)
+        cells = np.ravel_multi_index(
+            (table.month.astype(np.intp) - 1, table.hour, table.day_of_week,
+             table.user_type), shape)
+        size = int(np.prod(shape))
+        counts = np.bincount(cells, minlength=size).reshape(shape)
+        duration_sums = np.bincount(cells, weights=table.duration.astype(np.float64),
+                                    minlength=size).reshape(shape)
+        return cls(counts.astype(np.int64), duration_sums)
+
+    def __repr__(self):
+        return 'TripCube({})'.format(' x '.join(
+            '{} {}'.format(len(self.coordinates[dimension]), dimension)
+            for dimension in self.dimensions))
+
+    def _axis(self, dimension):
+        if dimension not in self.dimensions:
+            raise ValueError('not a dimension of the cube: {}'.format(dimension))
+        return self.dimensions.index(dimension)
+
+    def _index(self, dimension, value):
+        try:
+            return self.coordinates[dimension].index(value)
+        except ValueError:
+            raise ValueError('no {!r} along dimension {}'.format(value, dimension))
+
+    def _without(self, axes, counts, duration_sums):
+        dimensions = [dimension for axis, dimension in enumerate(self.dimensions)
+                      if axis not in axes]
+        return TripCube(counts, duration_sums, dimensions, self.coordinates)
+
+    def roll_up(self, *dimensions):
+        """
+        Returns the cube summed over the given dimensions, which it no longer
+        has, e.g. roll_up('hour', 'day_of_week') for month x user type.
+        """
+        axes = tuple(self._axis(dimension) for dimension in dimensions)
+        return self._without(axes, self.counts.sum(axis=axes),
+                             self.duration_sums.sum(axis=axes))
+
+    def slice(self, dimension, value):
+        """
+        Returns the sub-cube of the cells with one value along a dimension,
+        which it no longer has, e.g. slice('user_type', 'Customer').
+        """
+        axis = self._axis(dimension)
+        index = self._index(dimension, value)
+        return self._without((axis,), self.counts.take(index, axis=axis),
+                             self.duration_sums.take(index, axis=axis))
+
+    def dice(self, **selections):
+        """
+        Returns the sub-cube of the cells with the listed values along each
+        given dimension, in that order, e.g.
+        dice(month=[6, 7, 8], hour=range(7, 10)).
+        """
+        counts, duration_sums = self.counts, self.duration_sums
+        coordinates = dict(self.coordinates)
+        for dimension, values in selections.items():
+            axis = self._axis(dimension)
+            values = tuple(values)
+            indices = [self._index(dimension, value) for value in values]
+            counts = counts.take(indices, axis=axis)
+            duration_sums = duration_sums.take(indices, axis=axis)
+            coordinates[dimension] = values
+        return TripCube(counts, duration_sums, self.dimensions, coordinates)
+
+    def count(self):
+        return int(self.counts.sum())
+
+    def duration_sum(self):
+        return float(self.duration_sums.sum())
+
+    def mean_durations(self):
+        """
+        Returns the average trip duration of every cell (nan where a cell has
+        no trips).
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.duration_sums / self.counts
+
+    def aggregates(self):
+        """
+        Returns the CUBE_STATISTICS in the same form as aggregate_trips, so
+        they can be passed to the summary functions as their aggregates.
+        """
+        if self.dimensions != CUBE_DIMENSIONS or self.coordinates != CUBE_COORDINATES:
+            raise ValueError('aggregates need the full cube, not {!r}'.format(self))
+        by_type = self.roll_up('hour', 'day_of_week')
+        hours = self.roll_up('month', 'day_of_week').counts
+        counts = by_type.counts.sum(axis=0)
+        sums = by_type.duration_sums.sum(axis=0)
+        return {'user_counts': (int(counts[0]), int(counts[1])),
+                'duration_by_type': {user_type: float(sums[i])
+                                     for i, user_type in enumerate(USER_TYPES)},
+                'month_by_type': {user_type: by_type.counts[:, i].tolist()
+                                  for i, user_type in enumerate(USER_TYPES)},
+                'hour_by_type': {user_type: hours[:, i].tolist()
+                                 for i, user_type in enumerate(USER_TYPES)}}
+
+    def save(self, filename, stamp=None):
+        """
+        Writes the cube to an .npz file, with the stamp of its source if given.
+        """
+        meta = {'dimensions': self.dimensions,
+                'coordinates': {dimension: list(values)
+                                for dimension, values in self.coordinates.items()},
+                'stamp': stamp}
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, counts=self.counts, duration_sums=self.duration_sums,
+                            meta=np.array(json.dumps(meta)))
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'wb') as f_out:
+            f_out.write(buffer.getvalue())
+        os.replace(tmp_file, filename)
+
+
+def _load(filename):
+    with np.load(filename, allow_pickle=False) as arrays:
+        meta = json.loads(str(arrays['meta']))
+        cube = TripCube(arrays['counts'], arrays['duration_sums'], meta['dimensions'],
+                        meta['coordinates'])
+    return cube, meta['stamp']
+
+
+def load_cube(filename):
+    """
+    Returns the TripCube saved in an .npz file (see TripCube.save).
+    """
+    return _load(filename)[0]
+
+
+def build_cube(source):
+    """
+    Returns the full TripCube of a condensed file (from its trip table) or of
+    a partitioned city directory (from the tables of all its partitions).
+    """
+    if os.path.isdir(source):
+        from .partition import partition_table
+        table = partition_table(source)
+    else:
+        from .table import load_trip_table
+        table = load_trip_table(source)
+    return TripCube.from_table(table)
+
+
+def write_cube(source):
+    """
+    Builds the cube of a condensed file or partitioned city directory, saves
+    it as its cube_file and returns it.
+    """
+    stamp = file_stamp(source)
+    cube = build_cube(source)
+    cube.save(cube_file(source), list(stamp))
+    return cube
+
+
+def read_cube(source):
+    """
+    Returns the saved cube of a condensed file or partitioned city directory,
+    or None if there is none or it was built from a different version.
+    """
+    try:
+        cube, stamp = _load(cube_file(source))
+        current = file_stamp(source)
+    except (OSError, ValueError, KeyError):
+        return None
+    if stamp is None or tuple(stamp) != current:
+        return None
+    return cube
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('sources', nargs='+',
+                        help='condensed trip files or partitioned city directories')
+    args = parser.parse_args(argv)
+
+    for source in args.sources:
+        cube = write_cube(source)
+        print('{}: {:,} trips, {} ({:,} bytes)'.format(
+            cube_file(source), cube.count(), cube,
+            os.path.getsize(cube_file(source))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Encoded condensed files: day of week and user type stored as integer codes.
+
+The header of an encoded file carries the dictionary of each encoded column,
+e.g. "user_type:Subscriber|Customer", and its rows hold each value's index
+in that list. Plain files have plain column names and no dictionaries, so
+the helpers here read both kinds.
+"""
+import csv
+import os
+import shutil
+
+# condensed columns that are encoded in the encoded output mode
+ENCODED_COLUMNS = ('day_of_week', 'user_type')
+
+
+def encoded_fieldnames(names, dictionaries):
+    """
+    Returns the header of an encoded file with the given column names and
+    {column: list of values} dictionaries.
+    """
+    return ['{}:{}'.format(name, '|'.join(dictionaries[name]))
+            if name in dictionaries else name for name in names]
+
+
+def parse_fieldnames(header):
+    """
+    Splits the header of a condensed file into its column names and the
+    {column: tuple of values} dictionaries of its encoded columns (empty for
+    a plain file).
+    """
+    names = []
+    dictionaries = {}
+    for field in header:
+        name, encoded, values = field.partition(':')
+        names.append(name)
+        if encoded:
+            dictionaries[name] = tuple(values.split('|'))
+    return names, dictionaries
+
+
+def merge_dictionaries(file_dictionaries):
+    """
+    Returns the dictionaries condense_data would have built for the rows of
+    several encoded files (or parts of one) in order: each file's new values
+    appended in order.
+    """
+    merged = {name: list(values) for name, values in file_dictionaries[0].items()}
+    for dictionaries in file_dictionaries[1:]:
+        for name, values in dictionaries.items():
+            merged[name].extend(value for value in values if value not in merged[name])
+    return merged
+
+
+def read_fieldnames(filename):
+    """
+    Returns the column names and dictionaries of a condensed file (see
+    parse_fieldnames), or ([], {}) if it is empty.
+    """
+    with open(filename, 'r') as f_in:
+        header = next(csv.reader(f_in), None)
+    return parse_fieldnames(header or [])
+
+
+def stored_value(dictionaries, column, value):
+    """
+    Returns the string a condensed row holds in column for value: the value's
+    code in an encoded file, the value itself in a plain one. Returns None if
+    an encoded column has no such value.
+    """
+    values = dictionaries.get(column)
+    if values is None:
+        return value
+    if value not in values:
+        return None
+    return str(values.index(value))
+
+
+class CategoryEncoder(object):
+    """
+    Assigns integer codes to the values of one column, starting from a known
+    list of values and appending any new value the first time it is seen.
+    """
+
+    def __init__(self, values):
+        self.values = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, items):
+        """
+        Returns the codes of a list of values.
+        """
+        codes = self._codes
+        if all(item in codes for item in set(items)):
+            return [codes[item] for item in items]
+        for item in items:
+            if item not in codes:
+                codes[item] = len(self.values)
+                self.values.append(item)
+        return [codes[item] for item in items]
+
+
+def replace_header(filename, header):
+    """
+    Rewrites the header row of a csv file, copying the rows after it, and
+    returns by how many bytes the header grew.
+    """
+    tmp_file = filename + '.tmp'
+    with open(filename, 'rb') as f_in, open(tmp_file, 'w') as f_out:
+        old_length = len(f_in.readline())
+        csv.writer(f_out).writerow(header)
+        f_out.flush()
+        new_length = f_out.tell()
+        shutil.copyfileobj(f_in, f_out.buffer, 1 << 20)
+    os.replace(tmp_file, filename)
+    return new_length - old_length
+
+
+def export_csv(filename, out_file):
+    """
+    Writes an encoded condensed file out as a plain, human readable one, with
+    the same contents condense_data writes without encoding. A plain file is
+    copied as it is.
+    """
+    with open(filename, 'r') as f_in, open(out_file, 'w') as f_out:
+        reader = csv.reader(f_in)
+        header = next(reader, None)
+        if header is None:
+            return
+        names, dictionaries = parse_fieldnames(header)
+        writer = csv.writer(f_out)
+        writer.writerow(names)
+        decoders = [(i, dictionaries[name]) for i, name in enumerate(names)
+                    if name in dictionaries]
+        for row in reader:
+            for i, values in decoders:
+                row[i] = values[int(row[i])]
+            writer.writerow(row)
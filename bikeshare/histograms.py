@@ -0,0 +1,94 @@
+"""
+Binned trip counts computed straight from TripTable columns, for plotting.
+
+Every histogram is split by user type: row 0 counts subscribers and row 1
+customers (the USER_TYPES codes). Memory is proportional to the number of
+bins, not the number of trips.
+"""
+import os
+
+import numpy as np
+
+from .condense import CONDENSED_COLUMNS
+from .table import TripTable, load_trip_table
+from .trips import USER_TYPES
+
+# number of categories of each table column that can be binned by value
+CATEGORY_BINS = {'month': 12, 'hour': 24, 'day_of_week': 7}
+
+# first value of each category column (months are numbered from 1)
+CATEGORY_FIRST = {'month': 1, 'hour': 0, 'day_of_week': 0}
+
+
+def duration_histogram(table, bins=10, range=None):
+    """
+    Counts the trip durations of a TripTable in bins equal-width bins over
+    range, (min, max) of the durations by default. Like numpy.histogram,
+    every bin is half-open except the last, which includes range's upper
+    end, and durations outside range are not counted.
+
+    Returns the bin edges (bins + 1 floats) and a (2, bins) array of counts
+    per user type.
+    """
+    durations = table.duration
+    if range is None:
+        if len(durations):
+            range = (float(durations.min()), float(durations.max()))
+        else:
+            range = (0.0, 1.0)
+    low, high = range
+    if high <= low:
+        high = low + 1.0
+    edges = np.linspace(low, high, bins + 1)
+
+    inside = (durations >= low) & (durations <= high)
+    index = ((durations[inside] - low) * (bins / (high - low))).astype(np.intp)
+    # the upper end (and any rounding past it) belongs to the last bin
+    np.minimum(index, bins - 1, out=index)
+    index += table.user_type[inside].astype(np.intp) * bins
+    counts = np.bincount(index, minlength=len(USER_TYPES) * bins)
+    return edges, counts.reshape(len(USER_TYPES), bins)
+
+
+def category_histogram(table, column):
+    """
+    Counts the trips of a TripTable per value of a category column ('month',
+    'hour' or 'day_of_week'). Returns a (2, n) array of counts per user type;
+    column i counts the i-th value (January, midnight or Monday for i = 0).
+    """
+    try:
+        n_bins = CATEGORY_BINS[column]
+    except KeyError:
+        raise ValueError('not a category column: {}'.format(column))
+    values = getattr(table, column).astype(np.intp) - CATEGORY_FIRST[column]
+    index = table.user_type.astype(np.intp) * n_bins + values
+    counts = np.bincount(index, minlength=len(USER_TYPES) * n_bins)
+    return counts[:len(USER_TYPES) * n_bins].reshape(len(USER_TYPES), n_bins)
+
+
+def trip_histograms(filename, duration_bins=15, duration_range=(0, 75), months=None):
+    """
+    Returns every histogram the plots need for a condensed file, from its
+    (cached) trip table:
+
+    - 'duration_edges', 'durations': duration_histogram over duration_range
+    - 'month', 'hour', 'day_of_week': category_histogram of each column
+
+    filename can also be a partitioned city directory (see
+    condense_partitioned). With months (a list of month numbers), only the
+    trips of those months are counted; of a partitioned city, only their
+    partitions are read.
+    """
+    if os.path.isdir(filename):
+        from .partition import partition_table
+        table = partition_table(filename, months)
+    else:
+        table = load_trip_table(filename)
+        if months is not None:
+            keep = np.isin(table.month, list(months))
+            table = TripTable(*[getattr(table, name)[keep] for name in CONDENSED_COLUMNS])
+    edges, counts = duration_histogram(table, duration_bins, duration_range)
+    histograms = {'duration_edges': edges, 'durations': counts}
+    for column in CATEGORY_BINS:
+        histograms[column] = category_histogram(table, column)
+    return histograms
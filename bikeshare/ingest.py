@@ -0,0 +1,310 @@
+"""
+Ingesting many raw shard files per city (e.g. one per month) concurrently.
+
+    python -m bikeshare.ingest raw/ condensed/ --workers 8 --merge
+
+Shards are found under the data directory either below a directory named
+after the city ("raw/NYC/201607-citibike.csv") or by the city prefix of their name
+("raw/NYC-CitiBike-201607.csv"), plain or compressed ("...csv.gz"); only
+registered cities are picked up, and condensed "-Summary.csv" files are
+left alone. Each shard is condensed on a process pool into its own output
+under out_dir/<city>/, named after its path under the data directory, while
+the event loop keeps the next shards' I/O going. A state file in out_dir
+records every finished shard, so an interrupted run can simply be started
+again: shards whose input has not changed since are skipped.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+
+from .compressed import strip_compression_suffix
+from .condense import CONDENSED_COLUMNS, condense_data
+from .encoding import encoded_fieldnames, merge_dictionaries, parse_fieldnames
+from .lines import file_stamp
+from .schemas import CITY_SCHEMAS
+from .trips import city_of
+
+INGEST_STATE = 'ingest-state.json'
+
+
+def discover_shards(data_dir, cities=None, exclude=None):
+    """
+    Returns {city: sorted list of shard files} for the raw csv files under
+    data_dir, optionally only for the given cities. The exclude directory
+    (the output directory, if it is inside data_dir) is not searched, and
+    condensed files ("...-Summary.csv") are not raw shards.
+    """
+    shards = {}
+    exclude = os.path.abspath(exclude) if exclude else None
+    for directory, subdirectories, filenames in os.walk(data_dir):
+        subdirectories[:] = [name for name in subdirectories
+                             if os.path.abspath(os.path.join(directory, name)) != exclude]
+        parents = [name for name in os.path.relpath(directory, data_dir).split(os.sep)
+                   if name in CITY_SCHEMAS]
+        for filename in filenames:
+            name = strip_compression_suffix(filename)
+            if not name.endswith('.csv') or name.endswith('-Summary.csv'):
+                continue
+            city = parents[-1] if parents else city_of(filename)
+            if city not in CITY_SCHEMAS or (cities and city not in cities):
+                continue
+            shards.setdefault(city, []).append(os.path.join(directory, filename))
+    return {city: sorted(files) for city, files in shards.items()}
+
+
+def shard_output(out_dir, city, shard, data_dir):
+    """
+    Returns the condensed output file of a shard: its path under data_dir
+    (without the city's directory) under out_dir/<city>/, e.g.
+    "raw/NYC/a/2016.csv" is condensed into "out/NYC/a/2016-Summary.csv".
+    """
+    parts = os.path.relpath(shard, data_dir).split(os.sep)
+    name = os.path.splitext(strip_compression_suffix(parts[-1]))[0] + '-Summary.csv'
+    return os.path.join(out_dir, city, *[part for part in parts[:-1] if part != city],
+                        name)
+
+
+def shard_outputs(shards, data_dir, out_dir):
+    """
+    Returns {shard: output file} for the {city: shard files} of
+    discover_shards, and {shard: error} for the shards whose output another
+    shard would also be condensed into (e.g. "x.csv" and "x.csv.gz").
+    """
+    owners = {}
+    for city, files in shards.items():
+        for shard in files:
+            owners.setdefault(shard_output(out_dir, city, shard, data_dir), []).append(shard)
+    outputs = {}
+    errors = {}
+    for out_file, owned in owners.items():
+        for shard in owned:
+            outputs[shard] = out_file
+            if len(owned) > 1:
+                errors[shard] = '{} would also be condensed into {}'.format(
+                    ', '.join(other for other in owned if other != shard), out_file)
+    return outputs, errors
+
+
+def _prefetch(filename):
+    """
+    Asks the OS to start reading a file into the page cache, so the worker
+    that condenses it does not wait on the disk.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def _condense_shard(in_file, out_file, city, encoded):
+    """
+    Condenses one shard (in a worker process); returns its rows and seconds.
+    """
+    from .instrument import CondenseMetrics
+
+    metrics = CondenseMetrics(city=city)
+    condense_data(in_file, out_file, city, binary_out=True, metrics=metrics,
+                  encoded=encoded)
+    return metrics.rows, metrics.seconds
+
+
+def _load_state(state_file):
+    try:
+        with open(state_file, 'r') as f_in:
+            return json.load(f_in)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state_file, state):
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w') as f_out:
+        json.dump(state, f_out, indent=1, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def print_progress(done, total, shard, result):
+    """
+    Default progress callback of ingest_async: one line per finished shard.
+    """
+    if result['error']:
+        status = 'failed: {}'.format(result['error'])
+    elif result['skipped']:
+        status = 'up to date'
+    else:
+        status = '{} rows in {:.2f}s'.format(result['rows'], result['seconds'])
+    print('[{}/{}] {}: {}'.format(done, total, shard, status))
+
+
+async def ingest_async(data_dir, out_dir, cities=None, workers=None, max_pending=None,
+                       encoded=False, progress=print_progress):
+    """
+    Condenses every shard under data_dir that is new or changed since the last
+    run into out_dir (see the module docstring). At most max_pending shards
+    (default: twice the number of workers) are being prefetched or condensed
+    at any time. progress(done, total, shard, result) is called as each shard
+    finishes.
+
+    Returns {shard: result} with the city, output file, rows, seconds, and
+    whether the shard was skipped or failed ('error', None on success). A
+    failing shard does not stop the others. Shards that would be condensed
+    into the same output file all fail without being condensed.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    shards = await asyncio.to_thread(discover_shards, data_dir, cities, out_dir)
+    state_file = os.path.join(out_dir, INGEST_STATE)
+    state = await asyncio.to_thread(_load_state, state_file)
+    outputs, collisions = shard_outputs(shards, data_dir, out_dir)
+    workers = workers or os.cpu_count() or 1
+    slots = asyncio.Semaphore(max_pending or 2 * workers)
+    state_lock = asyncio.Lock()
+    total = sum(len(files) for files in shards.values())
+    results = {}
+
+    async def ingest_shard(executor, city, shard):
+        out_file = outputs[shard]
+        result = {'city': city, 'out_file': out_file, 'rows': 0, 'seconds': 0.0,
+                  'skipped': False, 'error': None}
+        try:
+            if shard in collisions:
+                raise ValueError(collisions[shard])
+            size, mtime_ns = await asyncio.to_thread(file_stamp, shard)
+            done = state.get(shard)
+            if (done is not None and (done['size'], done['mtime_ns']) == (size, mtime_ns) and
+                    done['out_file'] == out_file and os.path.exists(out_file)):
+                result.update(rows=done['rows'], skipped=True)
+            else:
+                async with slots:
+                    await asyncio.to_thread(os.makedirs, os.path.dirname(out_file),
+                                            exist_ok=True)
+                    await asyncio.to_thread(_prefetch, shard)
+                    rows, seconds = await loop.run_in_executor(
+                        executor, _condense_shard, shard, out_file, city, encoded)
+                result.update(rows=rows, seconds=seconds)
+                async with state_lock:
+                    state[shard] = {'city': city, 'size': size, 'mtime_ns': mtime_ns,
+                                    'out_file': out_file, 'rows': rows}
+                    await asyncio.to_thread(_save_state, state_file, dict(state))
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+        results[shard] = result
+        if progress is not None:
+            progress(len(results), total, shard, result)
+
+    await asyncio.to_thread(os.makedirs, out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        await asyncio.gather(*[ingest_shard(executor, city, shard)
+                               for city, files in sorted(shards.items())
+                               for shard in files])
+    return results
+
+
+def ingest(data_dir, out_dir, **kwargs):
+    """
+    Runs ingest_async to completion; see there for the arguments.
+    """
+    return asyncio.run(ingest_async(data_dir, out_dir, **kwargs))
+
+
+def merge_shards(shard_files, out_file):
+    """
+    Joins condensed shard files, in the given order, into one condensed file
+    and returns the number of bytes of rows written. Shards with the header
+    of the merged file are copied as they are. Encoded shards with other
+    dictionaries (e.g. a user type only some shards have) have their codes
+    rewritten to the merged dictionaries, and if plain and encoded shards are
+    mixed, the merged file is plain and the encoded shards are decoded.
+    """
+    shards = []
+    for shard_file in shard_files:
+        with open(shard_file, 'r') as f_in:
+            names, dictionaries = parse_fieldnames(next(csv.reader(f_in), None)
+                                                   or CONDENSED_COLUMNS)
+        if names != CONDENSED_COLUMNS:
+            raise ValueError('columns of {} differ'.format(shard_file))
+        shards.append((shard_file, dictionaries))
+
+    if shards and all(dictionaries.keys() == shards[0][1].keys() and dictionaries
+                      for _, dictionaries in shards):
+        merged = merge_dictionaries([dictionaries for _, dictionaries in shards])
+    else:
+        merged = {}
+
+    written = 0
+    with open(out_file, 'w') as f_out:
+        trip_writer = csv.writer(f_out)
+        trip_writer.writerow(encoded_fieldnames(CONDENSED_COLUMNS, merged))
+        for shard_file, dictionaries in shards:
+            # each code of the shard -> the code (or value) the merged file holds
+            recode = {}
+            for column, name in enumerate(CONDENSED_COLUMNS):
+                if name in dictionaries:
+                    recode[column] = {
+                        str(code): str(merged[name].index(value)) if merged else value
+                        for code, value in enumerate(dictionaries[name])}
+            f_out.flush()
+            start = f_out.tell()
+            with open(shard_file, 'rb') as f_in:
+                f_in.readline()
+                if all(codes == {code: code for code in codes}
+                       for codes in recode.values()):
+                    shutil.copyfileobj(f_in, f_out.buffer, 1 << 20)
+                else:
+                    for row in csv.reader(line.decode('utf-8') for line in f_in):
+                        for column, codes in recode.items():
+                            row[column] = codes[row[column]]
+                        trip_writer.writerow(row)
+                    f_out.flush()
+            written += f_out.tell() - start
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('data_dir', help='directory searched for raw shard files')
+    parser.add_argument('out_dir', help='directory for the condensed shards')
+    parser.add_argument('--cities', nargs='+', help='only ingest these cities')
+    parser.add_argument('--workers', type=int, help='condensing processes')
+    parser.add_argument('--max-pending', type=int,
+                        help='shards prefetched or condensing at once')
+    parser.add_argument('--encoded', action='store_true',
+                        help='write encoded condensed files')
+    parser.add_argument('--merge', action='store_true',
+                        help='also join each city\'s shards into <out_dir>/<city>-Summary.csv')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = ingest(args.data_dir, args.out_dir, cities=args.cities,
+                     workers=args.workers, max_pending=args.max_pending,
+                     encoded=args.encoded)
+    failed = [shard for shard, result in results.items() if result['error']]
+    print('{} shards, {} rows, {} failed, {:.2f}s'.format(
+        len(results), sum(result['rows'] for result in results.values()),
+        len(failed), time.perf_counter() - started))
+
+    if args.merge:
+        by_city = {}
+        for shard, result in sorted(results.items()):
+            by_city.setdefault(result['city'], []).append(result)
+        for city, city_results in sorted(by_city.items()):
+            if any(result['error'] for result in city_results):
+                # a merged file without some of the shards would look complete
+                print('{}: not merged, some of its shards failed'.format(city))
+                continue
+            merge_shards([result['out_file'] for result in city_results],
+                         os.path.join(args.out_dir, city + '-Summary.csv'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
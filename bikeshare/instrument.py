@@ -0,0 +1,173 @@
+"""
+Optional per-stage instrumentation of condense runs, and cProfile wrapping.
+
+Instrumentation is off unless a CondenseMetrics is passed in: the pipeline
+then times each stage once per batch, so the cost stays negligible either
+way.
+"""
+import json
+import time
+
+# condense stages, in pipeline order: csv parsing (on the reader thread), time
+# spent waiting for it, the three column conversions, and writing
+CONDENSE_STAGES = ('read', 'wait', 'duration', 'start_time', 'user_type', 'write')
+
+
+class CondenseMetrics(object):
+    """
+    Cumulative time, call (batch) count and rows per stage of a condense run,
+    rows written over time, and bytes read and written. labels (e.g.
+    city='NYC') are attached to every exported value.
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.stages = {}
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.seconds = None
+        self.samples = []
+        self._started = time.perf_counter()
+
+    def record(self, stage, seconds, rows=0):
+        """
+        Adds one call of stage that took seconds and handled rows rows.
+        """
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = [0.0, 0, 0]
+        totals[0] += seconds
+        totals[1] += 1
+        totals[2] += rows
+
+    def timed(self, stage, batches):
+        """
+        Yields the batches of an iterator, recording the time it takes to
+        produce each one under stage.
+        """
+        batches = iter(batches)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            batch = next(batches, None)
+            if batch is None:
+                return
+            self.record(stage, clock() - started, len(batch))
+            yield batch
+
+    def progress(self, rows):
+        """
+        Records that rows more rows have been written, for the rows/sec series.
+        """
+        self.rows += rows
+        self.samples.append((time.perf_counter() - self._started, self.rows))
+
+    def finish(self, bytes_read=0, bytes_written=0):
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+        self.seconds = time.perf_counter() - self._started
+
+    def merge(self, other):
+        """
+        Adds the stage totals, rows and bytes of another run (e.g. a chunk
+        condensed by a worker) into this one and returns it.
+        """
+        for stage, (seconds, calls, rows) in other.stages.items():
+            totals = self.stages.setdefault(stage, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+            totals[2] += rows
+        self.progress(other.rows)
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        return self
+
+    def to_dict(self):
+        return {'labels': self.labels, 'seconds': self.seconds, 'rows': self.rows,
+                'rows_per_sec': self.rows / self.seconds if self.seconds else None,
+                'bytes_read': self.bytes_read, 'bytes_written': self.bytes_written,
+                'stages': {stage: {'seconds': seconds, 'calls': calls, 'rows': rows}
+                           for stage, (seconds, calls, rows) in self.stages.items()},
+                'samples': [list(sample) for sample in self.samples]}
+
+    @classmethod
+    def from_dict(cls, values):
+        metrics = cls(**values['labels'])
+        metrics.seconds = values['seconds']
+        metrics.rows = values['rows']
+        metrics.bytes_read = values['bytes_read']
+        metrics.bytes_written = values['bytes_written']
+        metrics.stages = {stage: [totals['seconds'], totals['calls'], totals['rows']]
+                          for stage, totals in values['stages'].items()}
+        metrics.samples = [tuple(sample) for sample in values['samples']]
+        return metrics
+
+
+def write_metrics_json(runs, filename):
+    """
+    Writes a list of CondenseMetrics to filename as JSON.
+    """
+    with open(filename, 'w') as f_out:
+        json.dump([metrics.to_dict() for metrics in runs], f_out, indent=2)
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"'))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+def write_prometheus(runs, filename):
+    """
+    Writes a list of CondenseMetrics to filename in the Prometheus text
+    exposition format, e.g. for the node exporter's textfile collector.
+    """
+    families = (
+        ('bikeshare_condense_stage_seconds_total', 'counter',
+         'Cumulative seconds spent in each condense stage.'),
+        ('bikeshare_condense_stage_calls_total', 'counter',
+         'Number of batches handled by each condense stage.'),
+        ('bikeshare_condense_rows_total', 'counter', 'Rows condensed.'),
+        ('bikeshare_condense_bytes_read_total', 'counter', 'Raw bytes read.'),
+        ('bikeshare_condense_bytes_written_total', 'counter', 'Condensed bytes written.'),
+        ('bikeshare_condense_seconds', 'gauge', 'Wall time of the last condense run.'),
+        ('bikeshare_condense_rows_per_second', 'gauge',
+         'Rows per second of the last condense run.'))
+    lines = []
+    for name, kind, text in families:
+        lines.append('# HELP {} {}'.format(name, text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for metrics in runs:
+            values = metrics.to_dict()
+            if name.startswith('bikeshare_condense_stage_'):
+                index = 0 if 'seconds' in name else 1
+                for stage, totals in sorted(metrics.stages.items()):
+                    lines.append('{}{} {}'.format(name, _labels(metrics.labels, stage=stage),
+                                                  totals[index]))
+                continue
+            value = {'bikeshare_condense_rows_total': values['rows'],
+                     'bikeshare_condense_bytes_read_total': values['bytes_read'],
+                     'bikeshare_condense_bytes_written_total': values['bytes_written'],
+                     'bikeshare_condense_seconds': values['seconds'],
+                     'bikeshare_condense_rows_per_second': values['rows_per_sec']}[name]
+            if value is not None:
+                lines.append('{}{} {}'.format(name, _labels(metrics.labels), value))
+    with open(filename, 'w') as f_out:
+        f_out.write('\n'.join(lines) + '\n')
+
+
+def run_profiled(stats_file, function, *args, **kwargs):
+    """
+    Calls function(*args, **kwargs) under cProfile, dumps the profile to
+    stats_file (readable with pstats) and returns the function's result.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(stats_file)
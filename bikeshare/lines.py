@@ -0,0 +1,132 @@
+"""
+Line-aligned byte access to csv files, used to split, resume and fingerprint them.
+"""
+import hashlib
+import os
+
+from .compressed import detect_codec, open_binary
+
+
+def file_stamp(path):
+    """
+    Returns the (size, mtime) stamp of a data file, or of the manifest of a
+    partitioned city directory, which changes whenever its data does. Caches
+    and summaries built from a file record its stamp and are stale once the
+    file's stamp differs.
+    """
+    if os.path.isdir(path):
+        from .partition import PARTITION_MANIFEST
+        path = os.path.join(path, PARTITION_MANIFEST)
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def split_lines(in_file, n_chunks):
+    """
+    Splits the data rows of a csv file (everything after the header) into at
+    most n_chunks byte ranges of roughly equal size. Every range starts at the
+    beginning of a line and ends just after a newline (or at the end of the
+    file), so ranges can be condensed independently. Returns the header line
+    and a list of (start, end) byte offsets.
+
+    Rows must not contain quoted newlines, which holds for all of the city
+    feeds.
+
+    A compressed file cannot be split by offset: it is one range over its
+    decompressed bytes, with None as the end (see read_lines).
+    """
+    if detect_codec(in_file) is not None:
+        with open_binary(in_file) as f_in:
+            header = f_in.readline()
+        return header.decode('utf-8'), [(len(header), None)]
+    size = os.path.getsize(in_file)
+    with open(in_file, 'rb') as f_in:
+        header = f_in.readline()
+        data_start = f_in.tell()
+        bounds = [data_start]
+        step = max((size - data_start) // max(n_chunks, 1), 1)
+        for i in range(1, n_chunks):
+            guess = data_start + i * step
+            if guess <= bounds[-1] or guess >= size:
+                continue
+            # move forward to the start of the next line
+            f_in.seek(guess - 1)
+            f_in.readline()
+            if f_in.tell() < size and f_in.tell() > bounds[-1]:
+                bounds.append(f_in.tell())
+        bounds.append(size)
+    ranges = [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+    return header.decode('utf-8'), ranges
+
+
+def open_at(in_file, start):
+    """
+    Opens a plain or compressed file (see open_binary) for reading bytes from
+    offset start on; the offsets of a compressed file are those of its
+    decompressed bytes.
+    """
+    f_in = open_binary(in_file)
+    if f_in.seekable():
+        f_in.seek(start)
+    else:
+        skipped = 0
+        while skipped < start:
+            step = len(f_in.read(min(start - skipped, 1 << 20)))
+            if not step:
+                break
+            skipped += step
+    return f_in
+
+
+def read_lines(in_file, start, end):
+    """
+    Yields the decoded lines of in_file between byte offsets start and end
+    (the end of the file if end is None). The offsets of a compressed file
+    are those of its decompressed bytes.
+    """
+    with open_at(in_file, start) as f_in:
+        position = start
+        while end is None or position < end:
+            line = f_in.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+def line_hash(line):
+    """
+    Returns the fingerprint of a line of raw bytes.
+    """
+    return hashlib.sha1(line).hexdigest()
+
+
+def complete_end(in_file, size):
+    """
+    Returns the byte offset just after the last newline of in_file, so a row
+    that is still being appended is left for the next run.
+    """
+    with open(in_file, 'rb') as f_in:
+        position = size
+        while position > 0:
+            step = min(position, 1 << 16)
+            f_in.seek(position - step)
+            block = f_in.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def last_line(in_file, start, end):
+    """
+    Returns the start offset and hash of the last line of in_file that ends at
+    byte offset end (lines start no earlier than start).
+    """
+    with open(in_file, 'rb') as f_in:
+        tail_start = max(start, end - (1 << 16))
+        f_in.seek(tail_start)
+        tail = f_in.read(end - tail_start)
+    newline = tail.rfind(b'\n', 0, len(tail) - 1)
+    return tail_start + newline + 1, line_hash(tail[newline + 1:])
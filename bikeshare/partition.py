@@ -0,0 +1,258 @@
+"""
+Condensed trips partitioned by month (and optionally user type), with a manifest.
+
+A city's partitioned output is a directory holding one condensed file per
+partition, e.g. "NYC/month=07/trips.csv" or, split by user type as well,
+"NYC/month=07/user_type=Subscriber/trips.csv", and a manifest.json listing
+every partition with its number of rows and its TripPartials. Whole-city
+summaries are answered from the manifest alone, month-level reads open only
+the partitions of those months, and old months are dropped by deleting their
+partitions.
+"""
+import csv
+import json
+import os
+
+from .compressed import open_input
+from .condense import (CONDENSE_BATCH_ROWS, CONDENSE_BUFFER_BYTES, CONDENSED_COLUMNS,
+                       condense_batches)
+from .lines import file_stamp
+from .store import TripPartial, aggregates_from_partials, partials_from_rows
+from .trips import DAY_NAMES
+
+PARTITION_MANIFEST = 'manifest.json'
+
+# the file of each partition, inside its directory
+PARTITION_FILE = 'trips.csv'
+
+
+def partition_path(month, user_type=None):
+    """
+    Returns the path of a partition's file, relative to the city directory.
+    """
+    parts = ['month={:02d}'.format(month)]
+    if user_type is not None:
+        parts.append('user_type={}'.format(user_type))
+    return os.path.join(*(parts + [PARTITION_FILE]))
+
+
+def _save_manifest(city_dir, manifest):
+    filename = os.path.join(city_dir, PARTITION_MANIFEST)
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w') as f_out:
+        json.dump(manifest, f_out)
+    os.replace(tmp_file, filename)
+
+
+def _remove_partition(city_dir, path):
+    """
+    Deletes a partition's file, the caches next to it (trip cache, zone map
+    and cube) and its directories, once they are empty.
+    """
+    filename = os.path.join(city_dir, path)
+    stem = os.path.splitext(filename)[0]
+    for name in (filename, stem + '.trips', stem + '.zones', stem + '.cube.npz'):
+        if os.path.exists(name):
+            os.remove(name)
+    directory = os.path.dirname(filename)
+    while os.path.abspath(directory) != os.path.abspath(city_dir):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def condense_partitioned(in_file, out_dir, city, by_user_type=False, binary_out=False,
+                         batch_size=CONDENSE_BATCH_ROWS,
+                         max_buffer_bytes=CONDENSE_BUFFER_BYTES):
+    """
+    Condenses a raw city file, like condense_data, into one plain condensed
+    file per month under out_dir/<city>/ (per month and user type with
+    by_user_type) and writes the city's manifest. Rows keep their input order
+    within each partition. The trips are split by user type the way the
+    summaries count them: anything that is not a 'Subscriber' is a
+    'Customer'.
+
+    Partitions of an earlier run that are not written again are removed. With
+    binary_out, the trip cache of every partition is written as well.
+
+    Returns the manifest (see read_manifest).
+    """
+    city_dir = os.path.join(out_dir, city)
+    os.makedirs(city_dir, exist_ok=True)
+    previous = read_manifest(city_dir)
+    day_codes = {name: code for code, name in enumerate(DAY_NAMES)}
+    outputs = {}
+
+    def partition(month, user_type):
+        key = (month, user_type if by_user_type else None)
+        output = outputs.get(key)
+        if output is None:
+            path = partition_path(*key)
+            filename = os.path.join(city_dir, path)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            f_out = open(filename + '.tmp', 'w')
+            writer = csv.writer(f_out)
+            writer.writerow(CONDENSED_COLUMNS)
+            output = outputs[key] = {
+                'path': path, 'file': f_out, 'writer': writer, 'rows': [],
+                'partials': {'Subscriber': TripPartial(), 'Customer': TripPartial()}}
+        return output
+
+    try:
+        with open_input(in_file) as f_in:
+            trip_reader = csv.reader(f_in)
+            header = next(trip_reader, None)
+            batches = [] if header is None else condense_batches(
+                trip_reader, header, city, batch_size, max_buffer_bytes)
+            for batch in batches:
+                for row in zip(*batch):
+                    duration, month, hour, day_of_week, user_type = row
+                    user_type = 'Subscriber' if user_type == 'Subscriber' else 'Customer'
+                    output = partition(month, user_type)
+                    output['rows'].append(row)
+                    output['partials'][user_type].add(duration, month, hour,
+                                                      day_codes[day_of_week])
+                for output in outputs.values():
+                    if output['rows']:
+                        output['writer'].writerows(output['rows'])
+                        output['rows'] = []
+    finally:
+        for output in outputs.values():
+            output['file'].close()
+
+    partitions = []
+    for (month, user_type), output in sorted(outputs.items(),
+                                             key=lambda item: (item[0][0], item[0][1] or '')):
+        filename = os.path.join(city_dir, output['path'])
+        os.replace(filename + '.tmp', filename)
+        if binary_out:
+            from .table import load_trip_table
+            load_trip_table(filename)
+        size, mtime_ns = file_stamp(filename)
+        partials = output['partials']
+        partitions.append({'path': output['path'], 'month': month, 'user_type': user_type,
+                           'rows': partials['Subscriber'].count + partials['Customer'].count,
+                           'size': size, 'mtime_ns': mtime_ns,
+                           'partials': {name: partial.to_dict()
+                                        for name, partial in partials.items()}})
+
+    in_size, in_mtime_ns = file_stamp(in_file)
+    manifest = {'city': city, 'by_user_type': by_user_type,
+                'source': {'file': os.path.abspath(in_file), 'size': in_size,
+                           'mtime_ns': in_mtime_ns},
+                'partitions': partitions}
+    _save_manifest(city_dir, manifest)
+    if previous is not None:
+        written = {entry['path'] for entry in partitions}
+        for entry in previous['partitions']:
+            if entry['path'] not in written:
+                _remove_partition(city_dir, entry['path'])
+    return manifest
+
+
+def read_manifest(city_dir):
+    """
+    Returns the manifest of a partitioned city directory, or None if it has
+    none: a dictionary with the city, whether it is split by user type, the
+    size and mtime of the raw file it was condensed from ('source') and the
+    list of partitions. Each partition has its 'path' (relative to
+    city_dir), 'month', 'user_type' (None unless split by user type),
+    'rows', the 'size' and 'mtime_ns' of its file when it was written, and
+    its 'partials' ({user type: TripPartial as a dictionary}).
+    """
+    try:
+        with open(os.path.join(city_dir, PARTITION_MANIFEST), 'r') as f_in:
+            return json.load(f_in)
+    except (OSError, ValueError):
+        return None
+
+
+def _selected(manifest, months=None, user_types=None):
+    if manifest is None:
+        raise ValueError('not a partitioned city directory')
+    return [entry for entry in manifest['partitions']
+            if (months is None or entry['month'] in months) and
+            (user_types is None or entry['user_type'] is None or
+             entry['user_type'] in user_types)]
+
+
+def partition_files(city_dir, months=None, user_types=None):
+    """
+    Returns the files of the partitions of a city directory that hold trips
+    of the given months and user types (all of them by default), in month
+    order. Filtering by user type only skips files when the city is
+    partitioned by user type.
+    """
+    return [os.path.join(city_dir, entry['path'])
+            for entry in _selected(read_manifest(city_dir), months, user_types)]
+
+
+def _partition_partials(city_dir, entry):
+    """
+    Returns a partition's {user type: TripPartial} from the manifest, or
+    folded from its file again if the file changed after the manifest was
+    written.
+    """
+    filename = os.path.join(city_dir, entry['path'])
+    if file_stamp(filename) == (entry['size'], entry['mtime_ns']):
+        return {name: TripPartial.from_dict(values)
+                for name, values in entry['partials'].items()}
+    totals = {'Subscriber': TripPartial(), 'Customer': TripPartial()}
+    with open(filename, 'r') as f_in:
+        for (user_type, _), partial in partials_from_rows(csv.DictReader(f_in)).items():
+            totals[user_type].merge(partial)
+    return totals
+
+
+def manifest_aggregates(city_dir, months=None):
+    """
+    Returns the statistics in TABLE_STATISTICS and the duration sketches of
+    the trips in a partitioned city directory (only of the given months, if
+    any), in the same form as aggregate_trips. They are merged from the
+    partials in the manifest, so no trip rows are read.
+    """
+    totals = {'Subscriber': TripPartial(), 'Customer': TripPartial()}
+    for entry in _selected(read_manifest(city_dir), months):
+        for user_type, partial in _partition_partials(city_dir, entry).items():
+            totals[user_type].merge(partial)
+    return aggregates_from_partials(totals)
+
+
+def partition_table(city_dir, months=None, user_types=None):
+    """
+    Returns one TripTable of the partitions of the given months and user
+    types (see partition_files), loading only those partitions.
+    """
+    import numpy as np
+
+    from .table import TripTable, load_trip_table
+
+    selected = _selected(read_manifest(city_dir), months, user_types)
+    tables = [load_trip_table(os.path.join(city_dir, entry['path']))
+              for entry in selected]
+    if not tables:
+        return TripTable.empty()
+    table = TripTable(*[np.concatenate([getattr(part, name) for part in tables])
+                        for name in CONDENSED_COLUMNS])
+    if user_types is not None and any(entry['user_type'] is None for entry in selected):
+        codes = [0 if user_type == 'Subscriber' else 1 for user_type in user_types]
+        keep = np.isin(table.user_type, codes)
+        table = TripTable(*[getattr(table, name)[keep] for name in CONDENSED_COLUMNS])
+    return table
+
+
+def drop_months(city_dir, months):
+    """
+    Deletes the partitions of the given months from a city directory and its
+    manifest. Returns the number of rows dropped.
+    """
+    manifest = read_manifest(city_dir)
+    dropped = _selected(manifest, months)
+    manifest['partitions'] = [entry for entry in manifest['partitions']
+                              if entry not in dropped]
+    _save_manifest(city_dir, manifest)
+    for entry in dropped:
+        _remove_partition(city_dir, entry['path'])
+    return sum(entry['rows'] for entry in dropped)
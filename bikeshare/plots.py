@@ -0,0 +1,63 @@
+"""
+Plots of the trip statistics. matplotlib is only imported when a plot is drawn.
+
+The plots take pre-binned counts (see histograms), so no per-trip lists are
+built to draw them.
+"""
+from .trips import MONTH_NAMES
+
+
+def _pyplot():
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _binned(plt, edges, counts):
+    # one weighted sample per bin draws the counts as they are
+    plt.hist(edges[:-1], bins=edges, weights=counts)
+
+
+def plot_durations(edges, counts, city):
+    """
+    Plots the distribution of all trip durations of a city, from the bin
+    edges and counts of duration_histogram summed over the user types.
+    """
+    plt = _pyplot()
+    _binned(plt, edges, counts)
+    plt.title('Distribution of Trip Durations for {}'.format(city))
+    plt.xlabel('Duration (m)')
+    plt.show()
+
+
+def plot_durations_by_type(edges, counts, city, user_type, max_riders):
+    """
+    Plots the distribution of trip durations for one user type, from the bin
+    edges and that user type's row of duration_histogram (five-minute bins up
+    to 75 minutes in the report).
+    """
+    plt = _pyplot()
+    _binned(plt, edges, counts)
+    plt.title('Distribution of Trip Durations for {} {}s'.format(city, user_type))
+    plt.xlabel('Duration (m)')
+    plt.ylabel('Number of Riders')
+    plt.axis([edges[0], edges[-1], 0, max_riders])
+    plt.xticks([(low + high) / 2 for low, high in zip(edges[:-1], edges[1:])])
+    plt.grid(True)
+    plt.show()
+
+
+def plot_months(counts, city, user_type, max_riders):
+    """
+    Plots the number of trips per month for one user type, from that user
+    type's row of the 'month' category_histogram.
+    """
+    plt = _pyplot()
+    plt.figure(figsize=(5,5))
+    plt.title('Distribution of Trip Months for {} {}s'.format(city, user_type))
+    plt.xlabel('Month (m)')
+    plt.ylabel('Number of Riders')
+    plt.axis([-1, 12, 0, max_riders])
+    plt.hist(range(12), bins=range(13), weights=counts, align="left")
+    plt.xticks(range(12), [name[:3] for name in MONTH_NAMES])
+    plt.grid(True)
+    plt.show()
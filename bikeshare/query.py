@@ -0,0 +1,202 @@
+"""
+Ad-hoc filter / group by / aggregate queries over trip tables.
+
+    query_trips('NYC-2016-Summary.csv',
+                where={'user_type': 'Customer', 'month': 7, 'hour': (17, 19)},
+                group_by=('day_of_week',), aggregates=('count', 'mean'))
+
+Predicates are evaluated on the typed TripTable columns, block by block, and
+blocks whose per-block min/max show they cannot match are skipped without
+being read.
+"""
+import weakref
+
+import numpy as np
+
+from .table import TripTable, load_trip_table
+from .trips import DAY_NAMES, MONTH_NAMES, USER_TYPES
+
+QUERY_BLOCK_ROWS = 65536
+
+QUERY_AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+# columns that can be grouped by: first code and number of values, and the
+# names the codes stand for (None to report the value itself)
+GROUP_COLUMNS = {'month': (1, 12, None), 'hour': (0, 24, None),
+                 'day_of_week': (0, 7, DAY_NAMES), 'user_type': (0, 2, USER_TYPES)}
+
+FILTER_COLUMNS = ('duration',) + tuple(GROUP_COLUMNS)
+
+# per-block (mins, maxs) of every column of the tables queried so far
+_block_stats = weakref.WeakKeyDictionary()
+
+
+def block_stats(table, block_rows=QUERY_BLOCK_ROWS):
+    """
+    Returns {column: (mins, maxs)} with the smallest and largest value of each
+    column in every block of block_rows rows of a TripTable. Computed once
+    per table and block size.
+    """
+    cached = _block_stats.get(table)
+    if cached is None or cached[0] != block_rows:
+        starts = np.arange(0, len(table), block_rows)
+        stats = {}
+        for column in FILTER_COLUMNS:
+            values = getattr(table, column)
+            if len(values):
+                stats[column] = (np.minimum.reduceat(values, starts),
+                                 np.maximum.reduceat(values, starts))
+            else:
+                stats[column] = (values[:0], values[:0])
+        cached = (block_rows, stats)
+        _block_stats[table] = cached
+    return cached[1]
+
+
+def _code(column, value):
+    names = GROUP_COLUMNS[column][2] if column in GROUP_COLUMNS else None
+    if isinstance(value, str):
+        if column == 'month' and value in MONTH_NAMES:
+            return MONTH_NAMES.index(value) + 1
+        if names is None or value not in names:
+            raise ValueError('unknown {}: {}'.format(column, value))
+        return names.index(value)
+    return value
+
+
+def _predicates(where):
+    """
+    Turns a where dictionary into (column, low, high, values) predicates:
+    a row matches if low <= value <= high and, for a list of values, the value
+    is one of them.
+    """
+    predicates = []
+    for column, condition in (where or {}).items():
+        if column not in FILTER_COLUMNS:
+            raise ValueError('unknown column: {}'.format(column))
+        if isinstance(condition, tuple):
+            low, high = (_code(column, bound) for bound in condition)
+            predicates.append((column, low, high, None))
+        elif isinstance(condition, (list, set, frozenset)):
+            values = sorted(_code(column, value) for value in condition)
+            if not values:
+                return None
+            predicates.append((column, values[0], values[-1], values))
+        else:
+            value = _code(column, condition)
+            predicates.append((column, value, value, None))
+    return predicates
+
+
+def _candidate_blocks(stats, predicates, n_blocks):
+    """
+    Returns a boolean mask of the blocks whose min/max ranges overlap every
+    predicate.
+    """
+    candidates = np.ones(n_blocks, dtype=bool)
+    for column, low, high, values in predicates:
+        mins, maxs = stats[column]
+        if values is None:
+            candidates &= (maxs >= low) & (mins <= high)
+        else:
+            overlaps = np.zeros(n_blocks, dtype=bool)
+            for value in values:
+                overlaps |= (mins <= value) & (maxs >= value)
+            candidates &= overlaps
+    return candidates
+
+
+def query_trips(source, where=None, group_by=(), aggregates=('count',),
+                block_rows=QUERY_BLOCK_ROWS):
+    """
+    Filters the trips of a condensed file (or a TripTable), groups them and
+    aggregates their durations.
+
+    - where: {column: condition} for any of duration, month, hour,
+      day_of_week and user_type. A condition is a single value, an inclusive
+      (low, high) range or a list of values; days, user types and months may
+      be given by name.
+    - group_by: columns to group by (any of the above except duration).
+    - aggregates: any of 'count', 'sum', 'mean', 'min' and 'max'; all but
+      'count' are of the trip duration.
+
+    Returns {group: {aggregate: value}} for every group with at least one
+    matching trip, in column order, where a group is a tuple with the value
+    (or name) of each group_by column; without group_by the only group is ().
+    """
+    table = source if isinstance(source, TripTable) else load_trip_table(source)
+    for name in aggregates:
+        if name not in QUERY_AGGREGATES:
+            raise ValueError('unknown aggregate: {}'.format(name))
+    for column in group_by:
+        if column not in GROUP_COLUMNS:
+            raise ValueError('cannot group by: {}'.format(column))
+
+    # groups are numbered in mixed radix over the group_by columns
+    n_groups = 1
+    for column in group_by:
+        n_groups *= GROUP_COLUMNS[column][1]
+    counts = np.zeros(n_groups, dtype=np.int64)
+    sums = np.zeros(n_groups, dtype=np.float64)
+    mins = np.full(n_groups, np.inf)
+    maxs = np.full(n_groups, -np.inf)
+
+    predicates = _predicates(where)
+    n_blocks = -(-len(table) // block_rows)
+    if predicates is None:
+        candidates = np.zeros(n_blocks, dtype=bool)
+    elif predicates:
+        candidates = _candidate_blocks(block_stats(table, block_rows), predicates,
+                                       n_blocks)
+    else:
+        candidates = np.ones(n_blocks, dtype=bool)
+
+    # scan each run of adjacent candidate blocks as one slice
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], candidates, [False]))))
+    for first, last in zip(edges[::2], edges[1::2]):
+        rows = slice(first * block_rows, last * block_rows)
+        mask = None
+        for column, low, high, values in predicates:
+            column_values = getattr(table, column)[rows]
+            if values is None:
+                matches = (column_values >= low) & (column_values <= high)
+            else:
+                matches = np.isin(column_values, values)
+            mask = matches if mask is None else mask & matches
+        selected = np.flatnonzero(mask) if mask is not None else slice(None)
+
+        durations = table.duration[rows][selected].astype(np.float64)
+        group = np.zeros(len(durations), dtype=np.intp)
+        for column in group_by:
+            first_code, n_values, _ = GROUP_COLUMNS[column]
+            group *= n_values
+            group += getattr(table, column)[rows][selected].astype(np.intp) - first_code
+        counts += np.bincount(group, minlength=n_groups)
+        sums += np.bincount(group, weights=durations, minlength=n_groups)
+        if 'min' in aggregates:
+            np.minimum.at(mins, group, durations)
+        if 'max' in aggregates:
+            np.maximum.at(maxs, group, durations)
+
+    results = {}
+    for index in np.flatnonzero(counts):
+        key = []
+        rest = int(index)
+        for column in reversed(group_by):
+            first_code, n_values, names = GROUP_COLUMNS[column]
+            rest, code = divmod(rest, n_values)
+            key.append(names[code] if names else code + first_code)
+        values = {}
+        for name in aggregates:
+            if name == 'count':
+                values[name] = int(counts[index])
+            elif name == 'sum':
+                values[name] = float(sums[index])
+            elif name == 'mean':
+                values[name] = float(sums[index] / counts[index])
+            elif name == 'min':
+                values[name] = float(mins[index])
+            else:
+                values[name] = float(maxs[index])
+        results[tuple(reversed(key))] = values
+    return results
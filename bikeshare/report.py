@@ -0,0 +1,187 @@
+"""
+Report runner with a persistent, memoized cache of summary results.
+"""
+import inspect
+import json
+import os
+from collections import OrderedDict
+
+from .lines import file_stamp
+
+# default file the report cache is kept in between runs
+REPORT_CACHE = 'report_cache.json'
+
+# results kept before the least recently used ones are evicted
+REPORT_CACHE_ENTRIES = 256
+
+
+def _encode(value):
+    """
+    Returns value as JSON data that _decode turns back into an equal value of
+    the same types, or raises TypeError if it holds anything but None, bools,
+    ints, floats, strings, lists, tuples, dictionaries and NumPy arrays.
+    Tuples, dictionaries and arrays are tagged, so every other JSON object is
+    left free.
+    """
+    if value is None or type(value) in (bool, int, float, str):
+        return value
+    if type(value) is list:
+        return [_encode(item) for item in value]
+    if type(value) is tuple:
+        return {'tuple': [_encode(item) for item in value]}
+    if type(value) is dict:
+        return {'dict': [[_encode(key), _encode(item)] for key, item in value.items()]}
+    if type(value).__name__ == 'ndarray' and value.dtype.kind in 'biuf':
+        return {'array': value.tolist(), 'dtype': value.dtype.str,
+                'shape': list(value.shape)}
+    raise TypeError('cannot cache a {} as JSON'.format(type(value).__name__))
+
+
+def _decode(data):
+    if isinstance(data, list):
+        return [_decode(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    if 'tuple' in data:
+        return tuple(_decode(item) for item in data['tuple'])
+    if 'dict' in data:
+        return {_decode(key): _decode(item) for key, item in data['dict']}
+    import numpy as np
+    return np.array(data['array'], dtype=data['dtype']).reshape(data['shape'])
+
+
+class ReportRunner(object):
+    """
+    Runs summary functions (number_of_trips, trip_histograms, ...) on data
+    files and remembers their results, keyed by the function, the file's path,
+    size and mtime, the other arguments and where the aggregates come from.
+    Asking again for the same result returns it without reading the file;
+    editing the file changes its stamp, so stale results are never returned.
+    At most max_entries results are kept, evicting the least recently used
+    ones.
+
+    On a miss, functions that take precomputed aggregates are given those of
+    the file, computed once per file version and shared by every function run
+    on it. aggregates is either a function of the filename (aggregate_trips by
+    default, which reads the file in a single pass) or an AggregateStore,
+    which folds in the rows it does not have yet and answers from its
+    partials; how far the store has folded the file is part of the key.
+
+    With a cache_file, the results are loaded from it and save() writes them
+    back, as JSON: results other than numbers, strings, lists, tuples,
+    dictionaries and NumPy arrays are only kept for the run. Results are
+    returned as they are cached, so they must not be modified.
+    """
+
+    def __init__(self, cache_file=None, max_entries=REPORT_CACHE_ENTRIES, aggregates=None):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._aggregates = {}
+        if aggregates is None:
+            from .stats import aggregate_trips
+            aggregates = aggregate_trips
+        from .store import AggregateStore
+        if isinstance(aggregates, AggregateStore):
+            self._store = aggregates
+            self._compute_aggregates = aggregates.file_aggregates
+        else:
+            self._store = None
+            self._compute_aggregates = aggregates
+        if cache_file is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r') as f_in:
+                results = [(_decode(key), _decode(result))
+                           for key, result in json.load(f_in)['results']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        stamps = {}
+        for key, result in results:
+            path, stamp = key[1], key[2]
+            if path not in stamps:
+                try:
+                    stamps[path] = file_stamp(path)
+                except OSError:
+                    stamps[path] = None
+            # results of files that changed since are dropped right away
+            if stamps[path] == stamp:
+                self._results[key] = result
+
+    def save(self, cache_file=None):
+        cache_file = cache_file or self.cache_file
+        results = []
+        for key, result in self._results.items():
+            try:
+                results.append([_encode(key), _encode(result)])
+            except TypeError:
+                continue
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w') as f_out:
+            json.dump({'results': results}, f_out)
+        os.replace(tmp_file, cache_file)
+
+    def __len__(self):
+        return len(self._results)
+
+    def _source(self, filename):
+        """
+        Returns what the aggregates of a file are computed from: the name of
+        the aggregates function, or the store with how far it has folded the
+        file (folding in any new rows first).
+        """
+        if self._store is not None:
+            self._store.fold_file(filename)
+            return ('AggregateStore', self._store.filename,
+                    self._store.file_state(filename))
+        source = self._compute_aggregates
+        return '{}.{}'.format(getattr(source, '__module__', None),
+                              getattr(source, '__qualname__', repr(source)))
+
+    def aggregates(self, filename):
+        """
+        Returns the shared aggregates of the current version of a file.
+        """
+        key = (os.path.abspath(filename), file_stamp(filename), self._source(filename))
+        if key not in self._aggregates:
+            # older versions of the file are of no further use
+            for old_key in [old_key for old_key in self._aggregates if old_key[0] == key[0]]:
+                del self._aggregates[old_key]
+            self._aggregates[key] = self._compute_aggregates(filename)
+        return self._aggregates[key]
+
+    def run(self, function, filename, **params):
+        """
+        Returns function(filename, **params), from the cache if it holds the
+        result for the current version of the file.
+        """
+        path = os.path.abspath(filename)
+        key = ('{}.{}'.format(function.__module__, function.__qualname__), path,
+               file_stamp(filename), repr(sorted(params.items())), self._source(filename))
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        self.misses += 1
+        if 'aggregates' in inspect.signature(function).parameters and 'aggregates' not in params:
+            result = function(filename, aggregates=self.aggregates(filename), **params)
+        else:
+            result = function(filename, **params)
+        self._results[key] = result
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        return result
+
+    def report(self, filenames, functions):
+        """
+        Runs every function on every file and returns {filename: {function
+        name: result}}, each file being read at most once for all of them.
+        """
+        return {filename: {function.__name__: self.run(function, filename)
+                           for function in functions}
+                for filename in filenames}
@@ -0,0 +1,149 @@
+"""
+Declarative description of each city's raw feed, compiled into converters.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+
+CitySchema = namedtuple('CitySchema', [
+    'name',               # city name as used in file names and city_info
+    'duration_column',    # raw column holding the trip duration
+    'duration_divisor',   # duration units per minute (60 for seconds)
+    'start_column',       # raw column holding the trip start time
+    'timestamp_format',   # strptime format of the start time
+    'user_type_column',   # raw column holding the user type
+    'user_types',         # raw -> condensed user type, or None to keep as is
+    'default_user_type',  # condensed user type of raw values not in user_types
+])
+
+# start time formats that the fast M/D/YYYY parser in trips handles
+FAST_TIMESTAMP_FORMATS = ('%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S')
+
+CITY_SCHEMAS = {}
+
+
+def register_city(schema):
+    """
+    Adds a city to the registry; this is all it takes to condense a new feed.
+    """
+    CITY_SCHEMAS[schema.name] = schema
+    return schema
+
+
+register_city(CitySchema('NYC', 'tripduration', 60, 'starttime',
+                         '%m/%d/%Y %H:%M:%S', 'usertype', None, None))
+register_city(CitySchema('Chicago', 'tripduration', 60, 'starttime',
+                         '%m/%d/%Y %H:%M', 'usertype', None, None))
+register_city(CitySchema('Washington', 'Duration (ms)', 60000, 'Start date',
+                         '%m/%d/%Y %H:%M', 'Member Type',
+                         {'Registered': 'Subscriber'}, 'Customer'))
+
+
+def city_schema(city):
+    """
+    Returns the registered schema of a city.
+    """
+    try:
+        return CITY_SCHEMAS[city]
+    except KeyError:
+        raise ValueError('unknown city: {}'.format(city))
+
+
+@lru_cache(maxsize=None)
+def start_time_parsers(timestamp_format):
+    """
+    Returns the single and batch start time parsers for a format, each giving
+    month, hour and day of the week like parse_start_time.
+    """
+    from .trips import DAY_NAMES, parse_start_time, parse_start_times
+    if timestamp_format in FAST_TIMESTAMP_FORMATS:
+        return parse_start_time, parse_start_times
+
+    def parse(timestamp):
+        when = datetime.strptime(timestamp, timestamp_format)
+        return when.month, when.hour, DAY_NAMES[when.weekday()]
+
+    def parse_all(timestamps):
+        parsed = [parse(timestamp) for timestamp in timestamps]
+        return ([p[0] for p in parsed], [p[1] for p in parsed],
+                [p[2] for p in parsed])
+    return parse, parse_all
+
+
+def compile_row_converter(schema, header):
+    """
+    Compiles a schema against the header of a raw file into a function that
+    takes one positional csv.reader row and returns its condensed values
+    (duration, month, hour, day of week, user type). Column positions, the
+    duration unit and the user type mapping are all resolved here, once.
+    """
+    fields = itemgetter(header.index(schema.duration_column),
+                        header.index(schema.start_column),
+                        header.index(schema.user_type_column))
+    divisor = schema.duration_divisor
+    parse, _ = start_time_parsers(schema.timestamp_format)
+
+    if schema.user_types is None:
+        def convert(row):
+            duration, start, user_type = fields(row)
+            month, hour, day_of_week = parse(start)
+            return float(duration) / divisor, month, hour, day_of_week, user_type
+    else:
+        user_type_of = schema.user_types.get
+        default = schema.default_user_type
+
+        def convert(row):
+            duration, start, user_type = fields(row)
+            month, hour, day_of_week = parse(start)
+            return (float(duration) / divisor, month, hour, day_of_week,
+                    user_type_of(user_type, default))
+    return convert
+
+
+def compile_batch_converter(schema, header, metrics=None):
+    """
+    Like compile_row_converter, but the returned function takes a batch of
+    rows and returns the five condensed columns as lists. With metrics (a
+    CondenseMetrics), the time spent on each conversion is recorded under
+    the 'duration', 'start_time' and 'user_type' stages.
+    """
+    duration_col = header.index(schema.duration_column)
+    start_col = header.index(schema.start_column)
+    user_col = header.index(schema.user_type_column)
+    divisor = schema.duration_divisor
+    _, parse_all = start_time_parsers(schema.timestamp_format)
+
+    if schema.user_types is None:
+        def user_column(rows):
+            return [row[user_col] for row in rows]
+    else:
+        user_type_of = schema.user_types.get
+        default = schema.default_user_type
+
+        def user_column(rows):
+            return [user_type_of(row[user_col], default) for row in rows]
+
+    def convert(rows):
+        durations = [float(row[duration_col]) / divisor for row in rows]
+        months, hours, days = parse_all([row[start_col] for row in rows])
+        return durations, months, hours, days, user_column(rows)
+
+    if metrics is None:
+        return convert
+
+    def convert_timed(rows):
+        clock = time.perf_counter
+        started = clock()
+        durations = [float(row[duration_col]) / divisor for row in rows]
+        parsed = clock()
+        months, hours, days = parse_all([row[start_col] for row in rows])
+        timed = clock()
+        user_types = user_column(rows)
+        done = clock()
+        metrics.record('duration', parsed - started, len(rows))
+        metrics.record('start_time', timed - parsed, len(rows))
+        metrics.record('user_type', done - timed, len(rows))
+        return durations, months, hours, days, user_types
+    return convert_timed
@@ -0,0 +1,262 @@
+"""
+Inspecting a raw or condensed trip file from a few KB of it.
+
+    python -m bikeshare.sniff NYC-CitiBike-2016.csv --rows 5
+
+sniff_schema reads only the start of a file, however large or compressed it
+is, to find its delimiter, header, kind, city and column types, and checks a
+few rows against the city's schema. sample_rows draws rows from across the
+whole file by reading small windows at evenly spaced offsets.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+from .compressed import detect_codec, open_binary
+from .condense import CONDENSED_COLUMNS
+from .encoding import parse_fieldnames
+from .schemas import CITY_SCHEMAS, compile_row_converter
+from .trips import city_of
+
+# bytes read from the start of a file to sniff it
+SNIFF_BYTES = 4096
+
+# bytes read at each offset sample_rows probes
+SAMPLE_WINDOW_BYTES = 4096
+
+# delimiters the sniffer chooses between
+DELIMITERS = ',;\t|'
+
+FileSchema = namedtuple('FileSchema', [
+    'filename',
+    'codec',          # compression codec, or None (see detect_codec)
+    'delimiter',
+    'kind',           # 'raw', 'condensed' or 'encoded' (condensed with codes)
+    'header',         # column names
+    'dictionaries',   # {column: values} of an encoded file, else {}
+    'city',           # registered city whose schema fits a raw file, or None
+    'column_types',   # {column: 'int', 'float', 'timestamp' or 'str'}
+    'problems',       # what does not fit the city's schema, empty if all does
+])
+
+
+def _head_lines(filename, sniff_bytes):
+    """
+    Returns the complete decoded lines in the first sniff_bytes of a file.
+    """
+    # one thread: parallel BGZF decompression would read far ahead
+    with open_binary(filename, workers=1) as f_in:
+        head = f_in.read(sniff_bytes)
+    if len(head) == sniff_bytes and b'\n' in head:
+        head = head[:head.rindex(b'\n') + 1]
+    return head.decode('utf-8', errors='replace').splitlines()
+
+
+def _value_type(value, timestamp_formats):
+    for kind, convert in (('int', int), ('float', float)):
+        try:
+            convert(value)
+            return kind
+        except ValueError:
+            pass
+    for timestamp_format in timestamp_formats:
+        try:
+            datetime.strptime(value, timestamp_format)
+            return 'timestamp'
+        except ValueError:
+            pass
+    return 'str'
+
+
+def column_types(header, rows):
+    """
+    Returns the type of each column, {name: 'int', 'float', 'timestamp' or
+    'str'}, as the narrowest one that fits the column's value in every row.
+    Timestamps are recognized in any registered city's format.
+    """
+    timestamp_formats = sorted({schema.timestamp_format for schema in CITY_SCHEMAS.values()})
+    order = ('int', 'float', 'timestamp', 'str')
+    types = {}
+    for i, name in enumerate(header):
+        kinds = {_value_type(row[i], timestamp_formats) for row in rows
+                 if i < len(row) and row[i] != ''}
+        if kinds <= {'int', 'float'}:
+            types[name] = max(kinds, key=order.index) if kinds else 'str'
+        else:
+            types[name] = 'str' if len(kinds) > 1 else kinds.pop()
+    return types
+
+
+def _schema_problems(schema, header, rows):
+    """
+    Returns what keeps the rows of a raw file from being condensed with a
+    city's schema: missing columns, or rows its converter rejects.
+    """
+    missing = [column for column in (schema.duration_column, schema.start_column,
+                                     schema.user_type_column) if column not in header]
+    if missing:
+        return ['missing column: {}'.format(column) for column in missing]
+    convert = compile_row_converter(schema, header)
+    start = header.index(schema.start_column)
+    problems = []
+    for row in rows:
+        try:
+            convert(row)
+            # the converter's fast parser also takes other M/D/YYYY formats
+            datetime.strptime(row[start], schema.timestamp_format)
+        except (ValueError, IndexError) as e:
+            problems.append('row {!r}: {}'.format(row, e))
+    return problems
+
+
+def _match_city(filename, header, rows):
+    """
+    Returns the registered city whose schema fits a raw header and rows best
+    (the one named in the file name if it fits), and its problems.
+    """
+    hinted = city_of(filename)
+    candidates = sorted(CITY_SCHEMAS, key=lambda city: city != hinted)
+    best = None
+    for city in candidates:
+        problems = _schema_problems(CITY_SCHEMAS[city], header, rows)
+        if not problems:
+            return city, []
+        if best is None or len(problems) < len(best[1]):
+            best = (city, problems)
+    if best is None or any(problem.startswith('missing column') for problem in best[1]):
+        return None, ['no registered city schema fits the header']
+    return best
+
+
+def sniff_schema(filename, sniff_bytes=SNIFF_BYTES):
+    """
+    Returns the FileSchema of a raw or condensed trip file, read from its
+    first sniff_bytes (after decompression) only.
+    """
+    lines = _head_lines(filename, sniff_bytes)
+    if not lines:
+        raise ValueError('empty file: {}'.format(filename))
+    try:
+        delimiter = csv.Sniffer().sniff('\n'.join(lines[:20]), DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+    reader = csv.reader(lines, delimiter=delimiter)
+    names, dictionaries = parse_fieldnames(next(reader))
+    rows = [row for row in reader if row]
+
+    city = None
+    problems = []
+    if names == CONDENSED_COLUMNS:
+        kind = 'encoded' if dictionaries else 'condensed'
+    else:
+        kind = 'raw'
+        city, problems = _match_city(filename, names, rows)
+    return FileSchema(filename, detect_codec(filename), delimiter, kind, names,
+                      dictionaries, city, column_types(names, rows), problems)
+
+
+def _window_lines(f_in, offset, window_bytes):
+    """
+    Returns the complete lines in the window_bytes after offset, skipping the
+    partial line the window starts in, and the offset just after them.
+    """
+    f_in.seek(max(offset - 1, 0))
+    window = f_in.read(window_bytes + 1)
+    start = offset
+    if offset > 0:
+        if b'\n' not in window:
+            return [], offset
+        start = offset - 1 + window.index(b'\n') + 1
+        window = window[window.index(b'\n') + 1:]
+    if b'\n' not in window:
+        return [], offset
+    window = window[:window.rindex(b'\n') + 1]
+    return window.decode('utf-8', errors='replace').splitlines(), start + len(window)
+
+
+def sample_rows(filename, n_rows=10, probes=None, window_bytes=SAMPLE_WINDOW_BYTES,
+                seed=None, schema=None):
+    """
+    Returns up to n_rows rows of a file (dictionaries keyed by its header, with
+    encoded values decoded), drawn from across the whole file: small windows
+    are read at probes evenly spaced byte offsets (4 per wanted row by
+    default) and the rows are picked from all the complete lines in them by
+    reservoir sampling. At most probes * window_bytes bytes are read.
+
+    Compressed files cannot be read at an offset, so their rows are sampled
+    from the lines in their first probes * window_bytes decompressed bytes.
+    """
+    schema = schema or sniff_schema(filename)
+    probes = probes or 4 * n_rows
+    rng = random.Random(seed)
+    reservoir = []
+    seen = 0
+
+    def offer(line):
+        nonlocal seen
+        seen += 1
+        if len(reservoir) < n_rows:
+            reservoir.append(line)
+        else:
+            i = rng.randrange(seen)
+            if i < n_rows:
+                reservoir[i] = line
+
+    if schema.codec is None:
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as f_in:
+            data_start = len(f_in.readline())
+            span = size - data_start
+            covered = data_start
+            for i in range(probes):
+                # windows never overlap, so no line is offered twice
+                offset = max(data_start + span * i // probes, covered)
+                if offset >= size:
+                    break
+                lines, covered = _window_lines(f_in, offset, window_bytes)
+                for line in lines:
+                    offer(line)
+    else:
+        for line in _head_lines(filename, probes * window_bytes)[1:]:
+            offer(line)
+
+    rows = []
+    decoders = [(name, schema.dictionaries[name]) for name in schema.header
+                if name in schema.dictionaries]
+    for fields in csv.reader(io.StringIO('\n'.join(reservoir)), delimiter=schema.delimiter):
+        row = dict(zip(schema.header, fields))
+        for name, values in decoders:
+            row[name] = values[int(row[name])]
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='+', help='raw or condensed trip files')
+    parser.add_argument('--rows', type=int, default=5, help='rows to sample from each file')
+    parser.add_argument('--seed', type=int, help='seed of the row sampling')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for filename in args.files:
+        schema = sniff_schema(filename)
+        print('{}: {} {}, city {}, delimiter {!r}'.format(
+            filename, schema.codec or 'plain', schema.kind, schema.city, schema.delimiter))
+        for name in schema.header:
+            print('    {}: {}'.format(name, schema.column_types[name]))
+        for problem in schema.problems:
+            print('    problem: {}'.format(problem))
+        failed = failed or bool(schema.problems)
+        for row in sample_rows(filename, args.rows, seed=args.seed, schema=schema):
+            print('    {}'.format(row))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+Summary statistics of condensed trip files.
+"""
+import csv
+import os
+
+from .encoding import parse_fieldnames, read_fieldnames, stored_value
+
+
+# names of the statistics the aggregation engine knows how to compute
+TRIP_STATISTICS = ('user_counts', 'duration_split', 'duration_by_type',
+                   'month_by_type', 'hour_by_type', 'durations',
+                   'durations_by_type', 'duration_sketch')
+
+# statistics the report needs for every city; the duration lists are only
+# collected for the city that gets plotted
+REPORT_STATISTICS = ('user_counts', 'duration_split', 'duration_by_type',
+                     'month_by_type', 'hour_by_type')
+
+# statistics that can be answered from a trip table without the raw rows
+TABLE_STATISTICS = ('user_counts', 'duration_split', 'duration_by_type',
+                    'month_by_type', 'hour_by_type')
+
+# statistics that can be answered from a saved trip cube (see write_cube)
+CUBE_STATISTICS = ('user_counts', 'duration_by_type', 'month_by_type', 'hour_by_type')
+
+# statistics the summary functions take from a cube or trip table when they
+# are not given aggregates: the counts only, as durations are float32 there
+COUNT_STATISTICS = ('user_counts', 'month_by_type', 'hour_by_type')
+
+
+def aggregate_trips(filename, statistics=REPORT_STATISTICS, threshold=30,
+                    plot_limit=75, in_months=None):
+    """
+    This function reads in a condensed file with trip data once and computes
+    every requested statistic in the same pass. With in_months (a list of
+    month numbers), only the trips of those months are counted, and the
+    file's zone map (if it has a current one) is used to read just the blocks
+    that hold them. It returns a dictionary keyed by statistic name:
+
+    - 'user_counts': (n_subscribers, n_customers)
+    - 'duration_split': (n_trips <= threshold, n_trips > threshold, duration sum)
+    - 'duration_by_type': {user type: duration sum}
+    - 'month_by_type': {user type: list of 12 monthly counts}
+    - 'hour_by_type': {user type: list of 24 hourly counts}
+    - 'durations': list of every duration, in file order
+    - 'durations_by_type': {user type: list of durations under plot_limit}
+    - 'duration_sketch': {user type: QuantileSketch of the durations}
+    """
+    for name in statistics:
+        if name not in TRIP_STATISTICS:
+            raise ValueError('unknown statistic: {}'.format(name))
+
+    want_split = 'duration_split' in statistics
+    want_by_type = 'duration_by_type' in statistics
+    want_months = 'month_by_type' in statistics
+    want_hours = 'hour_by_type' in statistics
+    want_durations = 'durations' in statistics
+    want_plot = 'durations_by_type' in statistics
+    want_sketch = 'duration_sketch' in statistics
+    want_duration = (want_split or want_by_type or want_durations or want_plot
+                     or want_sketch)
+
+    n_subscribers = 0
+    n_customers = 0
+    n_trips_lessthan = 0
+    n_trips_greaterthan = 0
+    duration_sum = 0
+    type_sums = {'Subscriber': 0, 'Customer': 0}
+    months = {'Subscriber': [0] * 12, 'Customer': [0] * 12}
+    hours = {'Subscriber': [0] * 24, 'Customer': [0] * 24}
+    durations = []
+    plot_lists = {'Subscriber': [], 'Customer': []}
+    if want_sketch:
+        from .sketch import QuantileSketch
+        sketches = {'Subscriber': QuantileSketch(), 'Customer': QuantileSketch()}
+
+    if in_months is None:
+        f_in = open(filename, 'r')
+        fieldnames, dictionaries = parse_fieldnames(next(csv.reader(f_in), []))
+        reader = csv.DictReader(f_in, fieldnames=fieldnames)
+    else:
+        from .zonemap import scan_rows
+        f_in = None
+        dictionaries = read_fieldnames(filename)[1]
+        wanted = {str(month) for month in in_months}
+        reader = (row for row in scan_rows(filename, {'month': list(in_months)})
+                  if row['month'] in wanted)
+    # what the rows hold for a subscriber: the name, or its code if encoded
+    subscriber = stored_value(dictionaries, 'user_type', 'Subscriber')
+    try:
+        for row in reader:
+            # every user type other than 'Subscriber' is counted as a customer
+            if row['user_type'] == subscriber:
+                user_type = 'Subscriber'
+                n_subscribers += 1
+            else:
+                user_type = 'Customer'
+                n_customers += 1
+
+            if want_duration:
+                converted_duration = float(row['duration'])
+                if want_split:
+                    duration_sum = duration_sum + converted_duration
+                    if converted_duration <= threshold:
+                        n_trips_lessthan += 1
+                    else:
+                        n_trips_greaterthan += 1
+                if want_by_type:
+                    type_sums[user_type] = type_sums[user_type] + converted_duration
+                if want_durations:
+                    durations.append(converted_duration)
+                if want_plot and converted_duration < plot_limit:
+                    plot_lists[user_type].append(converted_duration)
+                if want_sketch:
+                    sketches[user_type].add(converted_duration)
+
+            if want_months:
+                months[user_type][int(row['month']) - 1] += 1
+            if want_hours:
+                hours[user_type][int(row['hour'])] += 1
+    finally:
+        if f_in is not None:
+            f_in.close()
+
+    results = {}
+    if 'user_counts' in statistics:
+        results['user_counts'] = (n_subscribers, n_customers)
+    if want_split:
+        results['duration_split'] = (n_trips_lessthan, n_trips_greaterthan,
+                                     duration_sum)
+    if want_by_type:
+        results['duration_by_type'] = type_sums
+    if want_months:
+        results['month_by_type'] = months
+    if want_hours:
+        results['hour_by_type'] = hours
+    if want_durations:
+        results['durations'] = durations
+    if want_plot:
+        results['durations_by_type'] = plot_lists
+    if want_sketch:
+        results['duration_sketch'] = sketches
+    return results
+
+
+def _needs(aggregates, filename, statistics):
+    """
+    Returns aggregates that were computed ahead of time, or computes just the
+    statistics a single caller needs. Trip counts come from the file's saved
+    cube (see write_cube) or its trip table when possible; the table is read
+    from a current trip cache if there is one, but no cache is written.
+    Durations are stored as float32 in both, so duration statistics are
+    computed with one streaming pass over the file, which gives the same
+    sums as aggregate_trips. A partitioned city directory (see
+    condense_partitioned) is answered from its manifest.
+    """
+    if aggregates is None or any(name not in aggregates for name in statistics):
+        if os.path.isdir(filename):
+            from .partition import manifest_aggregates
+            aggregates = manifest_aggregates(filename)
+            for name in statistics:
+                if name not in aggregates:
+                    raise ValueError('statistic needs the raw rows: {}'.format(name))
+        elif all(name in COUNT_STATISTICS for name in statistics):
+            # NumPy is only loaded once a cube or trip table is actually needed
+            from .cube import read_cube
+            cube = read_cube(filename)
+            if cube is not None:
+                aggregates = cube.aggregates()
+            else:
+                from .table import aggregate_table, load_trip_table
+                aggregates = aggregate_table(load_trip_table(filename, build_cache=False),
+                                             statistics)
+        else:
+            aggregates = aggregate_trips(filename, statistics)
+    return aggregates
+
+
+def _mean(duration_sum, n_trips):
+    # trips of one month or user type only can leave a count at zero
+    return duration_sum / n_trips if n_trips else float('nan')
+
+
+def number_of_trips(filename, aggregates=None):
+    """
+    This function reads in a file with trip data and reports the number of
+    trips made by subscribers, customers, and total overall.
+
+    Precomputed results from aggregate_trips can be passed in to avoid
+    re-reading the file.
+    """
+    aggregates = _needs(aggregates, filename, ('user_counts',))
+    n_subscribers, n_customers = aggregates['user_counts']
+
+    # compute total number of rides
+    n_total = n_subscribers + n_customers
+
+    # return tallies as a tuple
+    return(n_subscribers, n_customers, n_total)
+
+
+def duration_of_trips(filename, aggregates=None):
+    """
+    This function reads in a file with trip data and reports the number of
+    trips of 30 minutes or less, the number longer than 30 minutes, and the
+    average trip duration (nan for a file without trips).
+    """
+    aggregates = _needs(aggregates, filename, ('duration_split',))
+    n_trips_lessthan30, n_tripsgreaterthan30, duration_sum = aggregates['duration_split']
+
+    # compute average trip duration
+    total_trips = n_trips_lessthan30 + n_tripsgreaterthan30
+    average_duration = _mean(duration_sum, total_trips)
+
+    # return tallies and average as a tuple
+    return(n_trips_lessthan30, n_tripsgreaterthan30, average_duration)
+
+
+def avg_durationbytype(filename, aggregates=None):
+    """
+    This function reads in a file with trip data and reports the average duration of
+    the trips made by subscribers and customers (nan for a user type without
+    trips).
+    """
+    aggregates = _needs(aggregates, filename, ('user_counts', 'duration_by_type'))
+    n_subscribers, n_customers = aggregates['user_counts']
+    type_sums = aggregates['duration_by_type']
+
+    # compute the average duration of rides
+    avg_durationsubscribers = _mean(type_sums['Subscriber'], n_subscribers)
+    avg_durationcustomers = _mean(type_sums['Customer'], n_customers)
+
+    return (n_subscribers, avg_durationsubscribers, n_customers, avg_durationcustomers)
+
+
+def duration_quantiles(filename, fractions=(0.5, 0.9, 0.99), aggregates=None):
+    """
+    Returns the estimated trip duration at each fraction (p50, p90 and p99 by
+    default) for subscribers and for customers, as two lists. The estimates
+    come from the streaming duration sketches (see QuantileSketch for the
+    error bound), so no durations are held in memory.
+    """
+    aggregates = _needs(aggregates, filename, ('duration_sketch',))
+    sketches = aggregates['duration_sketch']
+    return (sketches['Subscriber'].quantiles(fractions),
+            sketches['Customer'].quantiles(fractions))
+
+
+def trips_longer_than(filename, threshold, aggregates=None):
+    """
+    Returns the estimated number of subscriber and customer trips longer than
+    threshold minutes, from the streaming duration sketches.
+    """
+    aggregates = _needs(aggregates, filename, ('duration_sketch',))
+    sketches = aggregates['duration_sketch']
+    return tuple(sketches[user_type].count - sketches[user_type].count_at_most(threshold)
+                 for user_type in ('Subscriber', 'Customer'))
+
+
+def duration_plotdata(filename, aggregates=None):
+    """
+    Returns every trip duration in the file, in file order.
+    """
+    aggregates = _needs(aggregates, filename, ('durations',))
+    return aggregates['durations']
+
+
+def duration_plotdata_by_type(filename, aggregates=None):
+    """
+    Returns two lists with the durations under 75 minutes of the trips made
+    by subscribers and by customers, in file order.
+    """
+    aggregates = _needs(aggregates, filename, ('durations_by_type',))
+    plot_lists = aggregates['durations_by_type']
+    return plot_lists['Subscriber'], plot_lists['Customer']
+
+
+def month_plotdata_by_type(filename, aggregates=None):
+    """
+    Returns two sorted lists with the month of every trip made by subscribers
+    and by customers.
+    """
+    aggregates = _needs(aggregates, filename, ('month_by_type',))
+    months = aggregates['month_by_type']
+    # rebuild the sorted month lists straight from the monthly counts
+    subscriber_list_month = []
+    customer_list_month = []
+    for month in range(1, 13):
+        subscriber_list_month.extend([month] * months['Subscriber'][month - 1])
+        customer_list_month.extend([month] * months['Customer'][month - 1])
+    return subscriber_list_month, customer_list_month
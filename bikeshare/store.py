@@ -0,0 +1,265 @@
+"""
+Persistent, incrementally maintained partial aggregates of condensed trip files.
+"""
+import csv
+import json
+import os
+
+from .encoding import parse_fieldnames, stored_value
+from .lines import complete_end, last_line, line_hash, read_lines
+from .sketch import QuantileSketch
+from .trips import DAY_NAMES, city_of
+
+
+class TripPartial(object):
+    """
+    Mergeable partial aggregate of a set of condensed trips: trip count,
+    duration sum and sum of squares, number of trips of at most the threshold
+    (30 minutes), month, hour and day-of-week histograms, and a quantile
+    sketch of the durations. Merging is plain addition (and a sketch merge),
+    so partials from chunks, workers or days can be combined in any order.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.under_threshold = 0
+        self.duration_sum = 0.0
+        self.duration_sumsq = 0.0
+        self.months = [0] * 12
+        self.hours = [0] * 24
+        self.days = [0] * 7
+        self.sketch = QuantileSketch()
+
+    def add(self, duration, month, hour, day_of_week, threshold=30):
+        """
+        Folds a single trip into the partial; day_of_week is a DAY_NAMES code.
+        """
+        self.count += 1
+        if duration <= threshold:
+            self.under_threshold += 1
+        self.duration_sum += duration
+        self.duration_sumsq += duration * duration
+        self.months[month - 1] += 1
+        self.hours[hour] += 1
+        self.days[day_of_week] += 1
+        self.sketch.add(duration)
+
+    def merge(self, other):
+        """
+        Adds another partial into this one and returns it.
+        """
+        self.count += other.count
+        self.under_threshold += other.under_threshold
+        self.duration_sum += other.duration_sum
+        self.duration_sumsq += other.duration_sumsq
+        for mine, theirs in ((self.months, other.months), (self.hours, other.hours),
+                             (self.days, other.days)):
+            for i, value in enumerate(theirs):
+                mine[i] += value
+        self.sketch.merge(other.sketch)
+        return self
+
+    def to_dict(self):
+        values = dict(vars(self))
+        values['sketch'] = self.sketch.to_dict()
+        return values
+
+    @classmethod
+    def from_dict(cls, values):
+        partial = cls()
+        partial.__dict__.update(values)
+        partial.sketch = QuantileSketch.from_dict(values['sketch'])
+        return partial
+
+
+def partials_from_rows(rows, dictionaries=None):
+    """
+    Folds condensed csv rows (dictionaries keyed by CONDENSED_COLUMNS) into
+    partials keyed by (user type, month). dictionaries are those of an
+    encoded file (see parse_fieldnames).
+    """
+    dictionaries = dictionaries or {}
+    partials = {}
+    day_codes = {stored_value(dictionaries, 'day_of_week', name): code
+                 for code, name in enumerate(DAY_NAMES)}
+    subscriber = stored_value(dictionaries, 'user_type', 'Subscriber')
+    for row in rows:
+        user_type = 'Subscriber' if row['user_type'] == subscriber else 'Customer'
+        month = int(row['month'])
+        key = (user_type, month)
+        if key not in partials:
+            partials[key] = TripPartial()
+        partials[key].add(float(row['duration']), month, int(row['hour']),
+                          day_codes[row['day_of_week']])
+    return partials
+
+
+def aggregates_from_partials(totals):
+    """
+    Returns the statistics in TABLE_STATISTICS and the duration sketches, in
+    the same form as aggregate_trips, from {user type: TripPartial} totals.
+    """
+    subscribers = totals['Subscriber']
+    customers = totals['Customer']
+    return {'user_counts': (subscribers.count, customers.count),
+            'duration_split': (subscribers.under_threshold + customers.under_threshold,
+                               subscribers.count + customers.count
+                               - subscribers.under_threshold - customers.under_threshold,
+                               subscribers.duration_sum + customers.duration_sum),
+            'duration_by_type': {'Subscriber': subscribers.duration_sum,
+                                 'Customer': customers.duration_sum},
+            'month_by_type': {'Subscriber': list(subscribers.months),
+                              'Customer': list(customers.months)},
+            'hour_by_type': {'Subscriber': list(subscribers.hours),
+                             'Customer': list(customers.hours)},
+            'duration_sketch': {'Subscriber': subscribers.sketch,
+                                'Customer': customers.sketch}}
+
+
+class AggregateStore(object):
+    """
+    Persistent store of partial aggregates of condensed trip files, keyed by
+    city, user type and month. Each file's partials are kept separately along
+    with how far into the file they reach, so appended rows are folded in
+    without rescanning and a rewritten file only replaces its own partials.
+    The store is saved as JSON.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.files = {}
+        self._totals = {}
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Opens the store saved in filename, or an empty one if there is none.
+        """
+        store = cls(filename)
+        try:
+            with open(filename, 'r') as f_in:
+                saved = json.load(f_in)
+        except (OSError, ValueError):
+            return store
+        for data_file, state in saved['files'].items():
+            if any('sketch' not in values for values in state['partials'].values()):
+                # saved before partials kept sketches: fold the file again
+                continue
+            partials = {}
+            for key, values in state['partials'].items():
+                user_type, month = key.split('|')
+                partials[(user_type, int(month))] = TripPartial.from_dict(values)
+            state['partials'] = partials
+            store.files[data_file] = state
+        return store
+
+    def save(self, filename=None):
+        filename = filename or self.filename
+        files = {}
+        for data_file, state in self.files.items():
+            state = dict(state)
+            state['partials'] = {'{}|{}'.format(*key): partial.to_dict()
+                                 for key, partial in state['partials'].items()}
+            files[data_file] = state
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'w') as f_out:
+            json.dump({'files': files}, f_out)
+        os.replace(tmp_file, filename)
+
+    def _is_current(self, data_file, state):
+        """
+        Checks that the rows folded so far are still the start of data_file.
+        """
+        try:
+            if os.path.getsize(data_file) < state['offset']:
+                return False
+            with open(data_file, 'rb') as f_in:
+                f_in.seek(state['last_line_start'])
+                last_line = f_in.read(state['offset'] - state['last_line_start'])
+        except OSError:
+            return False
+        return line_hash(last_line) == state['last_line_hash']
+
+    def fold_file(self, data_file, city=None):
+        """
+        Folds the rows of a condensed file that are not in the store yet and
+        returns how many rows were folded. If the file was rewritten since
+        the last fold, its partials are rebuilt from the start.
+        """
+        city = city or city_of(data_file)
+        state = self.files.get(data_file)
+        with open(data_file, 'rb') as f_in:
+            header_line = f_in.readline()
+            data_start = f_in.tell()
+        if state is None or state['city'] != city or not self._is_current(data_file, state):
+            state = {'city': city, 'offset': data_start, 'rows': 0,
+                     'last_line_start': 0, 'last_line_hash': line_hash(header_line),
+                     'partials': {}}
+
+        start = state['offset']
+        end = complete_end(data_file, os.path.getsize(data_file))
+        if end > start:
+            fieldnames, dictionaries = parse_fieldnames(
+                next(csv.reader([header_line.decode('utf-8')])))
+            rows = csv.DictReader(read_lines(data_file, start, end), fieldnames=fieldnames)
+            partials = partials_from_rows(rows, dictionaries)
+            n_rows = 0
+            for key, partial in partials.items():
+                n_rows += partial.count
+                if key in state['partials']:
+                    state['partials'][key].merge(partial)
+                else:
+                    state['partials'][key] = partial
+            state['last_line_start'], state['last_line_hash'] = \
+                last_line(data_file, start, end)
+            state['offset'] = end
+            state['rows'] += n_rows
+        else:
+            n_rows = 0
+
+        self.files[data_file] = state
+        self._totals.pop(city, None)
+        return n_rows
+
+    def file_state(self, data_file):
+        """
+        Returns how far the store has folded data_file, as a (byte offset,
+        rows, hash of the last folded line) tuple, or None if it has not.
+        """
+        state = self.files.get(data_file)
+        if state is None:
+            return None
+        return state['offset'], state['rows'], state['last_line_hash']
+
+    @staticmethod
+    def _merge_partials(states):
+        totals = {'Subscriber': TripPartial(), 'Customer': TripPartial()}
+        for state in states:
+            for (user_type, _), partial in state['partials'].items():
+                totals[user_type].merge(partial)
+        return totals
+
+    def partials(self, city):
+        """
+        Returns the merged partials of every file of a city, keyed by user type.
+        """
+        if city not in self._totals:
+            self._totals[city] = self._merge_partials(
+                state for state in self.files.values() if state['city'] == city)
+        return self._totals[city]
+
+    def aggregates(self, city):
+        """
+        Returns the statistics in TABLE_STATISTICS and the duration sketches
+        for a city, in the same form as aggregate_trips, straight from the
+        stored partials.
+        """
+        return aggregates_from_partials(self.partials(city))
+
+    def file_aggregates(self, data_file):
+        """
+        Returns the same statistics as aggregates for the rows of one data
+        file, folding in any rows the store does not have yet.
+        """
+        self.fold_file(data_file)
+        return aggregates_from_partials(self._merge_partials([self.files[data_file]]))
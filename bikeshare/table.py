@@ -0,0 +1,160 @@
+"""
+Columnar NumPy trip tables loaded from condensed files.
+"""
+import csv
+from collections import OrderedDict
+
+import numpy as np
+
+from .cache import read_trip_cache, write_trip_cache
+from .encoding import parse_fieldnames, stored_value
+from .lines import file_stamp
+from .stats import TABLE_STATISTICS
+from .trips import DAY_NAMES
+
+
+class TripTable(object):
+    """
+    Columns of a condensed trip file held as typed NumPy arrays:
+
+    - duration: float32 minutes
+    - month: uint8, 1-12
+    - hour: uint8, 0-23
+    - day_of_week: uint8 code into DAY_NAMES
+    - user_type: uint8 code into USER_TYPES (anything that is not a
+      'Subscriber' is coded as a 'Customer', like the summary functions do)
+    """
+
+    def __init__(self, duration, month, hour, day_of_week, user_type):
+        self.duration = duration
+        self.month = month
+        self.hour = hour
+        self.day_of_week = day_of_week
+        self.user_type = user_type
+
+    def __len__(self):
+        return len(self.duration)
+
+    @classmethod
+    def from_csv(cls, filename, block_rows=1 << 20):
+        """
+        Reads a condensed csv file into typed columns. Rows are read in blocks
+        of block_rows and each block is converted with one NumPy call per
+        column, so no per-row dictionaries are built. Plain and encoded files
+        are both read.
+        """
+        blocks = []
+        with open(filename, 'r') as f_in:
+            reader = csv.reader(f_in)
+            header, dictionaries = parse_fieldnames(next(reader))
+            columns = [header.index(name) for name in
+                       ('duration', 'month', 'hour', 'day_of_week', 'user_type')]
+            while True:
+                rows = [row for _, row in zip(range(block_rows), reader)]
+                if not rows:
+                    break
+                fields = list(zip(*rows))
+                blocks.append(cls._convert_block([fields[i] for i in columns],
+                                                 dictionaries))
+        if not blocks:
+            return cls.empty()
+        return cls(*[np.concatenate(parts) for parts in zip(*blocks)])
+
+    @staticmethod
+    def _convert_block(fields, dictionaries):
+        duration, month, hour, day_of_week, user_type = fields
+        day_values, day_codes = np.unique(np.array(day_of_week), return_inverse=True)
+        if 'day_of_week' in dictionaries:
+            day_values = [dictionaries['day_of_week'][int(code)] for code in day_values]
+        day_lookup = np.array([DAY_NAMES.index(name) for name in day_values],
+                              dtype=np.uint8)
+        subscriber = np.array(user_type) == stored_value(dictionaries, 'user_type',
+                                                         'Subscriber')
+        return (np.array(duration).astype(np.float32),
+                np.array(month).astype(np.uint8),
+                np.array(hour).astype(np.uint8),
+                day_lookup[day_codes],
+                np.where(subscriber, 0, 1).astype(np.uint8))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.uint8),
+                   np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.uint8),
+                   np.empty(0, dtype=np.uint8))
+
+
+# trip tables kept loaded before the least recently used ones are dropped
+TRIP_TABLE_ENTRIES = 8
+
+# loaded trip tables, keyed by filename and invalidated when the file changes
+_trip_tables = OrderedDict()
+
+
+def load_trip_table(filename, use_cache=True, build_cache=True):
+    """
+    Returns the TripTable for a condensed file, loading it only the first time
+    it is asked for (or when the file has changed since). The last
+    TRIP_TABLE_ENTRIES tables used stay loaded.
+
+    With use_cache, the columns are memory-mapped from the file's binary trip
+    cache; a missing or stale cache is rebuilt from the csv file first, unless
+    build_cache is false. The rebuild is best effort: where the cache cannot
+    be written (e.g. a read-only data directory), the table read from the csv
+    file is returned.
+    """
+    key = file_stamp(filename)
+    cached = _trip_tables.get(filename)
+    if cached is None or cached[0] != key:
+        columns = read_trip_cache(filename) if use_cache else None
+        if columns is not None:
+            table = TripTable(*columns)
+        else:
+            table = TripTable.from_csv(filename)
+            if use_cache and build_cache:
+                try:
+                    write_trip_cache(filename, table.duration, table.month, table.hour,
+                                     table.day_of_week, table.user_type)
+                except OSError:
+                    pass
+        cached = (key, table)
+        _trip_tables[filename] = cached
+        while len(_trip_tables) > TRIP_TABLE_ENTRIES:
+            _trip_tables.popitem(last=False)
+    _trip_tables.move_to_end(filename)
+    return cached[1]
+
+
+def aggregate_table(table, statistics=TABLE_STATISTICS, threshold=30):
+    """
+    Computes the same statistics as aggregate_trips, as vectorized reductions
+    over a TripTable. Durations are stored as float32, so sums and means can
+    differ from the csv path in the last few significant digits.
+    """
+    for name in statistics:
+        if name not in TABLE_STATISTICS:
+            raise ValueError('statistic needs the raw rows: {}'.format(name))
+
+    subscriber = table.user_type == 0
+    n_subscribers = int(np.count_nonzero(subscriber))
+    n_customers = len(table) - n_subscribers
+
+    results = {}
+    if 'user_counts' in statistics:
+        results['user_counts'] = (n_subscribers, n_customers)
+    if 'duration_split' in statistics:
+        n_trips_lessthan = int(np.count_nonzero(table.duration <= threshold))
+        results['duration_split'] = (n_trips_lessthan, len(table) - n_trips_lessthan,
+                                     float(table.duration.sum(dtype=np.float64)))
+    if 'duration_by_type' in statistics:
+        results['duration_by_type'] = {
+            'Subscriber': float(table.duration[subscriber].sum(dtype=np.float64)),
+            'Customer': float(table.duration[~subscriber].sum(dtype=np.float64))}
+    if 'month_by_type' in statistics:
+        results['month_by_type'] = {
+            'Subscriber': np.bincount(table.month[subscriber], minlength=13)[1:13].tolist(),
+            'Customer': np.bincount(table.month[~subscriber], minlength=13)[1:13].tolist()}
+    if 'hour_by_type' in statistics:
+        results['hour_by_type'] = {
+            'Subscriber': np.bincount(table.hour[subscriber], minlength=24)[:24].tolist(),
+            'Customer': np.bincount(table.hour[~subscriber], minlength=24)[:24].tolist()}
+    return results
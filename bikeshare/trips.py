@@ -0,0 +1,151 @@
+"""
+Reading raw trip records: the per-trip cleaning helpers shared by every city.
+"""
+import csv
+from datetime import date
+from functools import lru_cache
+
+from .compressed import open_input
+from .schemas import city_schema, start_time_parsers
+
+
+def print_first_point(filename):
+    """
+    This function prints and returns the first data point (second row) from
+    a csv file that includes a header row. The file can be compressed (see
+    open_input).
+    """
+    # pprint pulls in inspect and dataclasses, which would double import time
+    from pprint import pprint
+
+    # print city name for reference
+    city = city_of(filename)
+    print('\nCity: {}'.format(city))
+
+    with open_input(filename) as f_in:
+        trip_reader = csv.DictReader(f_in)
+        first_trip = next(trip_reader, None)
+        pprint(first_trip)
+
+    # output city name and first trip for later testing
+    return (city, first_trip)
+
+
+def city_of(filename):
+    """
+    Returns the city a data file belongs to, parsed from its name the same way
+    print_first_point does.
+    """
+    return filename.split('-')[0].split('/')[-1]
+
+
+def duration_in_mins(datum, city):
+    """
+    Takes as input a dictionary containing info about a single trip (datum) and
+    its origin city (city) and returns the trip duration in units of minutes.
+
+    Remember that Washington is in terms of milliseconds while Chicago and NYC
+    are in terms of seconds; the unit comes from the city's schema.
+    """
+    schema = city_schema(city)
+    return float(datum[schema.duration_column]) / schema.duration_divisor
+
+
+# day of week and user type are stored in trip tables and trip caches as codes
+# into these
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+             'Saturday', 'Sunday')
+USER_TYPES = ('Subscriber', 'Customer')
+
+
+def dayNameFromWeekday(weekday):
+    """
+    Returns the name of the day for a datetime weekday number (Monday is 0).
+    """
+    if 0 <= weekday < 7:
+        return DAY_NAMES[weekday]
+
+
+MONTH_NAMES = ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December')
+
+
+def MonthNameFromNumber(month):
+    """
+    Returns the name of a month numbered from 1 (January) to 12.
+    """
+    if 1 <= month <= 12:
+        return MONTH_NAMES[month - 1]
+
+
+# a year has at most 366 distinct dates, so every date string is parsed and
+# looked up in the calendar once and then served from the cache
+@lru_cache(maxsize=4096)
+def parse_trip_date(date_string):
+    """
+    Takes the date part of a start time ("M/D/YYYY") and returns the month and
+    the name of the day of the week.
+    """
+    month, day, year = date_string.split("/")
+    month = int(month)
+    return month, DAY_NAMES[date(int(year), month, int(day)).weekday()]
+
+
+def parse_start_time(timestamp):
+    """
+    Parses a start time in any of the city formats ("M/D/YYYY H:MM" or
+    "M/D/YYYY H:MM:SS") and returns the month, hour, and day of the week.
+    """
+    date_string, _, time_string = timestamp.partition(" ")
+    month, day_of_week = parse_trip_date(date_string)
+    return month, int(time_string[:time_string.index(":")]), day_of_week
+
+
+def parse_start_times(timestamps):
+    """
+    Batch version of parse_start_time: parses a whole column of start times
+    and returns three lists with the months, hours, and days of the week.
+    """
+    months = []
+    hours = []
+    days = []
+    # bind the lookups to locals once for the whole column
+    parse_date = parse_trip_date
+    add_month, add_hour, add_day = months.append, hours.append, days.append
+    for timestamp in timestamps:
+        date_string, _, time_string = timestamp.partition(" ")
+        month, day_of_week = parse_date(date_string)
+        add_month(month)
+        add_hour(int(time_string[:time_string.index(":")]))
+        add_day(day_of_week)
+    return months, hours, days
+
+
+def time_of_trip(datum, city):
+    """
+    Takes as input a dictionary containing info about a single trip (datum) and
+    its origin city (city) and returns the month, hour, and day of the week in
+    which the trip was made.
+
+    Remember that NYC includes seconds, while Washington and Chicago do not.
+    Each city's schema declares its format.
+    """
+    schema = city_schema(city)
+    parse, _ = start_time_parsers(schema.timestamp_format)
+    return parse(datum[schema.start_column])
+
+
+def type_of_user(datum, city):
+    """
+    Takes as input a dictionary containing info about a single trip (datum) and
+    its origin city (city) and returns the type of system user that made the
+    trip.
+
+    Remember that Washington has different category names compared to Chicago
+    and NYC; the mapping comes from the city's schema.
+    """
+    schema = city_schema(city)
+    user_type = datum[schema.user_type_column]
+    if schema.user_types is None:
+        return user_type
+    return schema.user_types.get(user_type, schema.default_user_type)
@@ -0,0 +1,158 @@
+"""
+Zone maps of condensed files: per-block min/max sidecars for skipping rows.
+"""
+import csv
+import json
+import os
+
+from .encoding import read_fieldnames
+from .lines import file_stamp, read_lines
+
+# rows per zone map block
+ZONE_MAP_BLOCK_ROWS = 8192
+
+# condensed columns that get a min/max per block
+ZONE_MAP_COLUMNS = ('month', 'hour', 'duration')
+
+
+def zone_map_file(filename):
+    """
+    Returns the name of the zone map that belongs to a condensed csv file.
+    """
+    return os.path.splitext(filename)[0] + '.zones'
+
+
+class ZoneMapWriter(object):
+    """
+    Writes condensed rows in blocks of block_rows rows and records, for each
+    block, its byte offset in the output file, its number of rows and the
+    smallest and largest month, hour and duration in it.
+    """
+
+    def __init__(self, block_rows=ZONE_MAP_BLOCK_ROWS):
+        self.block_rows = block_rows
+        self.blocks = []
+        self._filled = 0
+
+    def writerows(self, f_out, trip_writer, columns):
+        """
+        Writes the condensed columns of one batch (duration, month, hour, day
+        of week, user type lists) through trip_writer into f_out.
+        """
+        durations, months, hours = columns[0], columns[1], columns[2]
+        n_rows = len(durations)
+        start = 0
+        while start < n_rows:
+            if self._filled == 0:
+                self.blocks.append({'offset': f_out.tell(), 'rows': 0})
+            end = min(start + self.block_rows - self._filled, n_rows)
+            trip_writer.writerows(zip(*[column[start:end] for column in columns]))
+
+            block = self.blocks[-1]
+            for name, values in (('month', months), ('hour', hours),
+                                 ('duration', durations)):
+                low, high = min(values[start:end]), max(values[start:end])
+                if block['rows']:
+                    low, high = min(low, block[name][0]), max(high, block[name][1])
+                block[name] = [low, high]
+            block['rows'] += end - start
+            self._filled = (self._filled + end - start) % self.block_rows
+            start = end
+
+    def extend(self, blocks, offset):
+        """
+        Appends the blocks of rows written through another writer (e.g. into
+        a part file that was then copied in), shifting their offsets by where
+        those rows start in this writer's file.
+        """
+        self.blocks.extend(dict(block, offset=block['offset'] + offset) for block in blocks)
+        self._filled = 0
+
+    def save(self, filename):
+        """
+        Writes the zone map of the finished (closed) condensed file filename.
+        """
+        source_size, source_mtime = file_stamp(filename)
+        zone_map = {'source_size': source_size, 'source_mtime_ns': source_mtime,
+                    'block_rows': self.block_rows, 'blocks': self.blocks}
+        tmp_file = zone_map_file(filename) + '.tmp'
+        with open(tmp_file, 'w') as f_out:
+            json.dump(zone_map, f_out)
+        os.replace(tmp_file, zone_map_file(filename))
+
+
+def read_zone_map(filename):
+    """
+    Returns the list of blocks of the zone map of a condensed file, or None if
+    there is none or it was built from a different version of the file.
+    """
+    try:
+        with open(zone_map_file(filename), 'r') as f_in:
+            zone_map = json.load(f_in)
+        stamp = file_stamp(filename)
+    except (OSError, ValueError):
+        return None
+    if (zone_map.get('source_size'), zone_map.get('source_mtime_ns')) != stamp:
+        return None
+    return zone_map['blocks']
+
+
+def _may_match(block, where):
+    for column, condition in where.items():
+        low, high = block[column]
+        if isinstance(condition, tuple):
+            if condition[1] < low or condition[0] > high:
+                return False
+        elif isinstance(condition, (list, set, frozenset)):
+            if not any(low <= value <= high for value in condition):
+                return False
+        elif not low <= condition <= high:
+            return False
+    return True
+
+
+def scan_ranges(filename, where=None):
+    """
+    Returns the (start, end) byte ranges of a condensed file that hold every
+    row that can match where, a {column: condition} dictionary over month,
+    hour and duration. A condition is a single value, an inclusive (low, high)
+    range or a list of values. Adjacent blocks are merged into one range.
+
+    Without a current zone map (or without where), the whole file is one range.
+    """
+    blocks = read_zone_map(filename) if where else None
+    size = os.path.getsize(filename)
+    if blocks is None:
+        with open(filename, 'rb') as f_in:
+            f_in.readline()
+            return [(f_in.tell(), size)]
+
+    for column in where:
+        if column not in ZONE_MAP_COLUMNS:
+            raise ValueError('no zone map of column: {}'.format(column))
+    ranges = []
+    for i, block in enumerate(blocks):
+        if not _may_match(block, where):
+            continue
+        end = blocks[i + 1]['offset'] if i + 1 < len(blocks) else size
+        if ranges and ranges[-1][1] == block['offset']:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((block['offset'], end))
+    return ranges
+
+
+def scan_rows(filename, where=None):
+    """
+    Yields the rows (dictionaries keyed by the header) of the blocks of a
+    condensed file that can match where (see scan_ranges), seeking past the
+    others. Rows in those blocks are not filtered any further. Encoded
+    columns keep their codes (see read_fieldnames for the dictionaries).
+    """
+    fieldnames = read_fieldnames(filename)[0]
+    if not fieldnames:
+        return
+    for start, end in scan_ranges(filename, where):
+        for row in csv.DictReader(read_lines(filename, start, end),
+                                  fieldnames=fieldnames):
+            yield row
@@ -0,0 +1,38 @@
+import os
+import shutil
+
+import pytest
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# a small raw sample of each city feed, one per city schema
+RAW_SAMPLES = {'NYC': 'NYC-CitiBike-sample.csv',
+               'Chicago': 'Chicago-Divvy-sample.csv',
+               'Washington': 'Washington-CapitalBikeshare-sample.csv'}
+
+
+@pytest.fixture(params=sorted(RAW_SAMPLES))
+def city(request):
+    return request.param
+
+
+@pytest.fixture
+def raw_file(city, tmp_path):
+    """
+    A copy of the city's raw sample in a temporary directory, so tests can
+    append to or rewrite it.
+    """
+    filename = str(tmp_path / RAW_SAMPLES[city])
+    shutil.copyfile(os.path.join(DATA_DIR, RAW_SAMPLES[city]), filename)
+    return filename
+
+
+@pytest.fixture
+def condensed_file(city, raw_file, tmp_path):
+    """
+    The city's sample condensed with condense_data, with its zone map.
+    """
+    from bikeshare import condense_data
+    filename = str(tmp_path / '{}-2016-Summary.csv'.format(city))
+    condense_data(raw_file, filename, city)
+    return filename
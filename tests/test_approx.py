@@ -0,0 +1,111 @@
+import functools
+import math
+import os
+
+import pytest
+
+from bikeshare import (ApproximateScan, approx_avg_durationbytype, approx_number_of_trips,
+                       avg_durationbytype, condense_data, number_of_trips, read_zone_map,
+                       zone_map_file)
+from bikeshare.zonemap import ZoneMapWriter
+
+
+@pytest.fixture
+def blocked_file(city, raw_file, tmp_path, monkeypatch):
+    """
+    The city's sample condensed with a zone map of 10-row blocks, so the scan
+    has blocks to sample in every month.
+    """
+    monkeypatch.setattr('bikeshare.condense.ZoneMapWriter',
+                        functools.partial(ZoneMapWriter, block_rows=10))
+    filename = str(tmp_path / '{}-2016-Summary.csv'.format(city))
+    condense_data(raw_file, filename, city)
+    assert len(read_zone_map(filename)) == 15
+    return filename
+
+
+def months(filename):
+    blocks = {}
+    for block in read_zone_map(filename):
+        blocks.setdefault(block['month'][0], []).append(block)
+    return blocks
+
+
+def test_scan_is_exact_once_every_block_is_read(blocked_file):
+    scan = ApproximateScan(blocked_file, seed=1)
+    for _ in scan.refine():
+        pass
+    assert scan.exact
+    assert scan.blocks_read == scan.blocks_total == 15
+    assert scan.relative_error() == 0
+    assert tuple(estimate.value for estimate in scan.number_of_trips()) == \
+        pytest.approx(number_of_trips(blocked_file))
+    for estimate, value in zip(scan.avg_durationbytype(), avg_durationbytype(blocked_file)):
+        assert estimate.low == estimate.value == estimate.high
+        assert estimate.value == pytest.approx(value, nan_ok=True)
+
+
+def test_scan_refines_in_rounds(blocked_file):
+    scan = ApproximateScan(blocked_file, seed=2)
+    rounds = scan.refine()
+    next(rounds)
+    # the first round reads two blocks of every month
+    assert scan.blocks_read == sum(min(2, len(blocks))
+                                   for blocks in months(blocked_file).values())
+    assert not scan.exact
+    read = scan.blocks_read
+    next(rounds)
+    assert scan.blocks_read > read
+    assert scan.rows_read == 10 * scan.blocks_read
+    for estimate in scan.number_of_trips():
+        assert estimate.low <= estimate.value <= estimate.high
+
+
+def test_error_budget_stops_the_scan(blocked_file):
+    # a loose budget is met before the whole file is read
+    scan = ApproximateScan(blocked_file, seed=3)
+    for _ in scan.refine(max_error=1.0):
+        pass
+    assert scan.relative_error() <= 1.0
+    assert scan.blocks_read < scan.blocks_total
+    for estimate in scan.avg_durationbytype():
+        assert (estimate.high - estimate.low) / 2 <= abs(estimate.value)
+
+    estimates = approx_number_of_trips(blocked_file, max_error=0, seed=3)
+    assert tuple(estimate.value for estimate in estimates) == \
+        pytest.approx(number_of_trips(blocked_file))
+
+
+def test_scan_without_zone_map(condensed_file):
+    os.remove(zone_map_file(condensed_file))
+    # byte ranges of about ten rows each, in a single stratum
+    block_bytes = 10 * os.path.getsize(condensed_file) // 150
+    scan = ApproximateScan(condensed_file, seed=4, block_bytes=block_bytes)
+    with open(condensed_file, 'rb') as f_in:
+        data_bytes = os.path.getsize(condensed_file) - len(f_in.readline())
+    assert scan.blocks_total == -(-data_bytes // block_bytes)
+    for _ in scan.refine():
+        pass
+    assert scan.rows_read == 150
+    assert tuple(estimate.value for estimate in scan.number_of_trips()) == \
+        pytest.approx(number_of_trips(condensed_file))
+
+    estimates = approx_avg_durationbytype(condensed_file, max_error=0)
+    for estimate, value in zip(estimates, avg_durationbytype(condensed_file)):
+        assert estimate.value == pytest.approx(value, nan_ok=True)
+
+
+def test_empty_and_partitioned_inputs(tmp_path):
+    empty = str(tmp_path / 'empty.csv')
+    open(empty, 'w').close()
+    with pytest.raises(ValueError):
+        ApproximateScan(empty)
+    with pytest.raises(ValueError):
+        ApproximateScan(str(tmp_path))
+
+    header_only = str(tmp_path / 'header.csv')
+    with open(header_only, 'w') as f_out:
+        f_out.write('duration,month,hour,day_of_week,user_type\n')
+    subscribers, subscriber_mean, customers, _ = approx_avg_durationbytype(header_only)
+    assert (subscribers.value, customers.value) == (0, 0)
+    assert math.isnan(subscriber_mean.value)
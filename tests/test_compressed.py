@@ -0,0 +1,74 @@
+import bz2
+import filecmp
+import gzip
+import lzma
+import struct
+import zlib
+
+import pytest
+
+from bikeshare import condense_data, detect_codec, open_input
+from bikeshare.compressed import is_bgzf
+
+
+def write_bgzf(data, filename, block_bytes):
+    """
+    Writes data as BGZF, like bgzip: independent gzip members of at most
+    block_bytes each, whose BC extra field holds the member's size, and an
+    empty member at the end.
+    """
+    with open(filename, 'wb') as f_out:
+        for start in range(0, len(data) + 1, block_bytes):
+            chunk = data[start:start + block_bytes]
+            deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+            body = deflate.compress(chunk) + deflate.flush()
+            f_out.write(b'\x1f\x8b\x08\x04' + b'\0' * 4 + b'\0\xff' + struct.pack('<H', 6) +
+                        b'BC' + struct.pack('<HH', 2, 18 + len(body) + 8 - 1))
+            f_out.write(body + struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+            if not chunk:
+                break
+
+
+def compress(raw_file, codec, filename):
+    with open(raw_file, 'rb') as f_in:
+        data = f_in.read()
+    if codec == 'bgzf':
+        # small blocks, so the sample spans many of them
+        write_bgzf(data, filename, 1000)
+        return
+    module = {'gzip': gzip, 'xz': lzma, 'bz2': bz2}[codec]
+    with open(filename, 'wb') as f_out:
+        f_out.write(module.compress(data))
+
+
+@pytest.mark.parametrize('workers', [None, 1])
+@pytest.mark.parametrize('codec', ['gzip', 'xz', 'bz2', 'bgzf'])
+def test_open_input_decompresses(city, raw_file, tmp_path, codec, workers):
+    # named .csv: the codec is found from the magic bytes, not the suffix
+    compressed = str(tmp_path / 'compressed.csv')
+    compress(raw_file, codec, compressed)
+    assert detect_codec(compressed) == ('gzip' if codec == 'bgzf' else codec)
+    assert is_bgzf(compressed) == (codec == 'bgzf')
+
+    with open(raw_file, 'r') as f_in, open_input(compressed, workers) as f_compressed:
+        assert f_compressed.read() == f_in.read()
+
+    expected = str(tmp_path / 'expected.csv')
+    out_file = str(tmp_path / 'out.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+    condense_data(compressed, out_file, city, zone_map=False)
+    assert filecmp.cmp(expected, out_file, shallow=False)
+
+
+def test_plain_and_empty_files(tmp_path):
+    plain = str(tmp_path / 'plain.csv')
+    with open(plain, 'w') as f_out:
+        f_out.write('duration\n')
+    assert detect_codec(plain) is None
+    with open_input(plain) as f_in:
+        assert f_in.read() == 'duration\n'
+
+    # an empty file goes by its suffix
+    empty = str(tmp_path / 'empty.csv.xz')
+    open(empty, 'wb').close()
+    assert detect_codec(empty) == 'xz'
@@ -0,0 +1,145 @@
+import filecmp
+import threading
+import time
+
+import pytest
+
+from bikeshare import (condense_cities, condense_data, condense_incremental,
+                       export_csv, read_fieldnames)
+from bikeshare.condense import buffered
+
+
+def same_file(a, b):
+    return filecmp.cmp(a, b, shallow=False)
+
+
+@pytest.mark.parametrize('blank_lines', [False, True])
+@pytest.mark.parametrize('encoded', [False, True])
+def test_bulk_engine_matches_rows(city, raw_file, tmp_path, encoded, blank_lines):
+    rows_file = str(tmp_path / 'rows.csv')
+    bulk_file = str(tmp_path / 'bulk.csv')
+    condense_data(raw_file, rows_file, city, encoded=encoded)
+    if blank_lines:
+        raw_file = with_blank_lines(raw_file, tmp_path)
+    condense_data(raw_file, bulk_file, city, encoded=encoded, engine='bulk')
+    assert same_file(rows_file, bulk_file)
+
+
+@pytest.mark.parametrize('engine', ['rows', 'bulk'])
+@pytest.mark.parametrize('encoded', [False, True])
+def test_condense_cities_matches_condense_data(city, raw_file, tmp_path, engine,
+                                               encoded):
+    expected = str(tmp_path / 'expected.csv')
+    joined = str(tmp_path / 'joined.csv')
+    condense_data(raw_file, expected, city, encoded=encoded)
+    report = condense_cities({city: {'in_file': raw_file, 'out_file': joined}},
+                             workers=2, chunks_per_city=3, engine=engine,
+                             encoded=encoded)
+    assert report[city]['error'] is None
+    assert report[city]['chunks'] == 3
+    assert same_file(expected, joined)
+
+
+def test_condense_incremental_matches_condense_data(city, raw_file, tmp_path):
+    with open(raw_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    growing = str(tmp_path / 'growing.csv')
+    out_file = str(tmp_path / 'incremental.csv')
+
+    # the raw file arrives in three pieces, the last one cut mid-line
+    middle = len(lines) // 2
+    with open(growing, 'wb') as f_out:
+        f_out.writelines(lines[:middle])
+    assert condense_incremental(growing, out_file, city) == (middle - 1, True)
+    with open(growing, 'ab') as f_out:
+        f_out.writelines(lines[middle:-1])
+        f_out.write(lines[-1][:5])
+    assert condense_incremental(growing, out_file, city) == (len(lines) - 1 - middle,
+                                                             False)
+    with open(growing, 'ab') as f_out:
+        f_out.write(lines[-1][5:])
+    assert condense_incremental(growing, out_file, city) == (1, False)
+
+    expected = str(tmp_path / 'expected.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+    assert same_file(expected, out_file)
+
+
+def test_condense_incremental_rebuilds_rewritten_input(city, raw_file, tmp_path):
+    out_file = str(tmp_path / 'incremental.csv')
+    condense_incremental(raw_file, out_file, city)
+    assert condense_incremental(raw_file, out_file, city) == (0, False)
+
+    # drop the last trip: the checkpointed last line is no longer there
+    with open(raw_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    with open(raw_file, 'wb') as f_out:
+        f_out.writelines(lines[:-1])
+    assert condense_incremental(raw_file, out_file, city) == (len(lines) - 2, True)
+
+    expected = str(tmp_path / 'expected.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+    assert same_file(expected, out_file)
+
+
+def test_export_csv_round_trips_encoded_file(city, raw_file, tmp_path):
+    plain = str(tmp_path / 'plain.csv')
+    encoded = str(tmp_path / 'encoded.csv')
+    exported = str(tmp_path / 'exported.csv')
+    condense_data(raw_file, plain, city)
+    condense_data(raw_file, encoded, city, encoded=True)
+    assert set(read_fieldnames(encoded)[1]) == {'day_of_week', 'user_type'}
+
+    export_csv(encoded, exported)
+    assert same_file(plain, exported)
+
+
+def with_blank_lines(raw_file, tmp_path):
+    """
+    Returns a copy of raw_file with a blank line among the trips and one at
+    the end, which condense skips.
+    """
+    with open(raw_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    blank = str(tmp_path / 'blank.csv')
+    with open(blank, 'wb') as f_out:
+        f_out.writelines(lines[:50] + [b'\r\n'] + lines[50:] + [b'\r\n'])
+    return blank
+
+
+def test_blank_lines_are_skipped(city, raw_file, tmp_path):
+    blank = with_blank_lines(raw_file, tmp_path)
+    expected = str(tmp_path / 'expected.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+
+    out_file = str(tmp_path / 'out.csv')
+    condense_data(blank, out_file, city, zone_map=False)
+    assert same_file(expected, out_file)
+
+    for engine in ('rows', 'bulk'):
+        report = condense_cities({city: {'in_file': blank, 'out_file': out_file}},
+                                 workers=2, chunks_per_city=3, zone_map=False,
+                                 engine=engine)
+        assert report[city]['error'] is None
+        assert same_file(expected, out_file)
+
+    incremental = str(tmp_path / 'incremental.csv')
+    assert condense_incremental(blank, incremental, city) == (150, True)
+    assert same_file(expected, incremental)
+
+
+def failing_batches():
+    yield [['a']]
+    yield [['b']]
+    raise ValueError('unreadable')
+
+
+@pytest.mark.parametrize('batches', [lambda: iter([[['a']], [['b']]]), failing_batches])
+def test_buffered_reader_exits_when_consumer_stops(batches):
+    threads = threading.active_count()
+    # a buffer of one batch: the reader fills it while the first is consumed
+    consumer = buffered(batches(), max_buffer_bytes=1)
+    assert next(consumer) == [['a']]
+    time.sleep(0.2)
+    consumer.close()
+    assert threading.active_count() == threads
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from bikeshare import (aggregate_trips, avg_durationbytype, condense_data, cube_file,
+                       number_of_trips, read_cube, write_cube)
+
+
+def test_cube_matches_aggregate_trips(condensed_file):
+    cube = write_cube(condensed_file)
+    assert os.path.exists(cube_file(condensed_file))
+    expected = aggregate_trips(condensed_file)
+    aggregates = read_cube(condensed_file).aggregates()
+    assert cube.count() == 150
+    for name in ('user_counts', 'month_by_type', 'hour_by_type'):
+        assert aggregates[name] == expected[name]
+    assert aggregates['duration_by_type'] == pytest.approx(expected['duration_by_type'])
+
+
+def test_cube_roll_up_slice_and_dice(condensed_file):
+    cube = write_cube(condensed_file)
+    by_month = cube.roll_up('hour', 'day_of_week', 'user_type')
+    assert by_month.dimensions == ('month',)
+    assert by_month.count() == cube.count()
+    customers = cube.slice('user_type', 'Customer')
+    assert customers.count() == aggregate_trips(condensed_file)['user_counts'][1]
+    summer = cube.dice(month=[6, 7, 8])
+    assert summer.count() == sum(by_month.counts[5:8])
+
+
+def test_cube_invalidated_by_change(city, raw_file, condensed_file):
+    write_cube(condensed_file)
+    assert read_cube(condensed_file) is not None
+
+    # condensed again from fewer trips: the saved cube is stale and not used
+    with open(raw_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    with open(raw_file, 'wb') as f_out:
+        f_out.writelines(lines[:101])
+    condense_data(raw_file, condensed_file, city)
+    assert read_cube(condensed_file) is None
+    assert number_of_trips(condensed_file)[2] == 100
+    expected = aggregate_trips(condensed_file)['user_counts']
+    assert avg_durationbytype(condensed_file)[::2] == expected
+
+    write_cube(condensed_file)
+    assert read_cube(condensed_file).count() == 100
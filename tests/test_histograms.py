@@ -0,0 +1,72 @@
+import csv
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from bikeshare import (DAY_NAMES, TripTable, aggregate_trips, category_histogram,
+                       condense_partitioned, duration_histogram, duration_plotdata,
+                       duration_plotdata_by_type, load_trip_table, month_plotdata_by_type,
+                       trip_histograms)
+
+
+def test_histograms_match_plot_data(condensed_file):
+    histograms = trip_histograms(condensed_file)
+    assert list(histograms['duration_edges']) == list(np.linspace(0, 75, 16))
+
+    # the plot lists hold the durations under 75 minutes of each user type
+    for counts, durations in zip(histograms['durations'],
+                                 duration_plotdata_by_type(condensed_file)):
+        expected, _ = np.histogram(np.array(durations, dtype=np.float32),
+                                   bins=15, range=(0, 75))
+        assert list(counts) == list(expected)
+    assert histograms['durations'].sum() == sum(
+        1 for duration in duration_plotdata(condensed_file) if duration <= 75)
+
+    for counts, months in zip(histograms['month'], month_plotdata_by_type(condensed_file)):
+        frequencies = Counter(months)
+        assert list(counts) == [frequencies[month] for month in range(1, 13)]
+
+    hours = aggregate_trips(condensed_file)['hour_by_type']
+    assert [list(counts) for counts in histograms['hour']] == [
+        hours['Subscriber'], hours['Customer']]
+
+    with open(condensed_file, 'r') as f_in:
+        days = Counter(row['day_of_week'] for row in csv.DictReader(f_in))
+    assert list(histograms['day_of_week'].sum(axis=0)) == [days[day] for day in DAY_NAMES]
+
+
+def test_duration_histogram_bins():
+    table = TripTable(np.array([0.0, 2.5, 5.0, 7.5, 10.0, 12.0], dtype=np.float32),
+                      np.ones(6, dtype=np.uint8), np.zeros(6, dtype=np.uint8),
+                      np.zeros(6, dtype=np.uint8),
+                      np.array([0, 1, 0, 1, 0, 0], dtype=np.uint8))
+    # half-open bins, the last one holds the upper end; 12 is outside
+    edges, counts = duration_histogram(table, bins=2, range=(0, 10))
+    assert list(edges) == [0, 5, 10]
+    assert counts.tolist() == [[1, 2], [1, 1]]
+
+    # by default, the range of the durations
+    edges, counts = duration_histogram(table, bins=4)
+    assert (edges[0], edges[-1]) == (0, 12)
+    assert counts.sum() == 6
+
+    with pytest.raises(ValueError):
+        category_histogram(table, 'duration')
+
+
+def test_histograms_of_some_months(city, raw_file, condensed_file, tmp_path):
+    table = load_trip_table(condensed_file, use_cache=False)
+    months = sorted(set(table.month.tolist()))[:2]
+    histograms = trip_histograms(condensed_file, months=months)
+    assert histograms['month'].sum() == int(np.isin(table.month, months).sum())
+    assert histograms['month'][:, [month - 1 for month in months]].sum() == \
+        histograms['month'].sum()
+
+    # a partitioned city directory gives the same histograms
+    condense_partitioned(raw_file, str(tmp_path / 'partitioned'), city)
+    partitioned = trip_histograms(os.path.join(str(tmp_path / 'partitioned'), city),
+                                  months=months)
+    for name, values in histograms.items():
+        assert partitioned[name].tolist() == values.tolist()
@@ -0,0 +1,67 @@
+import os
+
+from bikeshare import discover_shards, export_csv, merge_shards
+from bikeshare.ingest import shard_output, shard_outputs
+
+
+def write_lines(filename, lines):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as f_out:
+        f_out.writelines(lines)
+
+
+def test_discover_shards(tmp_path):
+    raw = str(tmp_path / 'raw')
+    for name in ('NYC/a/2016.csv', 'NYC/b/2016.csv.gz', 'Chicago-Divvy-2016.csv',
+                 'Chicago-2016-Summary.csv', 'NYC/notes.txt'):
+        write_lines(os.path.join(raw, name), [b'header\r\n'])
+    assert discover_shards(raw) == {
+        'Chicago': [os.path.join(raw, 'Chicago-Divvy-2016.csv')],
+        'NYC': [os.path.join(raw, 'NYC/a/2016.csv'), os.path.join(raw, 'NYC/b/2016.csv.gz')]}
+
+
+def test_shard_outputs_are_unique(tmp_path):
+    raw, out = str(tmp_path / 'raw'), str(tmp_path / 'out')
+    assert shard_output(out, 'NYC', os.path.join(raw, 'NYC/a/2016.csv'), raw) == \
+        os.path.join(out, 'NYC/a/2016-Summary.csv')
+    assert shard_output(out, 'NYC', os.path.join(raw, 'NYC-CitiBike-2016.csv.gz'), raw) == \
+        os.path.join(out, 'NYC/NYC-CitiBike-2016-Summary.csv')
+
+    shards = {'NYC': [os.path.join(raw, 'NYC/a/2016.csv'), os.path.join(raw, 'NYC/b/2016.csv'),
+                      os.path.join(raw, 'NYC/x.csv'), os.path.join(raw, 'NYC/x.csv.gz')]}
+    outputs, errors = shard_outputs(shards, raw, out)
+    assert len(set(outputs.values())) == 3
+    assert sorted(errors) == shards['NYC'][2:]
+
+
+DAYS = 'day_of_week:Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday'
+
+
+def test_merge_shards(tmp_path):
+    first, second = str(tmp_path / 'first.csv'), str(tmp_path / 'second.csv')
+    write_lines(first, ['duration,month,hour,{},user_type:Subscriber|Customer|Dependent\r\n'
+                        .format(DAYS).encode(), b'5.0,1,0,0,2\r\n', b'7.5,1,3,6,0\r\n'])
+    write_lines(second, ['duration,month,hour,{},user_type:Subscriber|Customer|Staff\r\n'
+                         .format(DAYS).encode(), b'6.0,2,1,1,2\r\n'])
+    plain = str(tmp_path / 'plain.csv')
+    export_csv(second, plain)
+
+    merged = str(tmp_path / 'merged.csv')
+    merge_shards([first, second], merged)
+    with open(merged, 'rb') as f_in:
+        assert f_in.read().splitlines() == [
+            'duration,month,hour,{},user_type:Subscriber|Customer|Dependent|Staff'
+            .format(DAYS).encode(), b'5.0,1,0,0,2', b'7.5,1,3,6,0', b'6.0,2,1,1,3']
+
+    # with a plain shard among them, the merged file is plain
+    merge_shards([first, plain], merged)
+    with open(merged, 'rb') as f_in:
+        assert f_in.read().splitlines() == [
+            b'duration,month,hour,day_of_week,user_type', b'5.0,1,0,Monday,Dependent',
+            b'7.5,1,3,Sunday,Subscriber', b'6.0,2,1,Tuesday,Staff']
+
+
+def test_merge_no_shards(tmp_path):
+    assert merge_shards([], str(tmp_path / 'empty.csv')) == 0
+    with open(str(tmp_path / 'empty.csv'), 'rb') as f_in:
+        assert f_in.read() == b'duration,month,hour,day_of_week,user_type\r\n'
@@ -0,0 +1,105 @@
+import filecmp
+import json
+import os
+import pstats
+
+import pytest
+
+from bikeshare import (CondenseMetrics, condense_cities, condense_data, run_profiled,
+                       write_metrics_json, write_prometheus)
+from bikeshare.instrument import CONDENSE_STAGES
+
+
+@pytest.mark.parametrize('engine', ['rows', 'bulk'])
+def test_condense_metrics(city, raw_file, tmp_path, engine):
+    plain = str(tmp_path / 'plain.csv')
+    out_file = str(tmp_path / 'out.csv')
+    condense_data(raw_file, plain, city, zone_map=False, engine=engine)
+    metrics = CondenseMetrics(city=city)
+    condense_data(raw_file, out_file, city, zone_map=False, engine=engine, metrics=metrics)
+    assert filecmp.cmp(plain, out_file, shallow=False)
+
+    values = metrics.to_dict()
+    assert values['labels'] == {'city': city}
+    assert values['rows'] == 150
+    assert (values['bytes_read'], values['bytes_written']) == (
+        os.path.getsize(raw_file), os.path.getsize(out_file))
+    assert values['rows_per_sec'] == pytest.approx(150 / values['seconds'])
+    assert values['samples'][-1][1] == 150
+    stages = values['stages']
+    assert set(stages) <= set(CONDENSE_STAGES)
+    for stage in ('read', 'duration', 'start_time', 'user_type', 'write'):
+        assert stages[stage]['rows'] == 150
+        assert stages[stage]['seconds'] >= 0
+
+
+def test_condense_cities_merges_chunk_metrics(city, raw_file, tmp_path):
+    metrics = {}
+    out_file = str(tmp_path / 'out.csv')
+    condense_cities({city: {'in_file': raw_file, 'out_file': out_file}}, workers=2,
+                    chunks_per_city=3, zone_map=False, metrics=metrics)
+    values = metrics[city].to_dict()
+    assert values['rows'] == 150
+    assert values['stages']['write']['rows'] == 150
+    assert values['stages']['write']['calls'] >= 3
+    assert values['bytes_written'] == os.path.getsize(out_file)
+
+
+def sample_metrics():
+    metrics = CondenseMetrics(city='NYC')
+    metrics.record('read', 0.5, 100)
+    metrics.record('read', 0.25, 50)
+    metrics.record('write', 0.125, 150)
+    metrics.progress(150)
+    metrics.finish(2000, 500)
+    metrics.seconds = 2.0
+    return metrics
+
+
+def test_metrics_json_round_trips(tmp_path):
+    filename = str(tmp_path / 'metrics.json')
+    metrics = sample_metrics()
+    write_metrics_json([metrics, CondenseMetrics()], filename)
+    with open(filename, 'r') as f_in:
+        runs = json.load(f_in)
+    assert runs[0]['stages']['read'] == {'seconds': 0.75, 'calls': 2, 'rows': 150}
+    assert runs[0]['rows_per_sec'] == 75.0
+    assert (runs[1]['rows'], runs[1]['rows_per_sec']) == (0, None)
+    assert CondenseMetrics.from_dict(runs[0]).to_dict() == metrics.to_dict()
+
+    merged = CondenseMetrics(city='NYC').merge(metrics).merge(metrics)
+    assert merged.stages['read'] == [1.5, 4, 300]
+    assert (merged.rows, merged.bytes_read) == (300, 4000)
+
+
+def test_prometheus_text_format(tmp_path):
+    filename = str(tmp_path / 'metrics.prom')
+    metrics = sample_metrics()
+    metrics.labels['file'] = 'say "hi"'
+    write_prometheus([metrics], filename)
+    with open(filename, 'r') as f_in:
+        lines = f_in.read().splitlines()
+
+    samples = dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+    labels = 'city="NYC",file="say \\"hi\\""'
+    assert samples['bikeshare_condense_stage_seconds_total{%s,stage="read"}' % labels] == \
+        '0.75'
+    assert samples['bikeshare_condense_stage_calls_total{%s,stage="write"}' % labels] == '1'
+    assert samples['bikeshare_condense_rows_total{%s}' % labels] == '150'
+    assert samples['bikeshare_condense_bytes_read_total{%s}' % labels] == '2000'
+    assert samples['bikeshare_condense_rows_per_second{%s}' % labels] == '75.0'
+    # every family has its HELP and TYPE lines ahead of its samples
+    for name in {sample.split('{')[0] for sample in samples}:
+        kind = 'gauge' if name in ('bikeshare_condense_seconds',
+                                   'bikeshare_condense_rows_per_second') else 'counter'
+        type_line = lines.index('# TYPE {} {}'.format(name, kind))
+        assert lines[type_line - 1].startswith('# HELP {} '.format(name))
+
+
+def test_run_profiled(city, raw_file, tmp_path):
+    stats_file = str(tmp_path / 'condense.prof')
+    out_file = str(tmp_path / 'out.csv')
+    assert run_profiled(stats_file, sum, [1, 2, 3]) == 6
+    run_profiled(stats_file, condense_data, raw_file, out_file, city)
+    functions = {function for _, _, function in pstats.Stats(stats_file).stats}
+    assert 'condense_data' in functions
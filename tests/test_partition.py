@@ -0,0 +1,123 @@
+import csv
+import os
+
+import pytest
+
+from bikeshare import (TABLE_STATISTICS, aggregate_trips, condense_data,
+                       condense_partitioned, cube_file, drop_months, load_trip_table,
+                       manifest_aggregates, partition_files, partition_table,
+                       read_manifest, write_cube)
+
+
+def read_rows(filename):
+    with open(filename, 'r') as f_in:
+        return list(csv.reader(f_in))
+
+
+def assert_same_aggregates(aggregates, expected):
+    for name in TABLE_STATISTICS:
+        assert aggregates[name] == pytest.approx(expected[name])
+
+
+def test_partitions_hold_the_condensed_trips(city, raw_file, tmp_path):
+    expected = str(tmp_path / 'expected.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+    header, *rows = read_rows(expected)
+
+    out_dir = str(tmp_path / 'partitioned')
+    manifest = condense_partitioned(raw_file, out_dir, city)
+    city_dir = os.path.join(out_dir, city)
+    assert read_manifest(city_dir) == manifest
+    months = sorted({int(row[1]) for row in rows})
+    assert [entry['month'] for entry in manifest['partitions']] == months
+    for entry, filename in zip(manifest['partitions'], partition_files(city_dir)):
+        partition_header, *partition_rows = read_rows(filename)
+        assert partition_header == header
+        # the rows of the month, in input order
+        assert partition_rows == [row for row in rows if int(row[1]) == entry['month']]
+        assert entry['rows'] == len(partition_rows)
+
+    assert_same_aggregates(manifest_aggregates(city_dir), aggregate_trips(expected))
+    assert len(partition_table(city_dir)) == len(rows)
+
+
+def test_partitions_by_user_type(city, raw_file, tmp_path):
+    out_dir = str(tmp_path / 'partitioned')
+    manifest = condense_partitioned(raw_file, out_dir, city, by_user_type=True)
+    city_dir = os.path.join(out_dir, city)
+    assert {entry['user_type'] for entry in manifest['partitions']} <= {
+        'Subscriber', 'Customer'}
+
+    expected = str(tmp_path / 'expected.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+    table = load_trip_table(expected, use_cache=False)
+    customers = partition_table(city_dir, user_types=['Customer'])
+    assert len(customers) == int((table.user_type == 1).sum())
+    assert sorted(customers.duration) == sorted(table.duration[table.user_type == 1])
+    assert_same_aggregates(manifest_aggregates(city_dir), aggregate_trips(expected))
+
+
+def test_drop_months(city, raw_file, tmp_path):
+    out_dir = str(tmp_path / 'partitioned')
+    manifest = condense_partitioned(raw_file, out_dir, city)
+    city_dir = os.path.join(out_dir, city)
+    first, *kept = manifest['partitions']
+
+    assert drop_months(city_dir, [first['month']]) == first['rows']
+    assert [entry['month'] for entry in read_manifest(city_dir)['partitions']] == [
+        entry['month'] for entry in kept]
+    remaining = manifest_aggregates(city_dir)
+    assert sum(remaining['user_counts']) == 150 - first['rows']
+    months = [entry['month'] for entry in kept]
+    assert_same_aggregates(remaining, manifest_aggregates(city_dir, months=months))
+
+
+def test_manifest_aggregates_of_changed_partition(city, raw_file, tmp_path):
+    out_dir = str(tmp_path / 'partitioned')
+    manifest = condense_partitioned(raw_file, out_dir, city)
+    city_dir = os.path.join(out_dir, city)
+    entry = manifest['partitions'][-1]
+    filename = os.path.join(city_dir, entry['path'])
+
+    # the partition's file is edited after the manifest was written: its
+    # summaries are read from the file again
+    header, *rows = read_rows(filename)
+    with open(filename, 'w') as f_out:
+        csv.writer(f_out).writerows([header] + rows[:1])
+    aggregates = manifest_aggregates(city_dir, months=[entry['month']])
+    assert sum(aggregates['user_counts']) == 1
+
+
+def test_condense_again_removes_old_partitions(city, raw_file, tmp_path):
+    out_dir = str(tmp_path / 'partitioned')
+    manifest = condense_partitioned(raw_file, out_dir, city)
+    city_dir = os.path.join(out_dir, city)
+    last = manifest['partitions'][-1]
+
+    # the raw file without the trips of its last month, found from the
+    # condensed rows, which are in input order
+    expected = str(tmp_path / 'expected.csv')
+    condense_data(raw_file, expected, city, zone_map=False)
+    months = [int(row[1]) for row in read_rows(expected)[1:]]
+    with open(raw_file, 'rb') as f_in:
+        header, *lines = f_in.readlines()
+    month = last['month']
+    with open(raw_file, 'wb') as f_out:
+        f_out.writelines([header] + [line for line, line_month in zip(lines, months)
+                                     if line_month != month])
+    manifest = condense_partitioned(raw_file, out_dir, city)
+    assert month not in [entry['month'] for entry in manifest['partitions']]
+    assert not os.path.exists(os.path.join(city_dir, last['path']))
+
+
+def test_drop_months_removes_partition_sidecars(city, raw_file, tmp_path):
+    out_dir = str(tmp_path / 'partitioned')
+    manifest = condense_partitioned(raw_file, out_dir, city, binary_out=True)
+    city_dir = os.path.join(out_dir, city)
+    entry = manifest['partitions'][0]
+    filename = os.path.join(city_dir, entry['path'])
+    write_cube(filename)
+    assert os.path.exists(cube_file(filename))
+
+    drop_months(city_dir, [entry['month']])
+    assert not os.path.exists(os.path.dirname(filename))
@@ -0,0 +1,73 @@
+import csv
+
+import numpy as np
+import pytest
+
+from bikeshare import TripTable, block_stats, load_trip_table, query_trips
+from bikeshare.query import _candidate_blocks, _predicates
+
+
+def condensed_rows(filename):
+    with open(filename, 'r') as f_in:
+        for row in csv.DictReader(f_in):
+            yield (float(row['duration']), int(row['month']), int(row['hour']),
+                   row['day_of_week'],
+                   'Subscriber' if row['user_type'] == 'Subscriber' else 'Customer')
+
+
+def test_query_matches_rows(condensed_file):
+    expected = {}
+    for duration, month, hour, day_of_week, user_type in condensed_rows(condensed_file):
+        if user_type == 'Customer' and 6 <= hour <= 20:
+            expected.setdefault(day_of_week, []).append(duration)
+
+    # small blocks, so the scan crosses several of them
+    results = query_trips(condensed_file, where={'user_type': 'Customer', 'hour': (6, 20)},
+                          group_by=('day_of_week',), block_rows=16,
+                          aggregates=('count', 'sum', 'mean', 'min', 'max'))
+    assert set(results) == {(day,) for day in expected}
+    for (day,), values in results.items():
+        durations = expected[day]
+        assert values['count'] == len(durations)
+        assert values['sum'] == pytest.approx(sum(durations), rel=1e-6)
+        assert values['mean'] == pytest.approx(sum(durations) / len(durations), rel=1e-6)
+        assert values['min'] == pytest.approx(min(durations), rel=1e-6)
+        assert values['max'] == pytest.approx(max(durations), rel=1e-6)
+
+
+def test_query_without_filter_or_groups(condensed_file):
+    assert query_trips(condensed_file) == {(): {'count': 150}}
+    months = query_trips(condensed_file, where={'month': ['January', 'July']},
+                         group_by=('month',))
+    assert set(months) <= {(1,), (7,)}
+    assert sum(values['count'] for values in months.values()) == sum(
+        1 for row in condensed_rows(condensed_file) if row[1] in (1, 7))
+    assert query_trips(condensed_file, where={'month': []}) == {}
+
+
+def test_query_rejects_unknown_names(condensed_file):
+    for kwargs in ({'where': {'station': 1}}, {'where': {'day_of_week': 'Someday'}},
+                   {'group_by': ('duration',)}, {'aggregates': ('median',)}):
+        with pytest.raises(ValueError):
+            query_trips(condensed_file, **kwargs)
+
+
+def test_blocks_outside_the_filter_are_skipped(condensed_file):
+    # sorted by month, each block of 10 rows holds only a few months
+    table = load_trip_table(condensed_file, use_cache=False)
+    order = np.argsort(table.month, kind='stable')
+    table = TripTable(*[getattr(table, name)[order] for name in
+                        ('duration', 'month', 'hour', 'day_of_week', 'user_type')])
+    mins, maxs = block_stats(table, 10)['month']
+    assert len(mins) == 15
+
+    where = {'month': (3, 4)}
+    candidates = _candidate_blocks(block_stats(table, 10), _predicates(where), 15)
+    assert list(candidates) == list((maxs >= 3) & (mins <= 4))
+    assert 0 < candidates.sum() < 15
+
+    # the durations of skipped blocks are never read
+    table.duration[np.repeat(~candidates, 10)] = np.nan
+    results = query_trips(table, where=where, block_rows=10, aggregates=('count', 'sum'))
+    assert results[()]['count'] == int(np.isin(table.month, [3, 4]).sum())
+    assert not np.isnan(results[()]['sum'])
@@ -0,0 +1,83 @@
+import pickle
+
+from bikeshare import (AggregateStore, ReportRunner, aggregate_trips, approx_number_of_trips,
+                       avg_durationbytype, number_of_trips, trip_histograms)
+
+
+def test_results_keyed_by_aggregates_source(condensed_file, tmp_path):
+    cache_file = str(tmp_path / 'report_cache.json')
+    counts = number_of_trips(condensed_file)
+
+    def no_trips(filename):
+        return {'user_counts': (0, 0)}
+
+    report = ReportRunner(cache_file, aggregates=no_trips)
+    assert report.run(number_of_trips, condensed_file) == (0, 0, 0)
+    report.save()
+
+    # the same function on the same file, but with other aggregates
+    report = ReportRunner(cache_file, aggregates=aggregate_trips)
+    assert report.run(number_of_trips, condensed_file) == counts
+    assert (report.hits, report.misses) == (0, 1)
+    report.save()
+    report = ReportRunner(cache_file, aggregates=aggregate_trips)
+    assert report.run(number_of_trips, condensed_file) == counts
+    assert (report.hits, report.misses) == (1, 0)
+
+
+def test_store_aggregates_of_one_file(city, condensed_file, tmp_path):
+    # another file of the same city is in the store as well
+    other_file = str(tmp_path / '{}-2017-Summary.csv'.format(city))
+    with open(condensed_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    with open(other_file, 'wb') as f_out:
+        f_out.writelines(lines[:11])
+    store = AggregateStore(str(tmp_path / 'trip_aggregates.json'))
+    store.fold_file(other_file)
+
+    report = ReportRunner(aggregates=store)
+    assert report.run(number_of_trips, condensed_file) == number_of_trips(condensed_file)
+    assert report.run(number_of_trips, other_file) == (
+        number_of_trips(other_file, aggregate_trips(other_file)))
+    assert store.file_state(condensed_file)[1] == 150
+
+    # rows appended to the file are folded into the store before the lookup
+    with open(condensed_file, 'ab') as f_out:
+        f_out.writelines(lines[1:11])
+    subscribers, _, customers, _ = avg_durationbytype(condensed_file)
+    assert report.run(number_of_trips, condensed_file)[2] == 160
+    assert report.run(avg_durationbytype, condensed_file)[::2] == (subscribers, customers)
+    assert store.file_state(condensed_file)[1] == 160
+
+
+def test_cache_file_is_json(condensed_file, tmp_path):
+    cache_file = str(tmp_path / 'report_cache.json')
+    report = ReportRunner(cache_file)
+    expected = {function: report.run(function, condensed_file)
+                for function in (number_of_trips, avg_durationbytype, aggregate_trips,
+                                 trip_histograms)}
+    # namedtuples are not kept in the file, only for the run
+    report.run(approx_number_of_trips, condensed_file)
+    report.save()
+
+    report = ReportRunner(cache_file)
+    assert len(report) == len(expected)
+    for function, result in expected.items():
+        cached = report.run(function, condensed_file)
+        if function is trip_histograms:
+            assert {name: (values.dtype, values.tolist()) for name, values in cached.items()} \
+                == {name: (values.dtype, values.tolist()) for name, values in result.items()}
+        else:
+            assert cached == result
+            assert type(cached) is type(result)
+    assert (report.hits, report.misses) == (len(expected), 0)
+
+
+def test_other_cache_files_are_ignored(condensed_file, tmp_path):
+    cache_file = str(tmp_path / 'report_cache.json')
+    key = ('bikeshare.stats.number_of_trips', condensed_file, (0, 0), '[]', 'source')
+    with open(cache_file, 'wb') as f_out:
+        pickle.dump({key: (1, 2, 3)}, f_out)
+    report = ReportRunner(cache_file)
+    assert len(report) == 0
+    assert report.run(number_of_trips, condensed_file) == number_of_trips(condensed_file)
@@ -0,0 +1,70 @@
+import bisect
+import random
+
+import pytest
+
+from bikeshare import QuantileSketch
+
+N_VALUES = 50000
+
+# the rank error the QuantileSketch docstring promises at the default k
+RANK_ERROR = 0.017
+
+
+def durations(seed):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(2.5, 0.8) for _ in range(N_VALUES)]
+
+
+def rank_errors(sketch, values):
+    """
+    Returns the worst rank error, as a fraction of the count, of the sketch's
+    quantiles and threshold counts against the exact ones of values.
+    """
+    values = sorted(values)
+    n = len(values)
+    worst = 0.0
+    fractions = [i / 100.0 for i in range(1, 100)]
+    for fraction, answer in zip(fractions, sketch.quantiles(fractions)):
+        low = bisect.bisect_left(values, answer)
+        high = bisect.bisect_right(values, answer)
+        wanted = fraction * n
+        if not low <= wanted <= high:
+            worst = max(worst, min(abs(low - wanted), abs(high - wanted)) / n)
+    for threshold in values[::n // 100]:
+        exact = bisect.bisect_right(values, threshold)
+        worst = max(worst, abs(sketch.count_at_most(threshold) - exact) / n)
+    return worst
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_rank_error_bound(seed):
+    values = durations(seed)
+    sketch = QuantileSketch(seed=seed)
+    for value in values:
+        sketch.add(value)
+    assert sketch.count == N_VALUES
+    assert (sketch.min, sketch.max) == (min(values), max(values))
+    assert rank_errors(sketch, values) <= RANK_ERROR
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_rank_error_bound_after_merge(seed):
+    values = durations(seed)
+    sketches = [QuantileSketch(seed=seed * 10 + i) for i in range(4)]
+    for i, value in enumerate(values):
+        sketches[i % 4].add(value)
+    merged = QuantileSketch(seed=seed)
+    for sketch in sketches:
+        merged.merge(sketch)
+    assert merged.count == N_VALUES
+    assert rank_errors(merged, values) <= RANK_ERROR
+
+
+def test_to_dict_round_trip():
+    sketch = QuantileSketch(seed=1)
+    for value in durations(1)[:5000]:
+        sketch.add(value)
+    copy = QuantileSketch.from_dict(sketch.to_dict())
+    assert copy.quantiles([0.1, 0.5, 0.99]) == sketch.quantiles([0.1, 0.5, 0.99])
+    assert copy.count_at_most(30) == sketch.count_at_most(30)
@@ -0,0 +1,87 @@
+import csv
+import gzip
+import os
+
+import pytest
+
+from bikeshare import condense_data, sample_rows, sniff_schema
+
+
+# the raw duration column of each city
+CITY_DURATIONS = {'NYC': 'tripduration', 'Chicago': 'tripduration',
+                  'Washington': 'Duration (ms)'}
+
+
+def read_rows(filename, delimiter=','):
+    with open(filename, 'r', newline='') as f_in:
+        return list(csv.DictReader(f_in, delimiter=delimiter))
+
+
+def test_sniff_raw_feed(city, raw_file):
+    schema = sniff_schema(raw_file)
+    assert (schema.codec, schema.delimiter, schema.kind) == (None, ',', 'raw')
+    assert schema.city == city
+    assert schema.problems == []
+    with open(raw_file, 'r', newline='') as f_in:
+        assert schema.header == next(csv.reader(f_in))
+    assert schema.column_types[CITY_DURATIONS[city]] == 'int'
+    assert 'timestamp' in schema.column_types.values()
+
+
+def test_sniff_finds_city_from_contents(city, raw_file, tmp_path):
+    # no city in the file name, another delimiter, and compressed
+    renamed = str(tmp_path / 'feed.csv.gz')
+    rows = read_rows(raw_file)
+    with gzip.open(renamed, 'wt', newline='') as f_out:
+        writer = csv.DictWriter(f_out, list(rows[0]), delimiter=';')
+        writer.writeheader()
+        writer.writerows(rows)
+    schema = sniff_schema(renamed)
+    assert (schema.codec, schema.delimiter, schema.city) == ('gzip', ';', city)
+
+
+def test_sniff_condensed_files(city, raw_file, tmp_path):
+    plain = str(tmp_path / 'plain.csv')
+    encoded = str(tmp_path / 'encoded.csv')
+    condense_data(raw_file, plain, city, zone_map=False)
+    condense_data(raw_file, encoded, city, zone_map=False, encoded=True)
+    schema = sniff_schema(plain)
+    assert (schema.kind, schema.city, schema.dictionaries) == ('condensed', None, {})
+    assert schema.column_types['duration'] == 'float'
+    schema = sniff_schema(encoded)
+    assert schema.kind == 'encoded'
+    assert set(schema.dictionaries) == {'day_of_week', 'user_type'}
+
+
+def test_sniff_rejects_unknown_feeds(tmp_path):
+    other = str(tmp_path / 'other.csv')
+    with open(other, 'w') as f_out:
+        f_out.write('a,b\n1,2\n')
+    assert sniff_schema(other).problems == ['no registered city schema fits the header']
+    empty = str(tmp_path / 'empty.csv')
+    open(empty, 'w').close()
+    with pytest.raises(ValueError):
+        sniff_schema(empty)
+
+
+def test_sample_rows_from_across_the_file(city, raw_file):
+    rows = read_rows(raw_file)
+    # windows of about two rows each, at ten offsets
+    window_bytes = 2 * os.path.getsize(raw_file) // len(rows)
+    sample = sample_rows(raw_file, n_rows=5, probes=10, window_bytes=window_bytes, seed=1)
+    assert len(sample) == 5
+    assert all(row in rows for row in sample)
+    assert sample == sample_rows(raw_file, n_rows=5, probes=10, window_bytes=window_bytes,
+                                 seed=1)
+    assert max(rows.index(row) for row in sample) > len(rows) // 2
+
+
+def test_sample_rows_decodes_encoded_files(city, raw_file, tmp_path):
+    plain = str(tmp_path / 'plain.csv')
+    encoded = str(tmp_path / 'encoded.csv')
+    condense_data(raw_file, plain, city, zone_map=False)
+    condense_data(raw_file, encoded, city, zone_map=False, encoded=True)
+    rows = read_rows(plain)
+    sample = sample_rows(encoded, n_rows=20, seed=2)
+    assert len(sample) == 20
+    assert all(row in rows for row in sample)
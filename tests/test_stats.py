@@ -0,0 +1,38 @@
+import math
+import os
+
+from bikeshare import (aggregate_trips, avg_durationbytype, duration_of_trips,
+                       month_plotdata_by_type, number_of_trips, trip_cache_file, write_cube)
+
+
+def test_summaries_match_aggregate_trips(condensed_file):
+    aggregates = aggregate_trips(condensed_file)
+    for function in (number_of_trips, duration_of_trips, avg_durationbytype,
+                     month_plotdata_by_type):
+        assert function(condensed_file) == function(condensed_file, aggregates)
+
+    # a saved cube answers the counts; the durations still come from the csv
+    write_cube(condensed_file)
+    for function in (number_of_trips, duration_of_trips, avg_durationbytype):
+        assert function(condensed_file) == function(condensed_file, aggregates)
+
+
+def test_summaries_write_no_trip_cache(condensed_file):
+    number_of_trips(condensed_file)
+    avg_durationbytype(condensed_file)
+    assert not os.path.exists(trip_cache_file(condensed_file))
+
+
+def test_means_of_missing_user_type_are_nan(tmp_path):
+    filename = str(tmp_path / 'NYC-2016-Summary.csv')
+    with open(filename, 'w') as f_out:
+        f_out.write('duration,month,hour,day_of_week,user_type\n'
+                    '12.5,1,8,Monday,Subscriber\n')
+    n_subscribers, subscriber_mean, n_customers, customer_mean = \
+        avg_durationbytype(filename)
+    assert (n_subscribers, subscriber_mean, n_customers) == (1, 12.5, 0)
+    assert math.isnan(customer_mean)
+    empty = str(tmp_path / 'empty.csv')
+    with open(empty, 'w') as f_out:
+        f_out.write('duration,month,hour,day_of_week,user_type\n')
+    assert math.isnan(duration_of_trips(empty)[2])
@@ -0,0 +1,56 @@
+import pytest
+
+from bikeshare import AggregateStore, aggregate_trips, condense_data
+
+STORED_STATISTICS = ('user_counts', 'duration_split', 'duration_by_type',
+                     'month_by_type', 'hour_by_type')
+
+
+def assert_same_aggregates(stored, expected):
+    for name in STORED_STATISTICS:
+        if name == 'duration_split':
+            assert stored[name][:2] == expected[name][:2]
+            assert stored[name][2] == pytest.approx(expected[name][2])
+        elif name == 'duration_by_type':
+            assert stored[name] == pytest.approx(expected[name])
+        else:
+            assert stored[name] == expected[name]
+
+
+def test_fold_matches_aggregate_trips(city, condensed_file, tmp_path):
+    store = AggregateStore(str(tmp_path / 'store.json'))
+    assert store.fold_file(condensed_file, city) == 150
+    assert_same_aggregates(store.aggregates(city), aggregate_trips(condensed_file))
+
+    # saved and opened again, nothing is folded twice
+    store.save()
+    store = AggregateStore.load(str(tmp_path / 'store.json'))
+    assert store.fold_file(condensed_file, city) == 0
+    assert_same_aggregates(store.aggregates(city), aggregate_trips(condensed_file))
+
+
+def test_fold_appended_rows(city, condensed_file, tmp_path):
+    with open(condensed_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    with open(condensed_file, 'wb') as f_out:
+        f_out.writelines(lines[:100])
+    store = AggregateStore()
+    assert store.fold_file(condensed_file, city) == 99
+    with open(condensed_file, 'ab') as f_out:
+        f_out.writelines(lines[100:])
+    assert store.fold_file(condensed_file, city) == len(lines) - 100
+    assert_same_aggregates(store.aggregates(city), aggregate_trips(condensed_file))
+
+
+def test_fold_rebuilds_rewritten_file(city, raw_file, condensed_file, tmp_path):
+    store = AggregateStore()
+    store.fold_file(condensed_file, city)
+
+    # condensed again from fewer trips: the folded rows are not a prefix any more
+    with open(raw_file, 'rb') as f_in:
+        lines = f_in.readlines()
+    with open(raw_file, 'wb') as f_out:
+        f_out.writelines(lines[:1] + lines[50:])
+    condense_data(raw_file, condensed_file, city)
+    assert store.fold_file(condensed_file, city) == len(lines) - 50
+    assert_same_aggregates(store.aggregates(city), aggregate_trips(condensed_file))
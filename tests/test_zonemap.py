@@ -0,0 +1,32 @@
+import os
+
+from bikeshare import read_zone_map, scan_ranges, zone_map_file
+from bikeshare.zonemap import ZONE_MAP_BLOCK_ROWS
+
+
+def test_zone_map_of_condensed_file(condensed_file):
+    blocks = read_zone_map(condensed_file)
+    assert blocks is not None
+    assert sum(block['rows'] for block in blocks) == 150
+    assert len(blocks) == -(-150 // ZONE_MAP_BLOCK_ROWS)
+
+
+def test_zone_map_skips_blocks(condensed_file):
+    blocks = read_zone_map(condensed_file)
+    longest = blocks[0]['duration'][1]
+    assert scan_ranges(condensed_file, {'duration': (longest + 1, longest + 2)}) == []
+    assert scan_ranges(condensed_file, {'duration': (longest, longest + 1)}) == [
+        (blocks[0]['offset'], os.path.getsize(condensed_file))]
+
+
+def test_zone_map_invalidated_by_change(condensed_file):
+    with open(condensed_file, 'a') as f_out:
+        f_out.write('1.0,1,0,Monday,Subscriber\n')
+    assert os.path.exists(zone_map_file(condensed_file))
+    assert read_zone_map(condensed_file) is None
+
+    # without a current zone map every row is scanned
+    with open(condensed_file, 'rb') as f_in:
+        data_start = len(f_in.readline())
+    assert scan_ranges(condensed_file, {'month': 13}) == [
+        (data_start, os.path.getsize(condensed_file))]